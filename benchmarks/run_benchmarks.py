@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite of the thorlabs plugins
+
+Measures, against the simulated drivers of the ``simulated`` module:
+
+* for the viewers (CCSXXX, TLPMPowermeter, Kinesis_KPA101): the grab rate, the time spent in the driver
+  and the overhead of the plugin (data wrapping and emission)
+* for the actuators (DCServo cubes, BrushlessDCMotor, KIM101, KPZ101): the latency of the move command,
+  the delay between the end of the (simulated) motion and its detection by the PyMoDAQ polling logic
+  and the cost of a position read
+* the import time of the plugin packages
+
+Results are saved as a json file to be compared between releases::
+
+    python benchmarks/run_benchmarks.py --output benchmarks/results/my_version.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/previous_version.json
+
+PyMoDAQ and its dependencies should be installed, the vendor libraries are not required.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import simulated
+
+here = Path(__file__).absolute().parent
+
+POLLING_INTERVAL = 1e-3  # s, polling interval used to detect the end of the moves
+
+IMPORT_MODULES = [
+    'pymodaq_plugins_thorlabs.hardware.kinesis',
+    'pymodaq_plugins_thorlabs.hardware.powermeter',
+    'pymodaq_plugins_thorlabs.hardware.ccsxxx',
+    'pymodaq_plugins_thorlabs.daq_move_plugins',
+    'pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_0D',
+    'pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_1D',
+    'pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_2D',
+]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """ Statistics (in seconds) of a list of timings"""
+    samples = np.asarray(samples, dtype=float)
+    if samples.size == 0:
+        return dict(n=0)
+    return dict(n=int(samples.size),
+                mean=float(np.mean(samples)),
+                median=float(np.median(samples)),
+                p95=float(np.percentile(samples, 95)),
+                min=float(np.min(samples)),
+                max=float(np.max(samples)))
+
+
+def timeit(func: Callable, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def select_first_limits(parameter):
+    """ Select the first entry of the list parameters without value (as the GUI does)"""
+    for child in parameter.children():
+        if child.type() == 'list' and child.value() is None and child.opts.get('limits'):
+            child.setValue(child.opts['limits'][0])
+        select_first_limits(child)
+
+
+def init_plugin(plugin):
+    """ Call the ini_detector/ini_stage method of a plugin whatever its return signature"""
+    select_first_limits(plugin.settings)
+    ini = plugin.ini_detector if hasattr(plugin, 'ini_detector') else plugin.ini_stage
+    status = ini()
+    if isinstance(status, tuple):
+        initialized = status[1]
+    else:
+        initialized = status['initialized']
+    if not initialized:
+        raise RuntimeError(f'Could not initialize {plugin.__class__.__name__}: {status}')
+
+
+# ############################## Viewers ##############################
+def _ccs_setup(plugin):
+    plugin.controller.set_integration_time(1e-3)
+
+
+def _ccs_driver(plugin):
+    plugin.controller.start_scan()
+    plugin.controller.get_scan_data()
+
+
+def _ccs_raw_setup(plugin):
+    _ccs_setup(plugin)
+    plugin.settings.child('readout').setValue('raw')
+
+
+def _ccs_raw_driver(plugin):
+    plugin.controller.start_scan()
+    plugin.controller.get_raw_scan_data()
+
+
+VIEWERS = {
+    'CCSXXX': dict(module='pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_1D.daq_1Dviewer_CCSXXX',
+                   cls='DAQ_1DViewer_CCSXXX',
+                   setup=_ccs_setup,
+                   driver=_ccs_driver),
+    'CCSXXX_raw': dict(module='pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_1D.daq_1Dviewer_CCSXXX',
+                       cls='DAQ_1DViewer_CCSXXX',
+                       setup=_ccs_raw_setup,
+                       driver=_ccs_raw_driver),
+    'TLPMPowermeter': dict(
+        module='pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_0D.daq_0Dviewer_TLPMPowermeter',
+        cls='DAQ_0DViewer_TLPMPowermeter',
+        setup=None,
+        driver=lambda plugin: plugin.controller.get_power()),
+    'Kinesis_KPA101': dict(
+        module='pymodaq_plugins_thorlabs.daq_viewer_plugins.plugins_0D.daq_0Dviewer_Kinesis_KPA101',
+        cls='DAQ_0DViewer_Kinesis_KPA101',
+        setup=None,
+        driver=lambda plugin: plugin.controller.Status),
+}
+
+
+def bench_viewer(module: str, cls: str, setup: Callable, driver: Callable, repeat: int) -> dict:
+    plugin = getattr(importlib.import_module(module), cls)()
+    init_plugin(plugin)
+    if setup is not None:
+        setup(plugin)
+
+    emission_times = []
+    plugin.dte_signal.connect(lambda dte: emission_times.append(perf_counter()))
+
+    driver_timings = timeit(lambda: driver(plugin), repeat)
+
+    emission_times.clear()
+    start = perf_counter()
+    grab_timings = timeit(plugin.grab_data, repeat)
+    duration = perf_counter() - start
+    plugin.close()
+
+    grab = summarize(grab_timings)
+    driver_stats = summarize(driver_timings)
+    return dict(grab=grab,
+                driver=driver_stats,
+                emit_overhead=grab['median'] - driver_stats['median'],
+                grab_rate=len(emission_times) / duration,
+                emitted=len(emission_times))
+
+
+# ############################## Actuators ##############################
+def _kinesis_motion(plugin):
+    return plugin.controller._device._motion
+
+
+def _brushless_motion(plugin):
+    return plugin.controller._channels[plugin.axis_value]._device._motion
+
+
+def _elliptec_motion(plugin):
+    return plugin.controller._serial._motions[plugin.device.address]
+
+
+ACTUATORS = {
+    'DCServoKCube': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_DCServoKCube',
+                         cls='DAQ_Move_DCServoKCube', targets=(1., 2., 0.5), motion=_kinesis_motion),
+    'DCServoTCube': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_DCServoTCube',
+                         cls='DAQ_Move_DCServoTCube', targets=(1., 2., 0.5), motion=_kinesis_motion),
+    'BrushlessDCMotor': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_BrushlessDCMotor',
+                             cls='DAQ_Move_BrushlessDCMotor', targets=(1., 2., 0.5),
+                             motion=_brushless_motion),
+    'KIM101': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_KIM101',
+                   cls='DAQ_Move_KIM101', targets=(100., 200., 50.), motion=None),
+    'KPZ101': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_KPZ101',
+                   cls='DAQ_Move_KPZ101', targets=(10., 20., 5.), motion=None),
+    'Elliptec': dict(module='pymodaq_plugins_thorlabs.daq_move_plugins.daq_move_Elliptec',
+                     cls='DAQ_Move_Elliptec', targets=(90., 180., 45.), motion=_elliptec_motion),
+}
+
+
+def bench_actuator(module: str, cls: str, targets: tuple, motion: Callable, repeat: int,
+                   timeout: float = 10.) -> dict:
+    from pymodaq.control_modules.move_utility_classes import DataActuator
+
+    plugin = getattr(importlib.import_module(module), cls)()
+    init_plugin(plugin)
+
+    read_timings = timeit(plugin.get_actuator_value, repeat)
+
+    command_timings = []
+    detection_timings = []
+    for ind in range(repeat):
+        target = targets[ind % len(targets)]
+        start = perf_counter()
+        plugin.move_abs(DataActuator(data=target, units=plugin.axis_unit))
+        command_end = perf_counter()
+        command_timings.append(command_end - start)
+
+        while perf_counter() - start < timeout:
+            plugin.current_value = plugin.get_actuator_value()
+            if plugin._condition_to_reach_target():
+                break
+            sleep(POLLING_INTERVAL)
+        detected = perf_counter()
+        move_end = command_end if motion is None else max(command_end, motion(plugin).move_end_time)
+        detection_timings.append(detected - move_end)
+    plugin.close()
+
+    return dict(position_read=summarize(read_timings),
+                move_command=summarize(command_timings),
+                completion_detection=summarize(detection_timings))
+
+
+# ############################## Import ##############################
+IMPORT_SCRIPT = """
+import sys
+sys.path.insert(0, {bench_dir!r})
+import simulated
+simulated.install()
+import importlib
+from time import perf_counter
+import pymodaq.control_modules.move_utility_classes, pymodaq.control_modules.viewer_utility_classes
+start = perf_counter()
+importlib.import_module({module!r})
+print(perf_counter() - start)
+"""
+
+
+def bench_import(module: str, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(bench_dir=str(here),
+                                                                            module=module)],
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return summarize(timings)
+
+
+# ############################## Main ##############################
+def metadata() -> dict:
+    from pymodaq_plugins_thorlabs import __version__
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return dict(version=__version__,
+                commit=commit,
+                date=datetime.datetime.now().isoformat(timespec='seconds'),
+                python=platform.python_version(),
+                platform=platform.platform())
+
+
+def run(repeat: int, selection: List[str] = None) -> dict:
+    results = dict(viewers={}, actuators={}, imports={})
+    for name, bench in VIEWERS.items():
+        if selection is None or name in selection:
+            print(f'Benchmarking viewer {name}')
+            results['viewers'][name] = bench_viewer(repeat=repeat, **bench)
+    for name, bench in ACTUATORS.items():
+        if selection is None or name in selection:
+            print(f'Benchmarking actuator {name}')
+            results['actuators'][name] = bench_actuator(repeat=repeat, **bench)
+    if selection is None or 'imports' in selection:
+        for module in IMPORT_MODULES:
+            print(f'Benchmarking import of {module}')
+            results['imports'][module] = bench_import(module, repeat=max(1, repeat // 10))
+    return results
+
+
+def _flatten(results: dict, prefix: str = '') -> Dict[str, float]:
+    """ Get the median timings (and the rates) of a result dict as a flat dict"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}/{key}' if prefix else key
+        if isinstance(value, dict):
+            if 'median' in value:
+                flat[path] = value['median']
+            else:
+                flat.update(_flatten(value, path))
+        elif key in ('emit_overhead', 'grab_rate'):
+            flat[path] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> List[str]:
+    """ List the benchmarks whose timings got worse by more than tolerance compared with a baseline"""
+    regressions = []
+    current = _flatten(results)
+    previous = _flatten(baseline)
+    for key, value in current.items():
+        if key not in previous or previous[key] == 0:
+            continue
+        ratio = value / previous[key]
+        if key.endswith('grab_rate'):
+            ratio = 1 / ratio if ratio != 0 else float('inf')
+        if ratio > 1 + tolerance:
+            regressions.append(f'{key}: {previous[key]:.3g} -> {value:.3g}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the thorlabs plugins on simulated drivers')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='json file where to save the results (default: results/<version>.json)')
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='json file of previous results to compare with')
+    parser.add_argument('--repeat', type=int, default=50, help='number of grabs/moves per benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slow down above which a benchmark is reported as a regression')
+    parser.add_argument('--only', nargs='*', default=None,
+                        help=f'restrict to some benchmarks among: '
+                             f'{list(VIEWERS) + list(ACTUATORS) + ["imports"]}')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    simulated.install()
+    from qtpy import QtWidgets
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+
+    results = dict(metadata=metadata(), results=run(args.repeat, args.only))
+
+    output = args.output
+    if output is None:
+        output = here.joinpath('results', f'{results["metadata"]["version"]}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f'Results saved in {output}')
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results['results'], baseline['results'], args.tolerance)
+        if regressions:
+            print('Regressions compared with the baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('No regression compared with the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,673 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated vendor drivers used by the benchmark suite.
+
+The plugins of this package import Windows only vendor libraries at module level (the Kinesis .NET
+assemblies through pythonnet, the TLPM python wrapper and the TLCCS dll through ctypes). The
+``install`` function registers pure python replacements for these libraries so that the plugins and
+the hardware wrappers can be imported and exercised on any platform. The simulated devices mimic
+the timings of the real ones (motion at finite velocity, integration time of the spectrometer...)
+so that the overhead added by the wrappers and by PyMoDAQ can be measured on top of them.
+"""
+import ctypes
+import os
+import sys
+import threading
+import types
+from pathlib import Path
+from time import perf_counter, sleep
+from types import SimpleNamespace
+
+import numpy as np
+
+
+SERIAL_NUMBERS = {
+    'integrated_stepper': ['55000001'],
+    'flipper': ['37000001'],
+    'brushless': ['73000001'],
+    'piezo': ['29000001'],
+    'tcube_dcservo': ['83000001'],
+    'kcube_dcservo': ['27000001'],
+    'inertial_motor': ['97000001'],
+    'position_aligner': ['69000001'],
+}
+
+DEVICE_PREFIXES = {
+    'integrated_stepper': 55,
+    'flipper': 37,
+    'brushless': 73,
+    'piezo': 29,
+    'tcube_dcservo': 83,
+    'kcube_dcservo': 27,
+    'inertial_motor': 97,
+    'position_aligner': 69,
+}
+
+MOTOR_VELOCITY = 50.  # units/s, velocity of the simulated motors
+STEP_RATE = 2000.  # steps/s, velocity of the simulated inertial motors
+POLLING_LATENCY = 1e-4  # s, time taken by the simulated controllers to answer a status request
+CCS_PIXELS = 3648
+
+
+class Decimal(float):
+    """ Stand-in for System.Decimal"""
+
+    @staticmethod
+    def ToDouble(value) -> float:
+        return float(value)
+
+
+class _Action:
+    """ Stand-in for System.Action, Action[UInt64](callback) returns the callback"""
+
+    def __getitem__(self, item):
+        return lambda func: func
+
+
+def _buffer(arg, size: int, dtype) -> np.ndarray:
+    """ Get a numpy view over a ctypes argument (byref, pointer or array) passed to a simulated dll"""
+    if hasattr(arg, '_obj'):
+        arg = arg._obj
+    if isinstance(arg, ctypes._Pointer):
+        return np.ctypeslib.as_array(arg, shape=(size,))
+    if isinstance(arg, ctypes.c_void_p):
+        return np.ctypeslib.as_array(ctypes.cast(arg, ctypes.POINTER(np.ctypeslib.as_ctypes_type(dtype))),
+                                     shape=(size,))
+    return np.ctypeslib.as_array(arg)
+
+
+def _set_value(arg, value):
+    """ Set the value of a ctypes scalar passed by reference to a simulated dll"""
+    if hasattr(arg, '_obj'):
+        arg = arg._obj
+    if isinstance(arg, ctypes._Pointer):
+        arg = arg.contents
+    arg.value = value
+
+
+# ############################## Kinesis ##############################
+class SimMotion:
+    """ Linear motion at constant velocity, the callback is fired (from a timer thread) at the end
+    of the move, as the Kinesis library does"""
+
+    def __init__(self, velocity: float = MOTOR_VELOCITY, position: float = 0.):
+        self.velocity = velocity
+        self._start = position
+        self._target = position
+        self._t0 = 0.
+        self._t1 = 0.
+        self._timer: threading.Timer = None
+        self.move_end_time = 0.
+
+    @property
+    def position(self) -> float:
+        now = perf_counter()
+        if now >= self._t1 or self._t1 == self._t0:
+            return self._target
+        return self._start + (self._target - self._start) * (now - self._t0) / (self._t1 - self._t0)
+
+    @property
+    def target(self) -> float:
+        return self._target
+
+    @property
+    def in_motion(self) -> bool:
+        return perf_counter() < self._t1
+
+    def move_to(self, target: float, callback=None):
+        start = self.position
+        if self._timer is not None:
+            self._timer.cancel()
+        duration = abs(float(target) - start) / self.velocity
+        self._start = start
+        self._target = float(target)
+        self._t0 = perf_counter()
+        self._t1 = self._t0 + duration
+        self.move_end_time = self._t1
+        if callable(callback):
+            self._timer = threading.Timer(duration, callback, args=(0,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        position = self.position
+        self._start = self._target = position
+        self._t1 = self._t0 = perf_counter()
+
+
+class SimKinesisDevice:
+    """ Simulated generic Kinesis device (stepper, dc servo, brushless channel...)"""
+    units = 'mm'
+
+    def __init__(self, serial: str = '', name: str = 'Simulated Kinesis'):
+        self._serial = serial
+        self._name = name
+        self._motion = SimMotion()
+        self._backlash = 0.
+        self._homed = True
+        self._velocity_params = SimpleNamespace(MaxVelocity=Decimal(MOTOR_VELOCITY),
+                                                Acceleration=Decimal(10 * MOTOR_VELOCITY))
+        self._stage_axis_params = SimpleNamespace(MaxPosition=Decimal(100.), MinPosition=Decimal(0.),
+                                                  MaxAcceleration=Decimal(10 * MOTOR_VELOCITY),
+                                                  MaxDecceleration=Decimal(10 * MOTOR_VELOCITY),
+                                                  MaxVelocity=Decimal(MOTOR_VELOCITY))
+        self.AdvancedMotorLimits = SimpleNamespace(VelocityMaximum=Decimal(2 * MOTOR_VELOCITY),
+                                                   AccelerationMaximum=Decimal(20 * MOTOR_VELOCITY))
+        self.MotorDeviceSettings = SimpleNamespace()
+        self.DeviceID = serial
+
+    def Connect(self, serial):
+        self._serial = serial
+
+    def Disconnect(self, *args):
+        pass
+
+    def Dispose(self):
+        pass
+
+    def WaitForSettingsInitialized(self, timeout):
+        pass
+
+    def IsSettingsInitialized(self) -> bool:
+        return True
+
+    def StartPolling(self, rate):
+        pass
+
+    def StopPolling(self):
+        pass
+
+    def EnableDevice(self):
+        pass
+
+    def DisableDevice(self):
+        pass
+
+    def LoadMotorConfiguration(self, *args):
+        return SimpleNamespace()
+
+    def GetDeviceInfo(self):
+        return SimpleNamespace(Name=self._name, SerialNumber=self._serial)
+
+    def get_UnitConverter(self):
+        return SimpleNamespace(RealUnits=self.units)
+
+    def GetBacklash(self):
+        return Decimal(self._backlash)
+
+    def SetBacklash(self, backlash):
+        self._backlash = float(backlash)
+
+    def GetStageAxisParams(self):
+        return self._stage_axis_params
+
+    def GetVelocityParams(self):
+        return self._velocity_params
+
+    def SetVelocityParams(self, max_velocity, acceleration):
+        self._velocity_params = SimpleNamespace(MaxVelocity=Decimal(max_velocity),
+                                                Acceleration=Decimal(acceleration))
+        self._motion.velocity = float(max_velocity)
+
+    def MoveTo(self, position, callback=0):
+        self._motion.move_to(float(position), callback)
+
+    def MoveRelative(self, direction, step, callback=0):
+        self._motion.move_to(self._motion.target + float(step), callback)
+
+    def MoveContinuous(self, direction):
+        self._motion.move_to(self._motion.position + (1e9 if direction == 1 else -1e9))
+
+    def Home(self, callback=0):
+        self._motion.move_to(0., callback)
+
+    def Stop(self, *args):
+        self._motion.stop()
+
+    @property
+    def Status(self):
+        sleep(POLLING_LATENCY)
+        return SimpleNamespace(IsHomed=self._homed, IsInMotion=self._motion.in_motion, IsHoming=False)
+
+    @property
+    def Position(self):
+        return Decimal(self._motion.target)
+
+    @property
+    def DevicePosition(self):
+        return self.get_DevicePosition()
+
+    def get_DevicePosition(self):
+        sleep(POLLING_LATENCY)
+        return Decimal(self._motion.position)
+
+    @property
+    def ContinuousRotationPosition(self):
+        sleep(POLLING_LATENCY)
+        return Decimal(self._motion.position % 360)
+
+
+class SimBrushlessController(SimKinesisDevice):
+    def __init__(self, serial: str = ''):
+        super().__init__(serial, 'Simulated BBD')
+        self._channels = {}
+
+    def GetChannel(self, index: int) -> SimKinesisDevice:
+        if index not in self._channels:
+            self._channels[index] = SimKinesisDevice(f'{self._serial}-{index}', f'Channel {index}')
+        return self._channels[index]
+
+
+class SimPiezo(SimKinesisDevice):
+    units = 'V'
+
+    def __init__(self, serial: str = ''):
+        super().__init__(serial, 'Simulated KPZ101')
+        self._voltage = 0.
+
+    def GetPiezoConfiguration(self, serial):
+        return SimpleNamespace()
+
+    def SetOutputVoltage(self, voltage):
+        sleep(POLLING_LATENCY)
+        self._voltage = float(voltage)
+
+    def GetOutputVoltage(self):
+        sleep(POLLING_LATENCY)
+        return Decimal(self._voltage)
+
+
+class SimInertialMotor(SimKinesisDevice):
+    units = ' '
+
+    def __init__(self, serial: str = ''):
+        super().__init__(serial, 'Simulated KIM101')
+        self._motions = {ind: SimMotion(velocity=STEP_RATE) for ind in range(1, 5)}
+
+    def MoveTo(self, channel, position, timeout_or_callback=0):
+        """ Blocking with a timeout (ms), non blocking with a callback as the Kinesis overloads"""
+        motion = self._motions[channel]
+        if callable(timeout_or_callback):
+            motion.move_to(int(position), timeout_or_callback)
+        else:
+            motion.move_to(int(position))
+            sleep(max(motion.move_end_time - perf_counter(), 0.))
+
+    def GetPosition(self, channel) -> int:
+        sleep(POLLING_LATENCY)
+        return int(round(self._motions[channel].position))
+
+    def Stop(self, channel):
+        self._motions[channel].stop()
+
+
+class SimFlipper(SimKinesisDevice):
+    transit_time = 0.5
+
+    def __init__(self, serial: str = ''):
+        super().__init__(serial, 'Simulated MFF101')
+        self._motion = SimMotion(velocity=1 / self.transit_time, position=1.)
+
+    def SetPosition(self, position, callback=0):
+        self._motion.move_to(float(position), callback)
+
+    @property
+    def Position(self):
+        sleep(POLLING_LATENCY)
+        return 2 if self._motion.position > 1.5 else 1
+
+
+class SimPositionAligner(SimKinesisDevice):
+    def __init__(self, serial: str = ''):
+        super().__init__(serial, 'Simulated KPA101')
+        self._rng = np.random.default_rng()
+
+    @property
+    def Status(self):
+        sleep(POLLING_LATENCY)
+        x, y, s = self._rng.normal(size=3)
+        return SimpleNamespace(PositionDifference=SimpleNamespace(X=x, Y=y), Sum=s)
+
+
+def _device_class(prefix_key: str, factory_name: str, factory, **attributes):
+    return type(prefix_key, (), dict(DevicePrefix=DEVICE_PREFIXES[prefix_key],
+                                     **{factory_name: staticmethod(factory)}, **attributes))
+
+
+def _kinesis_modules() -> dict:
+    device_manager = types.ModuleType('Thorlabs.MotionControl.DeviceManagerCLI')
+    device_manager.DeviceManagerCLI = SimpleNamespace(
+        BuildDeviceList=lambda: None,
+        GetDeviceList=lambda prefix: [serial for key, serials in SERIAL_NUMBERS.items()
+                                      for serial in serials if DEVICE_PREFIXES[key] == prefix])
+
+    integrated = types.ModuleType('Thorlabs.MotionControl.IntegratedStepperMotorsCLI')
+    integrated.CageRotator = _device_class('integrated_stepper', 'CreateCageRotator',
+                                           lambda serial: SimKinesisDevice(serial, 'Simulated K10CR1'))
+
+    generic = types.ModuleType('Thorlabs.MotionControl.GenericMotorCLI')
+    generic.MotorDirection = SimpleNamespace(Forward=1, Backward=2)
+
+    flipper = types.ModuleType('Thorlabs.MotionControl.FilterFlipperCLI')
+    flipper.FilterFlipper = _device_class('flipper', 'CreateFilterFlipper', SimFlipper)
+
+    brushless = types.ModuleType('Thorlabs.MotionControl.Benchtop.BrushlessMotorCLI')
+    brushless.BenchtopBrushlessMotor = _device_class('brushless', 'CreateBenchtopBrushlessMotor',
+                                                     SimBrushlessController)
+    brushless.BrushlessMotorChannel = SimKinesisDevice
+
+    piezo = types.ModuleType('Thorlabs.MotionControl.KCube.PiezoCLI')
+    piezo.KCubePiezo = _device_class('piezo', 'CreateKCubePiezo', SimPiezo)
+
+    inertial = types.ModuleType('Thorlabs.MotionControl.KCube.InertialMotorCLI')
+    inertial.KCubeInertialMotor = _device_class('inertial_motor', 'CreateKCubeInertialMotor',
+                                                SimInertialMotor,
+                                                DevicePrefix_KIM101=DEVICE_PREFIXES['inertial_motor'])
+    inertial.InertialMotorStatus = SimpleNamespace(
+        MotorChannels=SimpleNamespace(Channel1=1, Channel2=2, Channel3=3, Channel4=4))
+
+    tcube = types.ModuleType('Thorlabs.MotionControl.TCube.DCServoCLI')
+    tcube.TCubeDCServo = _device_class('tcube_dcservo', 'CreateTCubeDCServo',
+                                       lambda serial: SimKinesisDevice(serial, 'Simulated TDC001'))
+
+    kcube = types.ModuleType('Thorlabs.MotionControl.KCube.DCServoCLI')
+    kcube.KCubeDCServo = _device_class('kcube_dcservo', 'CreateKCubeDCServo',
+                                       lambda serial: SimKinesisDevice(serial, 'Simulated KDC101'))
+
+    aligner = types.ModuleType('Thorlabs.MotionControl.KCube.PositionAlignerCLI')
+    aligner.KCubePositionAligner = _device_class('position_aligner', 'CreateKCubePositionAligner',
+                                                 SimPositionAligner)
+
+    modules = {module.__name__: module for module in
+               (device_manager, integrated, generic, flipper, brushless, piezo, inertial, tcube, kcube,
+                aligner)}
+    for name in list(modules):
+        parts = name.split('.')
+        for ind in range(1, len(parts)):
+            parent_name = '.'.join(parts[:ind])
+            if parent_name not in modules:
+                modules[parent_name] = types.ModuleType(parent_name)
+                modules[parent_name].__path__ = []
+    for name, module in modules.items():
+        if '.' in name:
+            parent_name, child = name.rsplit('.', 1)
+            setattr(modules[parent_name], child, module)
+    return modules
+
+
+def _system_modules() -> dict:
+    clr = types.ModuleType('clr')
+    clr.AddReference = lambda name: None
+
+    system = types.ModuleType('System')
+    system.Decimal = Decimal
+    system.Action = _Action()
+    system.UInt64 = int
+    system.UInt32 = int
+    return {'clr': clr, 'System': system}
+
+
+# ############################## TLPM ##############################
+class SimTLPMDll:
+    """ Simulated TLPM_64.dll, functions return a status code (negative on error)"""
+    measurement_time = 2e-3  # s
+    failing = False  # set to True to simulate a dying powermeter head
+
+    def __init__(self):
+        self._wavelength = 532.
+        self._rng = np.random.default_rng()
+
+    def TLPM_measPower(self, session, power):
+        sleep(self.measurement_time)
+        if self.failing:
+            return -1074001669
+        _set_value(power, 1e-3 * (1 + 0.01 * self._rng.normal()))
+        return 0
+
+    def TLPM_getWavelength(self, session, attribute, wavelength):
+        attribute = getattr(attribute, 'value', attribute)
+        _set_value(wavelength, {0: self._wavelength, 1: 400., 2: 1100.}.get(attribute, self._wavelength))
+        return 0
+
+    def TLPM_setWavelength(self, session, wavelength):
+        self._wavelength = float(wavelength.value)
+        return 0
+
+    def TLPM_getCalibrationMsg(self, session, message):
+        message.value = b'simulated'
+        return 0
+
+    def TLPM_errorMessage(self, session, status, message):
+        message.value = b'Simulated error'
+        return 0
+
+
+class SimTLPM:
+    """ Simulated TLPM.TLPM class of the Thorlabs python wrapper"""
+
+    def __init__(self, *args, **kwargs):
+        self.dll = SimTLPMDll()
+        self.devSession = ctypes.c_long(0)
+
+    def _check(self, status: int):
+        if status < 0:
+            raise NameError(f'Simulated error {status}')
+
+    def findRsrc(self, count):
+        _set_value(count, 1)
+
+    def getRsrcName(self, index, name):
+        name.value = b'USB0::0x1313::0x8078::P0000001::INSTR'
+
+    def getRsrcInfo(self, index, model, serial, manufacturer, is_available):
+        model.value = b'PM100D'
+        serial.value = b'P0000001'
+        manufacturer.value = b'Thorlabs'
+        _set_value(is_available, 1)
+
+    def open(self, resource, id_query, reset):
+        self.devSession.value = 1
+        return 0
+
+    def close(self):
+        self.devSession.value = 0
+        return 0
+
+    def getCalibrationMsg(self, message):
+        self._check(self.dll.TLPM_getCalibrationMsg(self.devSession, message))
+
+    def measPower(self, power):
+        self._check(self.dll.TLPM_measPower(self.devSession, power))
+
+    def getWavelength(self, attribute, wavelength):
+        self._check(self.dll.TLPM_getWavelength(self.devSession, attribute, wavelength))
+
+    def setWavelength(self, wavelength):
+        self._check(self.dll.TLPM_setWavelength(self.devSession, wavelength))
+
+
+def _tlpm_module() -> types.ModuleType:
+    tlpm = types.ModuleType('TLPM')
+    tlpm.TLPM = SimTLPM
+    tlpm.TLPM_ATTR_SET_VAL = 0
+    tlpm.TLPM_ATTR_MIN_VAL = 1
+    tlpm.TLPM_ATTR_MAX_VAL = 2
+    return tlpm
+
+
+# ############################## TLCCS ##############################
+class SimTLCCSLibrary:
+    """ Simulated TLCCS_64.dll, functions take the same ctypes arguments as the real ones"""
+
+    def __init__(self):
+        self._integration_time = 10e-3
+        self._scan_start = 0.
+        self._rng = np.random.default_rng()
+        self._wavelengths = np.linspace(500., 1000., CCS_PIXELS)
+        self._spectrum = np.exp(-((self._wavelengths - 750.) / 20.) ** 2)
+
+    def tlccs_init(self, resource, id_query, reset, handle):
+        _set_value(handle, 1)
+        return 0
+
+    def tlccs_close(self, handle):
+        return 0
+
+    def tlccs_setIntegrationTime(self, handle, integration_time):
+        self._integration_time = float(integration_time.value)
+        return 0
+
+    def tlccs_startScan(self, handle):
+        self._scan_start = perf_counter()
+        return 0
+
+    def tlccs_identificationQuery(self, handle, manufacturer, device_name, serial_number, firmware, driver):
+        for field, value in zip((manufacturer, device_name, serial_number, firmware, driver),
+                                (b'Thorlabs', b'CCS175', b'M00000001', b'2.0.0', b'2.0.0')):
+            field.value = value
+        return 0
+
+    def tlccs_getWavelengthData(self, handle, data_set, wavelengths, *args):
+        _buffer(wavelengths, CCS_PIXELS, np.float64)[:] = self._wavelengths
+        return 0
+
+    def tlccs_getUserCalibrationPoints(self, handle, pixels, wavelengths, length):
+        return -1  # no user calibration
+
+    def _wait_for_scan(self):
+        remaining = self._scan_start + self._integration_time - perf_counter()
+        if remaining > 0:
+            sleep(remaining)
+
+    def tlccs_getScanData(self, handle, data):
+        self._wait_for_scan()
+        _buffer(data, CCS_PIXELS, np.float64)[:] = (self._spectrum +
+                                                     0.01 * self._rng.standard_normal(CCS_PIXELS))
+        return 0
+
+    def tlccs_getRawScanData(self, handle, data):
+        self._wait_for_scan()
+        counts = (self._spectrum + 0.01 * self._rng.standard_normal(CCS_PIXELS)) * 0xFFFF
+        _buffer(data, CCS_PIXELS, np.int32)[:] = np.clip(counts, 0, 0xFFFF)
+        return 0
+
+    def tlccs_getAmplitudeData(self, handle, factors, start, length, mode):
+        _buffer(factors, CCS_PIXELS, np.float64)[start:start + length] = 1.
+        return 0
+
+
+SIMULATED_LIBRARIES = {'TLCCS_64.dll': SimTLCCSLibrary}
+
+
+# ############################## Elliptec ##############################
+ELLIPTEC_PORTS = {'SIM_ELL0': '012'}  # simulated serial ports and the addresses of the devices on them
+ELLIPTEC_PULSES = 262144  # pulses per revolution of the simulated ELL14 rotation mounts
+ELLIPTEC_VELOCITY = 360.  # °/s
+
+
+class SimElliptecPort:
+    """ Simulated serial port with ELL14 rotation mounts answering at some addresses (pyserial interface)"""
+
+    def __init__(self, port: str, *args, timeout: float = None, **kwargs):
+        self.port = port
+        self.timeout = timeout
+        self._motions = {address: SimMotion(velocity=ELLIPTEC_VELOCITY) for address in ELLIPTEC_PORTS[port]}
+        self._output = bytearray()
+        self._condition = threading.Condition()
+        self.is_open = True
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._output)
+
+    def _reply(self, message: str):
+        with self._condition:
+            self._output += f'{message}\r\n'.encode('ascii')
+            self._condition.notify_all()
+
+    def _position(self, address: str) -> str:
+        pulses = int(round(self._motions[address].position * ELLIPTEC_PULSES / 360))
+        return f'{address}PO{pulses & 0xFFFFFFFF:08X}'
+
+    def write(self, data: bytes) -> int:
+        message = data.decode('ascii')
+        address, instruction, value = message[0], message[1:3], message[3:]
+        if address not in self._motions:
+            return len(data)
+        motion = self._motions[address]
+        if instruction == 'in':
+            self._reply(f'{address}IN0E11400517202307010168{ELLIPTEC_PULSES:08X}')
+        elif instruction == 'gs':
+            self._reply(f'{address}GS{9 if motion.in_motion else 0:02X}')
+        elif instruction == 'gp':
+            self._reply(self._position(address))
+        elif instruction in ('ma', 'mr', 'ho'):
+            pulses = int(value, 16) if instruction != 'ho' else 0
+            pulses = pulses - (1 << 32) if pulses & 0x80000000 else pulses
+            target = pulses * 360 / ELLIPTEC_PULSES + (motion.position if instruction == 'mr' else 0.)
+            motion.move_to(target, lambda *args: self._reply(self._position(address)))
+        elif instruction == 'st':
+            motion.stop()
+            self._reply(f'{address}GS00')
+        else:
+            self._reply(f'{address}GS03')
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        with self._condition:
+            if not self._output:
+                self._condition.wait(self.timeout)
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def close(self):
+        self.is_open = False
+        for motion in self._motions.values():
+            motion.stop()
+
+
+def install():
+    """ Register the simulated vendor libraries so that the plugins can be imported
+
+    Must be called before any import of the plugins or of the hardware wrappers
+    """
+    sys.modules.update(_system_modules())
+    sys.modules.update(_kinesis_modules())
+    sys.modules['TLPM'] = _tlpm_module()
+
+    import serial
+    serial_class = serial.Serial
+
+    def _serial(port=None, *args, **kwargs):
+        if port in ELLIPTEC_PORTS:
+            return SimElliptecPort(port, *args, **kwargs)
+        return serial_class(port, *args, **kwargs)
+    serial.Serial = _serial
+
+    from serial.tools import list_ports
+    comports = list_ports.comports
+    list_ports.comports = lambda *args, **kwargs: ([SimpleNamespace(device=port) for port in ELLIPTEC_PORTS] +
+                                                   list(comports(*args, **kwargs)))
+
+    os.environ.setdefault('VXIPNPPATH', str(Path.home()))
+    os.environ.setdefault('VXIPNPPATH64', str(Path.home()))
+    if not hasattr(os, 'add_dll_directory'):
+        os.add_dll_directory = lambda path: None
+
+    load_library = ctypes.cdll.LoadLibrary
+
+    def _load_library(name, *args, **kwargs):
+        if name in SIMULATED_LIBRARIES:
+            return SIMULATED_LIBRARIES[name]()
+        return load_library(name, *args, **kwargs)
+    ctypes.cdll.LoadLibrary = _load_library
+
+    chdir = os.chdir
+
+    def _chdir(path):
+        if Path(path).is_dir():
+            chdir(path)
+    os.chdir = _chdir
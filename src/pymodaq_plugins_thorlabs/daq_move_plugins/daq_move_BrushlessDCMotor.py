@@ -6,11 +6,12 @@ from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
 from pymodaq_plugins_thorlabs.hardware.kinesis import BrushlessDCMotor, serialnumbers_brushless
+from pymodaq_plugins_thorlabs.hardware.flyscan import FlyScanPlugin, fly_scan_params
 
 logger = set_logger(get_module_name(__file__))
 
 
-class DAQ_Move_BrushlessDCMotor(DAQ_Move_base):
+class DAQ_Move_BrushlessDCMotor(FlyScanPlugin, DAQ_Move_base):
     """ Instrument plugin class for an actuator.
 
     This object inherits all functionalities to communicate with PyMoDAQ’s DAQ_Move module through inheritance via
@@ -32,7 +33,7 @@ class DAQ_Move_BrushlessDCMotor(DAQ_Move_base):
                  {'title': 'Serial Number:', 'name': 'serial_number', 'type': 'list',
                   'limits': serialnumbers_brushless, 'value': serialnumbers_brushless[0]}
 
-             ] + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
+             ] + fly_scan_params + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
 
     def ini_attributes(self):
         self.controller: BrushlessDCMotor = None
@@ -84,8 +85,11 @@ class DAQ_Move_BrushlessDCMotor(DAQ_Move_base):
         """
         if param.name() == 'axis':
             self.axis_unit = self.controller.get_units(self.axis_value)
+            self.fly_scan_motor = self.controller.get_channel(self.axis_value)
             # update the units are they are not known before hand in the driver class but only
             # after initialization of the controller
+        else:
+            self.commit_fly_scan_settings(param)
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -110,6 +114,7 @@ class DAQ_Move_BrushlessDCMotor(DAQ_Move_base):
 
         # update the axis unit by interogating the controller and the specific axis
         self.axis_unit = self.controller.get_units(self.axis_value)
+        self.fly_scan_motor = self.controller.get_channel(self.axis_value)
 
         if not self.controller.is_homed(self.axis_value):
             self.move_home()
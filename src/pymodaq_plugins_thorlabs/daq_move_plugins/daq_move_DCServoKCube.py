@@ -6,6 +6,7 @@ from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
 from pymodaq_plugins_thorlabs.hardware.daq_move_servocube_abstract import DAQ_Move_DCServoCube_Abstract
+from pymodaq_plugins_thorlabs.hardware.flyscan import fly_scan_params
 from pymodaq_plugins_thorlabs.hardware.kinesis import DCServoKCube, serialnumbers_kcube_dcservo
 
 
@@ -39,7 +40,7 @@ class DAQ_Move_DCServoKCube(DAQ_Move_DCServoCube_Abstract):
                  {'title': 'Serial Number:', 'name': 'serial_number', 'type': 'list',
                   'limits': serialnumbers_kcube_dcservo, 'value': serialnumbers_kcube_dcservo[0]}
 
-             ] + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
+             ] + fly_scan_params + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
 
 
 if __name__ == '__main__':
@@ -5,15 +5,14 @@ Created the 15/06/2023
 @author: Sebastien Weber
 """
 
-from pymodaq.control_modules.move_utility_classes import DAQ_Move_base, comon_parameters_fun, main  # common set of parameters for all actuators
+from pymodaq.control_modules.move_utility_classes import DAQ_Move_base, comon_parameters_fun, main, DataActuator, \
+    DataActuatorType  # common set of parameters for all actuators
 from pymodaq_utils.logger import set_logger, get_module_name
 from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
-from elliptec import Controller, Rotator
-from elliptec.scan import find_ports, scan_for_devices
-
-com_ports = find_ports()
+from pymodaq_plugins_thorlabs.hardware.elliptec_bus import ADDRESSES, ElliptecBus, ElliptecDevice, open_bus
+from pymodaq_plugins_thorlabs.hardware.elliptec_discovery import discovery
 
 
 class DAQ_Move_Elliptec(DAQ_Move_base):
@@ -22,26 +21,40 @@ class DAQ_Move_Elliptec(DAQ_Move_base):
     This object inherits all functionality to communicate with PyMoDAQ Module through inheritance via DAQ_Move_base
     It then implements the particular communication with the instrument
 
+    The axes are the addresses of the devices on the serial bus: all the plugins using a COM port share the same
+    ElliptecBus (see pymodaq_plugins_thorlabs.hardware.elliptec_bus), commands to different addresses being
+    pipelined. Moves return immediately, the position reported by the device at the end of the motion being
+    cached by the bus reader thread: get_actuator_value does not poll the device over the serial port.
+
+    The COM ports are neither listed nor opened at import, only the ones remembered as hosting Elliptec devices
+    being offered (see pymodaq_plugins_thorlabs.hardware.elliptec_discovery). The Rescan button probes all the
+    ports, as does the initialization if no port is selected.
+
     Attributes:
     -----------
-    controller: object
-        The particular object that allow the communication with the hardware, in general a python wrapper around the
-         hardware library
-
+    controller: ElliptecBus
+        The serial bus shared by all the devices on the COM port
+    device: ElliptecDevice
+        The device at the address of the selected axis
     """
     _controller_units = '°'
     is_multiaxes = True
-    axes_names = ['0']
+    axes_names = list(ADDRESSES)
     _epsilon = 0.1
+    data_actuator_type = DataActuatorType.DataActuator
 
-    params = [ {'title': 'COM port', 'name': 'com_port', 'type': 'list', 'limits': com_ports},
+    params = [ {'title': 'COM port', 'name': 'com_port', 'type': 'list', 'limits': discovery.serial_ports()},
+               {'title': 'Rescan ports', 'name': 'rescan', 'type': 'bool_push', 'value': False, 'label': 'Rescan',
+                'tip': 'Probe all the serial ports for Elliptec devices'},
+               {'title': 'Devices', 'name': 'devices', 'type': 'str', 'value': '', 'readonly': True},
                {'title': 'Serial No.', 'name': 'serial', 'type': 'str'},
                {'title': 'Motor Type', 'name': 'motor', 'type': 'str'},
                {'title': 'Range', 'name': 'range', 'type': 'str'},
                ] + comon_parameters_fun(is_multiaxes, axes_names, epsilon=_epsilon)
 
     def ini_attributes(self):
-        self.controller: Rotator = None
+        self.controller: ElliptecBus = None
+        self.device: ElliptecDevice = None
 
     def get_actuator_value(self):
         """Get the current value from the hardware with scaling conversion.
@@ -50,13 +63,19 @@ class DAQ_Move_Elliptec(DAQ_Move_base):
         -------
         float: The position obtained after scaling conversion.
         """
-        pos = self.controller.get_angle()
+        error = self.device.pop_error()
+        if error is not None:
+            self.emit_status(ThreadCommand('Update_Status', [error, 'log']))
+            self.device.get_position()
+        pos = DataActuator(data=self.device.position, units=self.axis_unit)  # last position reported by the device
         pos = self.get_position_with_scaling(pos)
         return pos
 
     def close(self):
         """Terminate the communication protocol"""
-        self.controller.close()
+        self.device.close()
+        if self.is_master:
+            self.controller.release()
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -66,11 +85,21 @@ class DAQ_Move_Elliptec(DAQ_Move_base):
         param: Parameter
             A given parameter (within detector_settings) whose value has been changed by the user
         """
-        ## TODO for your custom plugin
-        if param.name() == "a_parameter_you've_added_in_self.params":
-           self.controller.your_method_to_apply_this_param_change()
-        else:
-            pass
+        if param.name() == 'rescan':
+            if param.value():
+                param.setValue(False)
+                self.rescan()
+
+    def rescan(self):
+        """Probe all the serial ports and list the ones hosting Elliptec devices first"""
+        found = discovery.discover(rescan=True)
+        self.settings.child('com_port').setLimits(discovery.serial_ports(refresh=True))
+        if found and not self.settings['com_port']:
+            self.settings.child('com_port').setValue(next(iter(found)))
+        self.settings.child('devices').setValue(
+            '; '.join(f"{port}: {', '.join(devices)}" for port, devices in found.items()))
+        self.emit_status(ThreadCommand('Update_Status',
+                                       [f'Elliptec devices found on: {", ".join(found) or "no port"}', 'log']))
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -86,43 +115,41 @@ class DAQ_Move_Elliptec(DAQ_Move_base):
         initialized: bool
             False if initialization failed otherwise True
         """
-        serial = Controller(self.settings['com_port'])
-        self.controller = self.ini_stage_init(old_controller=controller,
-                                              new_controller=Rotator(serial))
-        all_info = self.controller.get('info')
+        if self.is_master:
+            if not self.settings['com_port']:
+                self.rescan()
+                if not self.settings['com_port']:
+                    return 'No Elliptec device found', False
+            self.controller = open_bus(self.settings['com_port'])
+        else:
+            self.controller = controller
+        self.device = ElliptecDevice(self.controller, self.axis_name)
+        self.device.get_position()
+        discovery.remember(self.controller.port, self.device.address, self.device.info)
+        self.axis_unit = self.device.units
+        all_info = self.device.info
         self.settings.child('serial').setValue(all_info['Serial No.'])
         self.settings.child('motor').setValue(all_info['Motor Type'])
         self.settings.child('range').setValue(all_info['Range'])
-        """
-        info = {'Address': addr,
-                'Motor Type': int(msg[3:5], 16),
-                'Serial No.': msg[5:13],
-                'Year': msg[13:17],
-                'Firmware': msg[17:19],
-                'Thread': is_metric(msg[19]),
-                'Hardware': msg[20],
-                'Range': (int(msg[21:25], 16)),
-                'Pulse/Rev': (int(msg[25:], 16))}
-        """
         info = str(all_info)
         initialized = True
         return info, initialized
 
-    def move_abs(self, value):
+    def move_abs(self, value: DataActuator):
         """ Move the actuator to the absolute target defined by value
 
         Parameters
         ----------
-        value: (float) value of the absolute target positioning
+        value: (DataActuator) value of the absolute target positioning
         """
 
         value = self.check_bound(value)  #if user checked bounds, the defined bounds are applied here
         self.target_value = value
         value = self.set_position_with_scaling(value)  # apply scaling if the user specified one
 
-        self.controller.set_angle(value)  # when writing your own plugin replace this line
+        self.device.move_abs_async(value.value())
 
-    def move_rel(self, value):
+    def move_rel(self, value: DataActuator):
         """ Move the actuator to the relative target actuator value defined by value
 
         Parameters
@@ -133,16 +160,22 @@ class DAQ_Move_Elliptec(DAQ_Move_base):
         self.target_value = value + self.current_position
         value = self.set_position_relative_with_scaling(value)
 
-        self.controller.shift_angle(value)  # when writing your own plugin replace this line
+        self.device.move_rel_async(value.value())
 
     def move_home(self):
         """Call the reference method of the controller"""
-        self.controller.home()  # when writing your own plugin replace this line
-        self.emit_status(ThreadCommand('Update_Status', ['Some info you want to log']))
+        self.device.home_async()
 
     def stop_motion(self):
         """Stop the actuator and emits move_done signal"""
-        pass
+        try:
+            if self.device.can_stop:
+                self.device.stop()
+            else:
+                self.emit_status(ThreadCommand('Update_Status', ['This Elliptec device cannot be stopped', 'log']))
+        except IOError as e:
+            self.emit_status(ThreadCommand('Update_Status', [f'Elliptec stop failed: {e}', 'log']))
+        self.move_done()
 
 
 if __name__ == '__main__':
@@ -5,18 +5,15 @@ Created the 15/06/2023
 @author: Sebastien Weber
 """
 from typing import Union, List
-import pyvisa
 
 from pymeasure.instruments.thorlabs import thorlabs_elliptec as elliptec
 from pymeasure.instruments.thorlabs.elliptec_utils.base import scan_for_devices
-from pymeasure.instruments.resources import list_resources
 from pymodaq.control_modules.move_utility_classes import DAQ_Move_base, comon_parameters_fun, main  # common set of parameters for all actuators
 from pymodaq_utils.logger import set_logger, get_module_name
 from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
-rm = pyvisa.ResourceManager()
-com_ports = rm.list_resources()
+from pymodaq_plugins_thorlabs.hardware.elliptec_discovery import discovery
 
 
 class DAQ_Move_ElliptecPyMeasure(DAQ_Move_base):
@@ -25,6 +22,11 @@ class DAQ_Move_ElliptecPyMeasure(DAQ_Move_base):
     This object inherits all functionality to communicate with PyMoDAQ Module through inheritance via DAQ_Move_base
     It then implements the particular communication with the instrument
 
+    The VISA resources are not listed at import: only the ones remembered as hosting Elliptec devices are offered
+    (see pymodaq_plugins_thorlabs.hardware.elliptec_discovery), the Rescan button listing all of them, as does the
+    initialization if no resource is selected. The devices found on a resource are remembered, the port being only
+    scanned again if the selected address is not among them.
+
     Attributes:
     -----------
     controller: object
@@ -38,7 +40,9 @@ class DAQ_Move_ElliptecPyMeasure(DAQ_Move_base):
     axes_names = [str(ind) for ind in range(4)]
     _epsilon = 0.1
 
-    params = [ {'title': 'COM port', 'name': 'com_port', 'type': 'list', 'limits': com_ports},
+    params = [ {'title': 'COM port', 'name': 'com_port', 'type': 'list', 'limits': discovery.visa_resources()},
+               {'title': 'Rescan ports', 'name': 'rescan', 'type': 'bool_push', 'value': False, 'label': 'Rescan',
+                'tip': 'List all the serial VISA resources'},
                {'title': 'Device', 'name': 'device', 'type': 'str'},
                ] + comon_parameters_fun(is_multiaxes, axes_names, epsilon=_epsilon)
 
@@ -69,11 +73,17 @@ class DAQ_Move_ElliptecPyMeasure(DAQ_Move_base):
         param: Parameter
             A given parameter (within detector_settings) whose value has been changed by the user
         """
-        ## TODO for your custom plugin
-        if param.name() == "a_parameter_you've_added_in_self.params":
-           self.controller.your_method_to_apply_this_param_change()
-        else:
-            pass
+        if param.name() == 'rescan':
+            if param.value():
+                param.setValue(False)
+                self.rescan()
+
+    def rescan(self):
+        """List all the serial VISA resources, the remembered ones first"""
+        resources = discovery.visa_resources(refresh=True)
+        self.settings.child('com_port').setLimits(resources)
+        if resources and not self.settings['com_port']:
+            self.settings.child('com_port').setValue(resources[0])
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -90,11 +100,18 @@ class DAQ_Move_ElliptecPyMeasure(DAQ_Move_base):
             False if initialization failed otherwise True
         """
 
-        self.devices = scan_for_devices(self.settings['com_port'], start_address=0, stop_address=4)
+        if not self.settings['com_port']:
+            self.rescan()
+            if not self.settings['com_port']:
+                return 'No serial VISA resource found', False
+        address = int(self.axis_name)
+        self.devices = discovery.resources.get(self.settings['com_port'], [])
+        if len(self.devices) <= address:
+            self.devices = scan_for_devices(self.settings['com_port'], start_address=0, stop_address=4)
+            discovery.remember_resource(self.settings['com_port'], self.devices)
 
         self.controller = self.ini_stage_init(old_controller=controller,
                                               new_controller=elliptec.ElliptecController(self.settings['com_port']))
-        address = int(self.settings['multiaxes', 'axis'])
         device = f'Motor:{self.devices[address]["Motor Type"]} / '\
                  f'serial:{self.devices[address]["Serial No."]}'
         self.settings.child('device').setValue(device)
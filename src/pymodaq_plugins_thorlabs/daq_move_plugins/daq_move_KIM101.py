@@ -26,7 +26,16 @@ class DAQ_Move_KIM101(DAQ_Move_base):
     params = [
                  {'title': 'Serial Number:', 'name': 'serial_number', 'type': 'list',
                   'limits': serialnumbers_inertial_motor, 'value': serialnumbers_inertial_motor[0]},
-
+                 {'title': 'Coordinated move:', 'name': 'coordinated', 'type': 'group', 'expanded': False,
+                  'children': [
+                      {'title': 'Channels:', 'name': 'channels', 'type': 'str', 'value': '1, 2',
+                       'tip': 'Channels moved together, for instance the tip and tilt ones of a mirror mount'},
+                      {'title': 'Relative:', 'name': 'relative', 'type': 'bool', 'value': True},
+                  ] + [{'title': f'Channel {channel} (steps):', 'name': f'target_{channel}', 'type': 'int',
+                        'value': 0} for channel in range(1, 5)] + [
+                      {'title': 'Timeout (s):', 'name': 'timeout', 'type': 'float', 'value': 6., 'min': 0.1},
+                      {'title': 'Move:', 'name': 'move', 'type': 'bool_push', 'value': False, 'label': 'Move'},
+                  ]},
              ] + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
 
     def ini_attributes(self):
@@ -59,7 +68,29 @@ class DAQ_Move_KIM101(DAQ_Move_base):
         param: Parameter
             A given parameter (within detector_settings) whose value has been changed by the user
         """
-        pass
+        if param.name() == 'move' and param.value():
+            param.setValue(False)
+            channels = self.settings['coordinated', 'channels'].replace(',', ' ').split()
+            if not channels or any(channel not in self._axes_names for channel in channels):
+                self.emit_status(ThreadCommand('Update_Status', ['Invalid channels for the coordinated move', 'log']))
+                return
+            self.move_channels({int(channel): self.settings['coordinated', f'target_{channel}']
+                                for channel in channels},
+                               self.settings['coordinated', 'relative'])
+
+    def move_channels(self, targets: dict, relative: bool = False):
+        """ Move several channels together (channel: steps), in a single step whatever their number
+
+        The targets are in steps of the controller, the scaling of the actuator is not applied.
+        """
+        try:
+            if relative:
+                self.controller.move_rel_many(targets, self.settings['coordinated', 'timeout'])
+            else:
+                self.controller.move_abs_many(targets, self.settings['coordinated', 'timeout'])
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [f'Coordinated move failed: {e}', 'log']))
+        self.emit_value(self.get_actuator_value())
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -120,7 +151,7 @@ class DAQ_Move_KIM101(DAQ_Move_base):
 
     def stop_motion(self):
         """Stop the actuator and emits move_done signal"""
-        self.controller.stop()
+        self.controller.stop(self.axis_value)
 
 
 if __name__ == '__main__':
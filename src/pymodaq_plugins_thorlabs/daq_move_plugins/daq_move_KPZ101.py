@@ -1,3 +1,5 @@
+import numpy as np
+
 from pymodaq.control_modules.move_utility_classes import (
     DAQ_Move_base, comon_parameters_fun, main, DataActuatorType, DataActuator)
 
@@ -6,6 +8,8 @@ from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
 from pymodaq_plugins_thorlabs.hardware.kinesis import serialnumbers_piezo, Piezo
+from pymodaq_plugins_thorlabs.hardware.piezo_waveform import (WaveformStreamer, WaveformStats, waveform_params,
+                                                              make_waveform, load_waveform)
 
 
 logger = set_logger(get_module_name(__file__))
@@ -17,6 +21,9 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
     This object inherits all functionalities to communicate with PyMoDAQ’s DAQ_Move module through inheritance via
     DAQ_Move_base. It makes a bridge between the DAQ_Move module and the Python wrapper of a particular instrument.
 
+    Besides the moves, a voltage waveform can be streamed to the output (see
+    pymodaq_plugins_thorlabs.hardware.piezo_waveform), any move stopping it.
+
     Attributes:
     -----------
     controller: object
@@ -32,12 +39,12 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
     params = [
                  {'title': 'Serial Number:', 'name': 'serial_number', 'type': 'list',
                   'limits': serialnumbers_piezo, 'value': serialnumbers_piezo[0]},
-                  {'title': 'Units:', 'name': 'units', 'type': 'string', 'value': _controller_units}
 
-             ] + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
+             ] + waveform_params + comon_parameters_fun(is_multiaxes, axes_names=_axes_names, epsilon=_epsilon)
 
     def ini_attributes(self):
         self.controller: Piezo = None
+        self.streamer: WaveformStreamer = None
 
     def get_actuator_value(self):
         """Get the current value from the hardware with scaling conversion.
@@ -55,6 +62,7 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
 
     def close(self):
         """Terminate the communication protocol"""
+        self.stop_waveform()
         if self.is_master:
             self.controller.close()
 
@@ -68,6 +76,64 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
         """
         if param.name() == 'units':
             self.axis_unit = self.controller.get_units(self.axis_value)
+        elif param.name() in ('start', 'stop') and param.parent().name() == 'waveform':
+            if param.value():
+                param.setValue(False)
+                if param.name() == 'start':
+                    self.start_waveform()
+                else:
+                    self.stop_waveform()
+
+    def start_waveform(self):
+        """Stream the waveform defined in the settings to the output, restarting it if already running"""
+        self.stop_waveform()
+        settings = self.settings.child('waveform')
+        try:
+            if settings['shape'] == 'file':
+                voltages = load_waveform(settings['path'])
+            else:
+                voltages = make_waveform(settings['shape'], settings['amplitude'], settings['offset'])
+        except (OSError, ValueError) as e:
+            self.emit_status(ThreadCommand('Update_Status', [f'Invalid waveform: {e}', 'log']))
+            return
+        if voltages.size == 0:
+            self.emit_status(ThreadCommand('Update_Status', ['Invalid waveform: no voltage', 'log']))
+            return
+        if np.any(voltages < 0) or np.any(voltages > settings['max_voltage']):
+            self.emit_status(ThreadCommand('Update_Status',
+                                           [f"The waveform is clipped to [0, {settings['max_voltage']}] V", 'log']))
+            voltages = np.clip(voltages, 0, settings['max_voltage'])
+        if settings['rate'] < 2 * settings['frequency']:
+            self.emit_status(ThreadCommand('Update_Status', [
+                f"The update rate ({settings['rate']} Hz) is below twice the frequency: the waveform is aliased",
+                'log']))
+        self.streamer = WaveformStreamer(self.controller.move_abs, voltages, settings['frequency'], settings['rate'],
+                                         on_stats=self.emit_waveform_stats)
+        self.streamer.start()
+
+    def stop_waveform(self):
+        if self.streamer is None or not self.streamer.running:
+            return
+        stats = self.streamer.stop()
+        self.update_waveform_stats(stats)
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Waveform stopped: {stats.updates} updates at {stats.achieved_rate:.1f} Hz, '
+            f'jitter {1e6 * stats.jitter_rms:.0f} µs rms, {stats.skipped} samples skipped', 'log']))
+
+    def emit_waveform_stats(self, stats: WaveformStats):
+        """ Show the stats reported by the streamer thread, through the status signal (thread safe)"""
+        for name, value in self._waveform_stats_values(stats).items():
+            self.emit_status(ThreadCommand('update_settings', [['waveform', name], value, 'value']))
+
+    @staticmethod
+    def _waveform_stats_values(stats: WaveformStats) -> dict:
+        return dict(achieved_rate=stats.achieved_rate, jitter=1e6 * stats.jitter_rms,
+                    jitter_max=1e6 * stats.jitter_max, skipped=stats.skipped)
+
+    def update_waveform_stats(self, stats: WaveformStats):
+        """ Set the stats in the settings, from the plugin thread only"""
+        for name, value in self._waveform_stats_values(stats).items():
+            self.settings.child('waveform', name).setValue(value)
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -103,10 +169,11 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
         ----------
         value: (DataActuator) value of the absolute target positioning
         """
+        self.stop_waveform()
         value = self.check_bound(value)
         self.target_value = value
         value = self.set_position_with_scaling(value) 
-        self.controller.move_abs(value.value(), axis=self.axis)
+        self.controller.move_abs(value.value())
 
     def move_rel(self, value: DataActuator):
         """ Move the actuator to the relative target actuator value defined by value
@@ -115,6 +182,7 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
         ----------
         value: (DataActuator) value of the relative target positioning
         """
+        self.stop_waveform()
         value = self.check_bound(self.current_value + value) - self.current_value
         self.target_value = value + self.current_value
         value = self.set_position_with_scaling(self.target_value)
@@ -122,10 +190,11 @@ class DAQ_Move_KPZ101(DAQ_Move_base):
 
     def move_home(self):
         """Call the reference method of the controller"""
-        self.controller.home(axis=self.axis)
+        self.controller.home()
 
     def stop_motion(self):
         """Stop the actuator and emits move_done signal"""
+        self.stop_waveform()
         self.controller.stop()
 
 
@@ -4,11 +4,12 @@ from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
 from pymodaq_plugins_thorlabs.hardware.kinesis import serialnumbers_flipper, Flipper
+from pymodaq_plugins_thorlabs.hardware.flipper_sequence import FlipperSequencePlugin, flipper_sequence_params
 
 logger = set_logger(get_module_name(__file__))
 
 
-class DAQ_Move_KinesisFlipper(DAQ_Move_base):
+class DAQ_Move_KinesisFlipper(FlipperSequencePlugin, DAQ_Move_base):
     """
 
     """
@@ -22,7 +23,7 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
     params = [{'title': 'Controller ID:', 'name': 'controller_id', 'type': 'str', 'value': '', 'readonly': True},
               {'title': 'Serial number:', 'name': 'serial_number', 'type': 'list',
                'limits': serialnumbers_flipper},
-              ] + comon_parameters_fun(is_multiaxes, epsilon=_epsilon)
+              ] + flipper_sequence_params + comon_parameters_fun(is_multiaxes, epsilon=_epsilon)
 
     def ini_attributes(self):
         self.controller: Flipper = None
@@ -31,7 +32,9 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
         self.settings.child('bounds', 'min_bound').setValue(0)
 
     def commit_settings(self, param):
-        if param.name() == 'backlash':
+        if self.commit_sequence_settings(param):
+            pass
+        elif param.name() == 'backlash':
             self.controller.backlash = param.value()
 
     def ini_stage(self, controller=None):
@@ -52,6 +55,9 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
         """
             close the current instance of Kinesis instrument.
         """
+        if self.sequence is not None:
+            self.sequence.stop()
+            self.sequence.finished.wait(self.settings['sequence', 'timeout'])
         self.controller.close()
 
     def stop_motion(self):
@@ -60,6 +66,8 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
             --------
             DAQ_Move_base.move_done
         """
+        if self.sequence is not None:
+            self.sequence.stop()
         self.controller.stop()
 
     def get_actuator_value(self):
@@ -84,7 +92,7 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
         self.target_position = position
         position = self.set_position_with_scaling(position)
 
-        self.controller.move_abs(position)
+        self.controller.move_abs(position, callback=self._move_done_callback)
 
     def move_rel(self, position):
         """
@@ -99,7 +107,11 @@ class DAQ_Move_KinesisFlipper(DAQ_Move_base):
     def move_home(self):
         """
         """
-        self.controller.home(callback=self.move_done)
+        self.controller.home(callback=self._move_done_callback)
+
+    def _move_done_callback(self, val: int = 0):
+        """ Called by Kinesis at the end of a transit: no polling needed to signal the move done"""
+        self.move_done()
 
 
 if __name__ == '__main__':
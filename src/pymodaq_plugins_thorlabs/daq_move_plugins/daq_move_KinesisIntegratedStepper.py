@@ -4,14 +4,18 @@ from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
 from pymodaq_plugins_thorlabs.hardware.kinesis import serialnumbers_integrated_stepper, IntegratedStepper
+from pymodaq_plugins_thorlabs.hardware.continuous_rotation import ContinuousRotationPlugin, continuous_rotation_params
 
 
 logger = set_logger(get_module_name(__file__))
 
 
-class DAQ_Move_KinesisIntegratedStepper(DAQ_Move_base):
-    """
+class DAQ_Move_KinesisIntegratedStepper(ContinuousRotationPlugin, DAQ_Move_base):
+    """ Plugin for the Kinesis cage rotator
 
+    Besides discrete moves, the rotator can spin continuously while its angle is recorded (see
+    pymodaq_plugins_thorlabs.hardware.continuous_rotation), detector samples being mapped to angles afterwards
+    with rotation_angles_at.
     """
     _controller_units = '°'
     _epsilon = 0.05
@@ -24,7 +28,8 @@ class DAQ_Move_KinesisIntegratedStepper(DAQ_Move_base):
               {'title': 'Serial number:', 'name': 'serial_number', 'type': 'list',
                'limits': serialnumbers_integrated_stepper},
               {'title': 'Backlash:', 'name': 'backlash', 'type': 'float', 'value': 0, },
-              ] + comon_parameters_fun(is_multiaxes, axis_names=stage_names, epsilon=_epsilon)
+              ] + continuous_rotation_params + comon_parameters_fun(is_multiaxes, axis_names=stage_names,
+                                                                    epsilon=_epsilon)
 
     def ini_attributes(self):
         self.controller: IntegratedStepper = None
@@ -35,6 +40,8 @@ class DAQ_Move_KinesisIntegratedStepper(DAQ_Move_base):
     def commit_settings(self, param):
         if param.name() == 'backlash':
             self.controller.backlash = param.value()
+        else:
+            self.commit_rotation_settings(param)
 
     def ini_stage(self, controller=None):
         """
@@ -58,6 +65,7 @@ class DAQ_Move_KinesisIntegratedStepper(DAQ_Move_base):
             close the current instance of Kinesis instrument.
         """
         if self.controller is not None:
+            self.stop_rotation()
             self.controller.close()
 
     def stop_motion(self):
@@ -67,7 +75,10 @@ class DAQ_Move_KinesisIntegratedStepper(DAQ_Move_base):
             DAQ_Move_base.move_done
         """
         if self.controller is not None:
-            self.controller.stop()
+            if self.rotation is not None and self.rotation.running:
+                self.stop_rotation()
+            else:
+                self.controller.stop()
 
     def get_actuator_value(self):
         """
@@ -10,10 +10,12 @@ from easydict import EasyDict as edict
 
 import pylablib.devices.Thorlabs as Thorlabs
 
+from pymodaq_plugins_thorlabs.hardware.position_polling import PositionPoller, StalePositionPlugin
+
 is_multiaxes = False
 stage_names = []
 
-class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
+class DAQ_Move_MFF101_pylablib(StalePositionPlugin, DAQ_Move_base):
     """
         Wrapper object to access the Flipper functionalities, similar wrapper for all controllers.
         =============== ==============
@@ -22,6 +24,7 @@ class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
         =============== ==============
     """
     _controller_units = ''
+    stale_description = 'flipper state'
 
     _dvc = Thorlabs.list_kinesis_devices()
     serialnumbers = [d[0] for d in _dvc if d[1] == 'APT Filter Flipper']
@@ -29,6 +32,9 @@ class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
     params= [{'title': 'Controller ID:', 'name': 'controller_id', 'type': 'str', 'value': '', 'readonly': True},
              {'title': 'Serial number:', 'name': 'serial_number', 'type': 'list', 'limits': serialnumbers},
              {'title': 'Home Position:', 'name': 'home_position', 'type': 'list' , 'value': 0, 'limits' : [0,1]},
+             {'title': 'Stale position:', 'name': 'stale_position', 'type': 'led', 'value': False,
+              'readonly': True, 'tip': 'On if the flipper could not report its state, the last known one'
+                                       ' is then used'},
              {'title': 'MultiAxes:', 'name': 'multiaxes', 'type': 'group', 'visible': is_multiaxes, 'children':[
                         {'title': 'is Multiaxes:', 'name': 'ismultiaxes', 'type': 'bool', 'value': is_multiaxes, 'default': False},
                         {'title': 'Status:', 'name': 'multi_status', 'type': 'list', 'value': 'Master', 'limits': ['Master', 'Slave']},
@@ -40,6 +46,7 @@ class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
 
     def __init__(self, parent=None, params_state=None):
         super().__init__(parent, params_state)
+        self.poller: PositionPoller = None
         self.settings.child('epsilon').setValue(0.1)
         self.settings.child('epsilon').setReadonly()
 
@@ -114,6 +121,7 @@ class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
 
             if not self.controller.is_opened():
                 self.controller.open()
+            self.poller = PositionPoller(self.controller.get_state)
 
             #Getting the information from the device
             info = self.controller.get_device_info()
@@ -161,11 +169,10 @@ class DAQ_Move_MFF101_pylablib(DAQ_Move_base):
             --------
             DAQ_Move_base.get_position_with_scaling, daq_utils.ThreadCommand
         """
-        #Get position = 0 or 1, possibly None if unknown
-        pos = self.controller.get_state()
-        #Repollif pos returns none
-        while pos == None:
-            pos = self.controller.get_state()
+        #Get position = 0 or 1, the last known one (flagged as stale) if unknown
+        position = self.poller.read()
+        self.update_stale_status(position)
+        pos = position.value if position.value is not None else float('nan')
 
         #This is superfluous as there is not scaling
         # pos = self.get_position_with_scaling(pos)
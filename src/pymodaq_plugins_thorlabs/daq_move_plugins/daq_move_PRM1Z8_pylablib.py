@@ -8,11 +8,12 @@ from pymodaq_gui.parameter import Parameter
 import pylablib.devices.Thorlabs as Thorlabs
 
 from pymodaq_plugins_thorlabs.utils import Config as PluginConfig
+from pymodaq_plugins_thorlabs.hardware.position_polling import PositionPoller, StalePositionPlugin
 
 config = PluginConfig()
 
 
-class DAQ_Move_PRM1Z8_pylablib(DAQ_Move_base):
+class DAQ_Move_PRM1Z8_pylablib(StalePositionPlugin, DAQ_Move_base):
     """
         Wrapper object to access the Flipper functionalities, similar wrapper for all controllers.
         =============== ==============
@@ -24,6 +25,7 @@ class DAQ_Move_PRM1Z8_pylablib(DAQ_Move_base):
     is_multiaxes = False
     _stage_names = []
     _epsilon = 0.005
+    stale_description = 'stage position'
     _dvc = Thorlabs.list_kinesis_devices()
     #serialnumbers = [d[0] for d in _dvc if d[1] == 'APT DC Motor Controller']
     serialnumbers = [d[0] for d in _dvc]
@@ -33,10 +35,14 @@ class DAQ_Move_PRM1Z8_pylablib(DAQ_Move_base):
              {'title': 'Home Position:', 'name': 'home_position', 'type': 'float', 'value': 0.0},
              {'title': 'Set Zero', 'name': 'set_zero', 'type': 'bool_push', 'value': False},
              {'title': 'Reset Home', 'name': 'reset_home', 'type': 'bool_push', 'value': False},
+             {'title': 'Stale position:', 'name': 'stale_position', 'type': 'led', 'value': False,
+              'readonly': True, 'tip': 'On if the stage could not report its position, the last known one'
+                                       ' is then used'},
 
              ] + comon_parameters_fun(is_multiaxes, _stage_names, epsilon=_epsilon)
 
     def ini_attributes(self):
+        self.poller: PositionPoller = None
         self.settings.child('epsilon').setReadonly()
         self.settings.child('timeout').setValue(100)
 
@@ -90,6 +96,7 @@ class DAQ_Move_PRM1Z8_pylablib(DAQ_Move_base):
 
         if not self.controller.is_opened():
             self.controller.open()
+        self.poller = PositionPoller(self.controller.get_position)
 
         #Getting the information from the device
         info = self.controller.get_device_info()
@@ -129,10 +136,9 @@ class DAQ_Move_PRM1Z8_pylablib(DAQ_Move_base):
             --------
             DAQ_Move_base.get_position_with_scaling, daq_utils.ThreadCommand
         """
-        pos = self.controller.get_position()
-        #Repoll if pos returns none
-        while pos == None:
-            pos = self.controller.get_position()
+        position = self.poller.read()
+        self.update_stale_status(position)
+        pos = position.value if position.value is not None else float('nan')
         pos = self.get_position_with_scaling(pos)
         return pos
 
@@ -44,6 +44,7 @@ class DAQ_0DViewer_TLPMPowermeter(DAQ_Viewer_base):
 
     def __init__(self, parent=None, params_state=None):
         super().__init__(parent, params_state)
+        self._failing = False
 
 
     def ini_detector(self, controller=None):
@@ -112,6 +113,9 @@ class DAQ_0DViewer_TLPMPowermeter(DAQ_Viewer_base):
             =============== ======== ===============================================
         """
         data = [np.array([self.controller.get_power()])]
+        if self.controller.is_failing != self._failing:
+            self._failing = self.controller.is_failing
+            self.emit_status(ThreadCommand('Update_Status', [self.controller.status_message, 'log']))
         self.data_grabed_signal.emit([DataFromPlugins(name='Powermeter', data=data,
                                                       dim='Data0D', labels=['Power (W)'],)])
 
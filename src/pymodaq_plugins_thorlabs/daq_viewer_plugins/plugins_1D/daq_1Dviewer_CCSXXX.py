@@ -1,3 +1,6 @@
+from pathlib import Path
+from time import perf_counter
+
 import numpy as np
 
 from pymodaq.utils.data import DataFromPlugins, Axis, DataToExport
@@ -8,7 +11,14 @@ from pymodaq_utils.logger import set_logger, get_module_name
 from pymodaq_utils.utils import ThreadCommand
 from pymodaq_gui.parameter import Parameter
 
-from pymodaq_plugins_thorlabs.hardware.ccsxxx import CCSXXX
+from pymodaq_plugins_thorlabs.hardware.ccsxxx import CCSXXX, ADC_MAX
+from pymodaq_plugins_thorlabs.hardware.ccs_calibration import WavelengthCalibration, get_wavelength_calibration
+from pymodaq_plugins_thorlabs.hardware.spectral_roi import SpectralROIs, parse_rois, spectral_roi_params
+from pymodaq_plugins_thorlabs.hardware.spectral_peaks import PeakFinder, peak_params
+from pymodaq_plugins_thorlabs.hardware.auto_exposure import AutoExposure, auto_exposure_params
+from pymodaq_plugins_thorlabs.hardware.spectral_correction import (DarkLibrary, SpectralCorrector, correction_params,
+                                                                    dark_library_path, load_response,
+                                                                    parse_coefficients)
 
 class DAQ_1DViewer_CCSXXX(DAQ_Viewer_base):
     """ Instrument plugin class for a 1D viewer.
@@ -21,17 +31,53 @@ class DAQ_1DViewer_CCSXXX(DAQ_Viewer_base):
     controller: object
         The particular object that allow the communication with the hardware, in general a python wrapper around the
          hardware library.
+    amplitude_correction: ndarray
+        The amplitude correction factors of the spectrometer, read at init.
+    calibration: WavelengthCalibration
+        The wavelength calibration, cached by serial number in the configuration directory (see
+        pymodaq_plugins_thorlabs.hardware.ccs_calibration).
+
+    In raw readout, spectra are emitted (and saved) as uint16 counts, 4 times smaller than the float64 intensities.
+    They can be converted afterwards, all at once, with
+    ``pymodaq_plugins_thorlabs.hardware.ccsxxx.raw_to_intensity(raw, amplitude_correction)``.
+
+    Spectral ROIs (in nm) and a pixel binning can be set in the Spectral ROIs settings: the full (binned) spectrum,
+    one spectrum per ROI or no spectrum at all is emitted, and the integral of the spectrum over each ROI can be
+    emitted as Data0D, see pymodaq_plugins_thorlabs.hardware.spectral_roi.
+
+    In peak tracking mode (Peaks settings), the wavelength, FWHM and amplitude of the peaks of each spectrum are
+    emitted as Data0D, the spectra being only emitted at a reduced rate, see
+    pymodaq_plugins_thorlabs.hardware.spectral_peaks.
 
+    In auto exposure mode, the integration time is adjusted after each spectrum to bring its fill level to a target,
+    see pymodaq_plugins_thorlabs.hardware.auto_exposure.
+
+    Spectra can be corrected before being emitted (Corrections settings): dark subtraction from a library of dark
+    references recorded for several integration times, nonlinearity and relative irradiance response, see
+    pymodaq_plugins_thorlabs.hardware.spectral_correction.
     """
     params = comon_parameters + [
         {'title': 'Integration time', 'name': 'integration_time', 'type': 'float', 'value': 100.0e-3}, # in seconds
         {'title': 'Resource name', 'name': 'resource_name', 'type': 'str', 'value': 'USB0::0x1313::0x8087::M00934802::RAW'},
-    ]
+        {'title': 'Readout', 'name': 'readout', 'type': 'list', 'value': 'intensity', 'limits': ['intensity', 'raw'],
+         'tip': 'intensity: amplitude corrected float64, raw: uint16 counts'},
+        {'title': 'Calibration', 'name': 'calibration', 'type': 'list', 'value': 'factory',
+         'limits': ['factory', 'user']},
+    ] + spectral_roi_params + peak_params + auto_exposure_params + correction_params
 
     def ini_attributes(self):
         """Initialize attributes for the DAQ_1DViewer_CCSXXX class."""
         self.controller: CCSXXX = None
         self.x_axis = None
+        self.amplitude_correction = None
+        self.calibration: WavelengthCalibration = None
+        self.spectral_rois: SpectralROIs = None
+        self.roi_axes = []
+        self.peak_finder: PeakFinder = None
+        self.auto_exposure = AutoExposure()
+        self.corrector: SpectralCorrector = None
+        self._last_spectrum = 0.
+        self._integration_time = None  # last integration time set on the device
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -42,7 +88,120 @@ class DAQ_1DViewer_CCSXXX(DAQ_Viewer_base):
             A given parameter (within detector_settings) whose value has been changed by the user
         """
         if param.name() == "integration_time":
-            self.controller.set_integration_time(self.settings['integration_time'])
+            self.set_integration_time(self.settings['integration_time'])
+        elif param.name() == "calibration":
+            self.load_calibration()
+        elif self.settings.childPath(param)[0] == 'spectral':
+            if param.name() in ('rois', 'binning'):
+                self.update_spectral_rois()
+        elif self.settings.childPath(param)[0] == 'peaks':
+            if param.name() in ('n_peaks', 'threshold', 'min_distance', 'fit', 'window'):
+                setattr(self.peak_finder, param.name(), param.value())
+        elif self.settings.childPath(param)[0] == 'correction':
+            self.commit_correction_settings(param)
+        elif self.settings.childPath(param)[0] == 'auto_exposure':
+            if param.name() not in ('enabled', 'fill'):
+                setattr(self.auto_exposure, param.name(), param.value())
+
+    def commit_correction_settings(self, param: Parameter):
+        corrector = self.corrector
+        group = param.parent().name()
+        if group == 'dark':
+            if param.name() == 'use':
+                corrector.use_dark = param.value()
+            elif param.name() == 'record':
+                if param.value():
+                    param.setValue(False)
+                    corrector.record(self.settings['correction', 'dark', 'n_average'])
+            elif param.name() == 'clear':
+                if param.value():
+                    param.setValue(False)
+                    corrector.library.clear()
+                    self.update_dark_references()
+        elif group == 'nonlinearity':
+            if param.name() == 'use':
+                corrector.use_nonlinearity = param.value()
+            elif param.name() == 'coefficients':
+                try:
+                    corrector.coefficients = parse_coefficients(param.value())
+                except ValueError:
+                    self.emit_status(ThreadCommand('Update_Status',
+                                                   [f'Invalid nonlinearity coefficients: {param.value()}', 'log']))
+        elif group == 'response':
+            if param.name() == 'use':
+                corrector.use_response = param.value()
+            elif param.name() == 'path':
+                self.load_response()
+
+    def load_response(self):
+        path = self.settings['correction', 'response', 'path']
+        if path and Path(path).is_file():
+            try:
+                self.corrector.response = load_response(path, self.calibration.wavelengths)
+            except Exception as e:
+                self.emit_status(ThreadCommand('Update_Status', [f'Could not load the response {path}: {e}', 'log']))
+
+    def update_dark_references(self):
+        self.settings.child('correction', 'dark', 'references').setValue(
+            ', '.join(f'{time * 1000:g}' for time in self.corrector.library.integration_times))
+
+    def load_calibration(self):
+        """Get the wavelength calibration (from the cache if still valid) and set the wavelength axis"""
+        data_set = 1 if self.settings['calibration'] == 'user' else 0
+        self.calibration = get_wavelength_calibration(self.controller, data_set)
+        self.spectral_rois = SpectralROIs(self.calibration.wavelengths)
+        self.update_spectral_rois()
+        self.peak_finder = PeakFinder(self.calibration.wavelengths)
+        for name in ('n_peaks', 'threshold', 'min_distance', 'fit', 'window'):
+            setattr(self.peak_finder, name, self.settings['peaks', name])
+
+    def update_spectral_rois(self):
+        """Map the spectral ROIs to pixels and compute the (binned) axes, once"""
+        try:
+            rois = parse_rois(self.settings['spectral', 'rois'])
+        except ValueError as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+            rois = []
+        self.spectral_rois.set_rois(rois, self.settings['spectral', 'binning'])
+        self.x_axis = Axis(data=self.spectral_rois.full_axis, label='Wavelength', units='nm', index=0)
+        self.roi_axes = [Axis(data=roi.axis, label='Wavelength', units='nm', index=0)
+                         for roi in self.spectral_rois.rois]
+
+    def to_dte(self, spectrum: np.ndarray, label: str, with_spectra: bool = True) -> DataToExport:
+        """Spectra, band signals and peaks to be emitted, according to the Spectral ROIs and Peaks settings"""
+        data = []
+        if not with_spectra:
+            pass
+        elif self.settings['spectral', 'spectra'] == 'full' or not self.spectral_rois.rois:
+            data.append(DataFromPlugins(name='Spectrum', data=[self.spectral_rois.bin(spectrum)],
+                                        dim='Data1D', labels=[label], axes=[self.x_axis]))
+        elif self.settings['spectral', 'spectra'] == 'rois':
+            for roi, roi_spectrum, axis in zip(self.spectral_rois.rois, self.spectral_rois.spectra(spectrum),
+                                               self.roi_axes):
+                data.append(DataFromPlugins(name=f'Spectrum {roi.label}', data=[roi_spectrum],
+                                            dim='Data1D', labels=[label], axes=[axis]))
+        if self.settings['spectral', 'bands'] and self.spectral_rois.rois:
+            bands = self.spectral_rois.bands(spectrum)
+            data.append(DataFromPlugins(name='Bands', data=[np.array([band]) for band in bands], dim='Data0D',
+                                        labels=[roi.label for roi in self.spectral_rois.rois]))
+        if self.settings['peaks', 'enabled']:
+            labels = [f'Peak {ind}' for ind in range(self.peak_finder.n_peaks)]
+            for name, values in zip(('Peak wavelength (nm)', 'Peak FWHM (nm)', 'Peak amplitude'),
+                                    self.peak_finder.analyze(spectrum)):
+                data.append(DataFromPlugins(name=name, data=[np.array([value]) for value in values], dim='Data0D',
+                                            labels=labels))
+        return DataToExport('CCSXXX', data=data)
+
+    def spectrum_due(self) -> bool:
+        """True if the spectra are to be emitted: always, but at the spectrum rate when tracking peaks"""
+        if not self.settings['peaks', 'enabled']:
+            return True
+        rate = self.settings['peaks', 'spectrum_rate']
+        now = perf_counter()
+        if rate > 0 and now - self._last_spectrum >= 1 / rate:
+            self._last_spectrum = now
+            return True
+        return False
 
     def ini_detector(self, controller=None):
         """Detector communication initialization
@@ -65,14 +224,19 @@ class DAQ_1DViewer_CCSXXX(DAQ_Viewer_base):
             self.controller = CCSXXX(self.settings['resource_name'])
             self.controller.connect()
 
-        data_x_axis = self.controller.get_wavelength_data()
-        self.x_axis = Axis(data=data_x_axis, label='Wavelength', units='nm', index=0)
+        self.load_calibration()
+        self.corrector = SpectralCorrector(DarkLibrary(dark_library_path(self.calibration.serial_number)))
+        self.update_dark_references()
+        for param in self.settings.child('correction').children():
+            for child in param.children():
+                if child.type() != 'bool_push':
+                    self.commit_correction_settings(child)
+        for param in self.settings.child('auto_exposure').children():
+            if param.name() not in ('enabled', 'fill'):
+                setattr(self.auto_exposure, param.name(), param.value())
+        self.amplitude_correction = self.controller.get_amplitude_correction()
 
-        self.dte_signal_temp.emit(DataToExport(name='CCSXXX',
-                                               data=[DataFromPlugins(name='Spectrum',
-                                                                     data=[np.zeros(len(data_x_axis)),],
-                                                                     dim='Data1D', labels=['Intensity'],
-                                                                     axes=[self.x_axis])]))
+        self.dte_signal_temp.emit(self.to_dte(np.zeros(len(self.calibration.wavelengths)), 'Intensity'))
 
         info = "CCSXXX spectrometer initialized"
         initialized = True
@@ -94,11 +258,44 @@ class DAQ_1DViewer_CCSXXX(DAQ_Viewer_base):
             others optionals arguments
         """
         self.controller.start_scan()
-        data_tot = self.controller.get_scan_data()
-        self.dte_signal.emit(DataToExport('CCSXXX',
-                                          data=[DataFromPlugins(name='Spectrum', data=[data_tot],
-                                                                dim='Data1D', labels=['Intensity'],
-                                                                axes=[self.x_axis])]))
+        if self.settings['readout'] == 'raw':
+            data_tot = self.controller.get_raw_scan_data()
+            label = 'Counts'
+        else:
+            data_tot = self.controller.get_scan_data()
+            label = 'Intensity'
+        integration_time = self.settings['integration_time']
+        if self.settings['auto_exposure', 'enabled']:
+            self.adjust_exposure(data_tot)  # from the uncorrected spectrum, for the next scans
+        if self.corrector.recording:
+            if self.corrector.add_dark_spectrum(data_tot / self.counts_scale(), integration_time):
+                self.update_dark_references()
+                self.emit_status(ThreadCommand('Update_Status',
+                                               [f'Dark recorded for {integration_time * 1000:g} ms', 'log']))
+        if self.corrector.enabled:
+            data_tot = self.corrector.apply(data_tot, integration_time, self.counts_scale())
+        self.dte_signal.emit(self.to_dte(data_tot, label, with_spectra=self.spectrum_due()))
+
+    def counts_scale(self):
+        """Conversion factor from raw counts to the emitted spectra unit"""
+        if self.settings['readout'] == 'raw':
+            return 1.
+        return self.amplitude_correction / ADC_MAX
+
+    def adjust_exposure(self, spectrum: np.ndarray):
+        """Set the integration time for the next scans from the fill level of the last spectrum"""
+        full_scale = ADC_MAX if self.settings['readout'] == 'raw' else 1.
+        integration_time = self.auto_exposure.update(spectrum, self.settings['integration_time'], full_scale)
+        self.settings.child('auto_exposure', 'fill').setValue(round(self.auto_exposure.fill, 3))
+        if integration_time is not None:
+            self.set_integration_time(integration_time)
+            self.settings.child('integration_time').setValue(integration_time)
+
+    def set_integration_time(self, integration_time: float):
+        """Set the integration time on the device, unless already set (the settings being updated afterwards)"""
+        if integration_time != self._integration_time:
+            self.controller.set_integration_time(integration_time)
+            self._integration_time = integration_time
 
     def stop(self):
         """Stop the current grab hardware wise if necessary"""
@@ -0,0 +1,98 @@
+import numpy as np
+
+from pymodaq.utils.data import DataFromPlugins, Axis, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
+
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq_gui.parameter import Parameter
+
+from pymodaq_plugins_thorlabs.hardware.ccs_group import CCSGroup, parse_resource_names
+from pymodaq_plugins_thorlabs.hardware.ccs_calibration import get_wavelength_calibration
+
+
+class DAQ_1DViewer_CCSXXX_Multi(DAQ_Viewer_base):
+    """ Plugin acquiring simultaneously from several CCSXXX spectrometers (for instance a CCS100 and a CCS200)
+
+    Scans are started on all the spectrometers at once and read concurrently from a thread pool, see
+    pymodaq_plugins_thorlabs.hardware.ccs_group. Each grab emits a single DataToExport with one spectrum per
+    spectrometer (named after its serial number, with its own wavelength axis), all sharing the acquisition
+    timestamp.
+
+    Attributes:
+    -----------
+    controller: CCSGroup
+    """
+    params = comon_parameters + [
+        {'title': 'Integration time', 'name': 'integration_time', 'type': 'float', 'value': 100.0e-3},  # in seconds
+        {'title': 'Resource names', 'name': 'resource_names', 'type': 'text',
+         'value': 'USB0::0x1313::0x8081::M00000001::RAW\nUSB0::0x1313::0x8087::M00000002::RAW',
+         'tip': 'One VISA resource name per line'},
+        {'title': 'Readout', 'name': 'readout', 'type': 'list', 'value': 'intensity', 'limits': ['intensity', 'raw'],
+         'tip': 'intensity: amplitude corrected float64, raw: uint16 counts'},
+    ]
+
+    def ini_attributes(self):
+        self.controller: CCSGroup = None
+        self.names = []
+        self.x_axes = []
+
+    def commit_settings(self, param: Parameter):
+        if param.name() == "integration_time":
+            self.controller.set_integration_time(self.settings['integration_time'])
+        elif param.name() == "resource_names":
+            self.emit_status(ThreadCommand('Update_Status',
+                                           ['Reinitialize the detector to change the spectrometers', 'log']))
+
+    def ini_detector(self, controller=None):
+        self.ini_detector_init(slave_controller=controller)
+
+        if self.is_master:
+            resource_names = parse_resource_names(self.settings['resource_names'])
+            if len(resource_names) == 0:
+                raise Exception('No CCSXXX resource name given')
+            self.controller = CCSGroup(resource_names)
+            self.controller.connect()
+            self.controller.set_integration_time(self.settings['integration_time'])
+
+        self.names = []
+        self.x_axes = []
+        for device in self.controller.devices.values():
+            calibration = get_wavelength_calibration(device)
+            name = calibration.serial_number
+            if name in self.names:  # keep the data names unique
+                name = f'{name}_{len(self.names)}'
+            self.names.append(name)
+            self.x_axes.append(Axis(data=calibration.wavelengths, label='Wavelength', units='nm', index=0))
+
+        self.dte_signal_temp.emit(self.to_dte(0., [np.zeros(len(axis.get_data())) for axis in self.x_axes],
+                                              'Intensity'))
+        info = f"CCSXXX spectrometers initialized: {', '.join(self.names)}"
+        return info, True
+
+    def to_dte(self, timestamp: float, spectra, label: str) -> DataToExport:
+        data = []
+        for name, spectrum, axis in zip(self.names, spectra, self.x_axes):
+            dwa = DataFromPlugins(name=f'Spectrum {name}', data=[spectrum], dim='Data1D', labels=[label],
+                                  axes=[axis])
+            dwa.timestamp = timestamp
+            data.append(dwa)
+        dte = DataToExport('CCSXXX', data=data)
+        dte.timestamp = timestamp
+        return dte
+
+    def close(self):
+        """Terminate the communication with all the spectrometers"""
+        self.controller.close()
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Scan all the spectrometers at once and emit their spectra together"""
+        raw = self.settings['readout'] == 'raw'
+        timestamp, spectra = self.controller.acquire(raw=raw)
+        self.dte_signal.emit(self.to_dte(timestamp, spectra, 'Counts' if raw else 'Intensity'))
+
+    def stop(self):
+        return ''
+
+
+if __name__ == '__main__':
+    main(__file__)
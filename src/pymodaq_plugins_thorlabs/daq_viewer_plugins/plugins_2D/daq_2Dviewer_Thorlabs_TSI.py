@@ -3,7 +3,7 @@ from pymodaq.control_modules.viewer_utility_classes import comon_parameters, mai
 from pylablib.devices import Thorlabs
 
 
-from pymodaq_plugins_utils.hardware.camera_base_pylablib import CameraBasePyLabLib, cam_params
+from pymodaq_plugins_thorlabs.hardware.camera_pipeline import CameraBaseRingBuffer
 
 
 """ note:
@@ -16,7 +16,7 @@ That should solve this particular issue encountered on some win10 computers
 """
 
 
-class DAQ_2DViewer_Thorlabs_TSI(CameraBasePyLabLib):
+class DAQ_2DViewer_Thorlabs_TSI(CameraBaseRingBuffer):
     """
     Plugin for TSI SCMOS Thorlabs cameras
 
@@ -33,7 +33,7 @@ class DAQ_2DViewer_Thorlabs_TSI(CameraBasePyLabLib):
     """
     serial_numbers = Thorlabs.list_cameras_tlcam()
     serial_params = [{'title': 'Serial number:', 'name': 'serial_number', 'type': 'list', 'limits': serial_numbers}]
-    params = comon_parameters + serial_params + cam_params
+    params = comon_parameters + serial_params + CameraBaseRingBuffer.camera_params
 
     def ini_attributes(self):
         super().ini_attributes()
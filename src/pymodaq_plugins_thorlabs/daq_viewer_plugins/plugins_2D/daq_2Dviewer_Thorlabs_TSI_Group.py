@@ -0,0 +1,184 @@
+import threading
+from time import perf_counter
+
+import numpy as np
+from qtpy import QtCore
+
+from pymodaq.utils.data import DataFromPlugins, DataToExport
+from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq_gui.parameter import Parameter
+
+from pylablib.devices import Thorlabs
+
+from pymodaq_plugins_thorlabs.hardware.camera_group import CameraGroup, CameraStream
+
+
+class DAQ_2DViewer_Thorlabs_TSI_Group(DAQ_Viewer_base):
+    """
+    Plugin for a group of TSI SCMOS Thorlabs cameras acquiring synchronously
+
+    The selected cameras are opened in the same process and armed for one frame per trigger, the triggers being sent
+    by software to all of them at the given frame rate, or coming from a shared external trigger line (hardware).
+    Each camera is read by its own thread into its own ring buffer and frames are matched by trigger index: one
+    DataToExport is emitted per complete trigger, with the frame of each camera (named after its serial number) and
+    the trigger index. See pymodaq_plugins_thorlabs.hardware.camera_group.
+
+    Matched, late (complete but not emitted because a more recent one was) and incomplete (dropped by one of the
+    cameras) triggers are reported in the Pipeline settings.
+    """
+    serial_numbers = Thorlabs.list_cameras_tlcam()
+    params = comon_parameters + [
+        {'title': 'Cameras:', 'name': 'serial_numbers', 'type': 'itemselect', 'checkbox': True,
+         'value': dict(all_items=serial_numbers, selected=serial_numbers)},
+        {'title': 'Trigger:', 'name': 'trigger', 'type': 'list', 'value': 'software',
+         'limits': ['software', 'hardware']},
+        {'title': 'Trigger polarity:', 'name': 'polarity', 'type': 'list', 'value': 'rise',
+         'limits': ['rise', 'fall'], 'tip': 'Edge of the external trigger (hardware mode)'},
+        {'title': 'Frame rate (Hz):', 'name': 'frame_rate', 'type': 'float', 'value': 10., 'min': 0.,
+         'tip': 'Rate of the software triggers (software mode)'},
+        {'title': 'Exposure (ms):', 'name': 'exposure', 'type': 'float', 'value': 10., 'min': 0.},
+        {'title': 'Buffer size (frames):', 'name': 'buffer_size', 'type': 'int', 'value': 100, 'min': 10},
+        {'title': 'Pipeline', 'name': 'pipeline', 'type': 'group', 'children': [
+            {'title': 'Ring size (frames):', 'name': 'ring_size', 'type': 'int', 'value': 32, 'min': 2},
+            {'title': 'Achieved FPS:', 'name': 'achieved_fps', 'type': 'float', 'value': 0., 'readonly': True,
+             'tip': 'Frame rate of the slowest camera'},
+            {'title': 'Matched triggers:', 'name': 'matched', 'type': 'int', 'value': 0, 'readonly': True},
+            {'title': 'Late triggers:', 'name': 'late', 'type': 'int', 'value': 0, 'readonly': True},
+            {'title': 'Incomplete triggers:', 'name': 'incomplete', 'type': 'int', 'value': 0, 'readonly': True},
+            {'title': 'Dropped frames:', 'name': 'dropped', 'type': 'int', 'value': 0, 'readonly': True,
+             'tip': 'Sum over the cameras'},
+        ]},
+    ]
+
+    frames_ready = QtCore.Signal()
+
+    def ini_attributes(self):
+        self.controller: CameraGroup = None
+        self.is_live = False
+        self._snap_after = None
+        self._consumer_idle = threading.Event()
+        self._consumer_idle.set()
+        self._last_stats_update = 0.
+
+    def commit_settings(self, param: Parameter):
+        if param.name() == 'exposure':
+            for camera in self.controller.cameras.values():
+                camera.set_exposure(param.value() / 1000)
+            param.setValue(self.controller.streams[0].camera.get_exposure() * 1000)
+        elif param.name() in ('trigger', 'polarity', 'frame_rate', 'buffer_size', 'ring_size'):
+            if self.controller.acquiring:
+                self.controller.stop()
+                self.grab_data(live=self.is_live)  # re-armed with the new settings
+        elif param.name() == 'serial_numbers':
+            self.emit_status(ThreadCommand('Update_Status',
+                                           ['Reinitialize the detector to change the cameras', 'log']))
+
+    def ini_detector(self, controller=None):
+        self.ini_detector_init(slave_controller=controller)
+
+        if self.is_master:
+            serials = self.settings['serial_numbers']['selected']
+            if len(serials) == 0:
+                raise Exception('No Thorlabs TSI camera selected.')
+            cameras = {}
+            for serial in serials:
+                camera = Thorlabs.ThorlabsTLCamera(serial)
+                camera.set_frame_format('chunks')  # frames read as 3D chunks, copied once into the rings
+                camera.set_exposure(self.settings['exposure'] / 1000)
+                cameras[serial] = camera
+            self.controller = CameraGroup(cameras, self.settings['pipeline', 'ring_size'],
+                                          on_frames=self.frames_available)
+        self.frames_ready.connect(self.emit_frames)
+
+        self.dte_signal_temp.emit(self.to_dte(-1, [np.zeros(camera.get_data_dimensions()) for camera in
+                                                   self.controller.cameras.values()]))
+        info = f'TSI camera group initialized: {", ".join(self.controller.cameras)}'
+        return info, True
+
+    def to_dte(self, index: int, frames) -> DataToExport:
+        data = [DataFromPlugins(name=name, data=[frame], dim='Data2D', labels=['Intensity'])
+                for name, frame in zip(self.controller.cameras, frames)]
+        data.append(DataFromPlugins(name='Trigger', data=[np.array([index])], dim='Data0D', labels=['index']))
+        return DataToExport('TSI group', data=data)
+
+    def close(self):
+        """Stop the acquisition and close the cameras"""
+        if self.controller is not None:
+            self.controller.stop()
+            for camera in self.controller.cameras.values():
+                camera.close()
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """ Arm the cameras (if not already acquiring), the next complete triggers being emitted
+
+        Parameters
+        ----------
+        Naverage: int
+            Number of averaging, done by the viewer
+        kwargs: dict
+            live: bool, if False a single complete trigger is emitted
+        """
+        try:
+            self.is_live = kwargs.get('live', False)
+            if not self.controller.acquiring:
+                self.controller.arm(self.settings['trigger'], rate=self.settings['frame_rate'],
+                                    polarity=self.settings['polarity'],
+                                    ring_size=self.settings['pipeline', 'ring_size'],
+                                    buffer_size=self.settings['buffer_size'])
+                self._consumer_idle.set()
+            self._snap_after = None if self.is_live else self.controller.latest_complete()
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+
+    def frames_available(self, stream: CameraStream):
+        """ Called from the acquisition threads, signals the plugin if it is done with the previous frames"""
+        if self._consumer_idle.is_set():
+            self._consumer_idle.clear()
+            self.frames_ready.emit()
+
+    def emit_frames(self):
+        """ Emit the most recent complete trigger, if any"""
+        try:
+            for name, error in self.controller.errors():
+                self.emit_status(ThreadCommand('Update_Status', [f'Camera {name}: {error}', 'log']))
+            if not self.is_live and self._snap_after is None:
+                return  # no grab requested
+            matched = self.controller.match()
+            if matched is not None:
+                index, frames = matched
+                if self.is_live or index > self._snap_after:
+                    self.dte_signal.emit(self.to_dte(index, frames))
+                    if not self.is_live:
+                        self._snap_after = None
+
+            now = perf_counter()
+            if now - self._last_stats_update > 0.5:
+                self._last_stats_update = now
+                self.update_statistics()
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+        finally:
+            self._consumer_idle.set()
+
+    def update_statistics(self):
+        group = self.controller
+        self.settings.child('pipeline', 'achieved_fps').setValue(
+            round(min(stream.statistics.fps for stream in group.streams), 1))
+        self.settings.child('pipeline', 'matched').setValue(group.matched)
+        self.settings.child('pipeline', 'late').setValue(group.late)
+        self.settings.child('pipeline', 'incomplete').setValue(group.incomplete)
+        self.settings.child('pipeline', 'dropped').setValue(
+            sum(stream.statistics.dropped for stream in group.streams))
+
+    def stop(self):
+        """Stop the triggers and the acquisition of all the cameras"""
+        if self.controller is not None:
+            self.controller.stop()
+            self.update_statistics()
+        self._snap_after = None
+        return ''
+
+
+if __name__ == '__main__':
+    main(__file__, init=False)
@@ -3,10 +3,10 @@ from pymodaq.control_modules.viewer_utility_classes import comon_parameters, mai
 
 from pylablib.devices import uc480
 
-from pymodaq_plugins_utils.hardware.camera_base_pylablib import CameraBasePyLabLib, cam_params
+from pymodaq_plugins_thorlabs.hardware.camera_pipeline import CameraBaseRingBuffer
 
 
-class DAQ_2DViewer_UC480(CameraBasePyLabLib):
+class DAQ_2DViewer_UC480(CameraBaseRingBuffer):
     """
     Plugin for either Thorlabs cameras uc480type or IDS µeye.
 
@@ -34,7 +34,7 @@ class DAQ_2DViewer_UC480(CameraBasePyLabLib):
     serial_numbers = [cam_info.serial_number for cam_info in uc480.list_cameras()]
     serial_params = [{'title': 'Serial number:', 'name': 'serial_number', 'type': 'list', 'limits': serial_numbers}]
 
-    params = comon_parameters + serial_params + cam_params
+    params = comon_parameters + serial_params + CameraBaseRingBuffer.camera_params
 
     def ini_attributes(self):
         super().ini_attributes()
@@ -0,0 +1,73 @@
+"""
+Auto-exposure of the CCSXXX spectrometers.
+
+The fill level of each spectrum (its maximum, or a high percentile to ignore a few hot pixels, in fraction of the
+full scale) drives the integration time toward a target fill level:
+
+* saturated spectra (fill above the saturation level) divide the integration time by the maximum step, as the
+  actual signal level is unknown
+* otherwise the integration time is only changed when the fill level gets out of the hysteresis band
+  (target ± tolerance), by the ratio target / fill bounded to the maximum step (spectra without signal multiply it
+  by the maximum step)
+
+The integration time is kept within its bounds, the shortest one giving a usable signal being thus reached within a
+few spectra.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+auto_exposure_params = [
+    {'title': 'Auto exposure', 'name': 'auto_exposure', 'type': 'group', 'children': [
+        {'title': 'Enabled:', 'name': 'enabled', 'type': 'bool', 'value': False},
+        {'title': 'Statistic:', 'name': 'statistic', 'type': 'list', 'value': 'percentile',
+         'limits': ['max', 'percentile']},
+        {'title': 'Percentile (%):', 'name': 'percentile', 'type': 'float', 'value': 99.9, 'min': 50., 'max': 100.},
+        {'title': 'Target fill:', 'name': 'target', 'type': 'float', 'value': 0.7, 'min': 0.01, 'max': 1.},
+        {'title': 'Tolerance:', 'name': 'tolerance', 'type': 'float', 'value': 0.15, 'min': 0., 'max': 1.,
+         'tip': 'The integration time is kept while the fill level is within target ± tolerance'},
+        {'title': 'Saturation fill:', 'name': 'saturation', 'type': 'float', 'value': 0.98, 'min': 0.01, 'max': 1.},
+        {'title': 'Max step (x):', 'name': 'max_step', 'type': 'float', 'value': 10., 'min': 1.},
+        {'title': 'Min time (s):', 'name': 'min_time', 'type': 'float', 'value': 1e-5, 'min': 1e-5},
+        {'title': 'Max time (s):', 'name': 'max_time', 'type': 'float', 'value': 10., 'min': 1e-5},
+        {'title': 'Fill level:', 'name': 'fill', 'type': 'float', 'value': 0., 'readonly': True},
+    ]}]
+
+
+class AutoExposure:
+    """ Compute the integration time bringing the spectra to a target fill level (see module docstring)"""
+
+    def __init__(self):
+        self.statistic = 'percentile'
+        self.percentile = 99.9
+        self.target = 0.7
+        self.tolerance = 0.15
+        self.saturation = 0.98
+        self.max_step = 10.
+        self.min_time = 1e-5
+        self.max_time = 10.
+        self.fill = 0.
+
+    def fill_level(self, spectrum: np.ndarray, full_scale: float) -> float:
+        if self.statistic == 'max':
+            level = np.max(spectrum)
+        else:
+            level = np.percentile(spectrum, self.percentile)
+        return float(level) / full_scale
+
+    def update(self, spectrum: np.ndarray, integration_time: float, full_scale: float = 1.) -> Optional[float]:
+        """ New integration time (s) from the last spectrum, None if the current one is to be kept"""
+        self.fill = self.fill_level(spectrum, full_scale)
+        if self.fill >= self.saturation:
+            ratio = 1 / self.max_step
+        elif abs(self.fill - self.target) <= self.tolerance:
+            return None
+        elif self.fill <= 0:
+            ratio = self.max_step
+        else:
+            ratio = min(max(self.target / self.fill, 1 / self.max_step), self.max_step)
+        new_time = min(max(integration_time * ratio, self.min_time), self.max_time)
+        if np.isclose(new_time, integration_time):
+            return None
+        return new_time
@@ -0,0 +1,105 @@
+"""
+Automatic hardware ROI following the beam, to raise the frame rate of the cameras.
+
+From the centroid and D4σ widths of the beam profile analysis (see beam_profile), the AutoROI places a
+hardware ROI of margin times the beam widths centered on the beam. To avoid reconfiguring the camera at every
+frame, the ROI is only changed (and not more often than every hold time):
+
+* when the beam gets closer to an edge of the ROI than a fraction of its size: the ROI is recentered and grown
+  (doubled) along this axis, the beam being possibly clipped by the ROI
+* when the ROI is much larger than needed (the needed size is less than the shrink ratio of the current one)
+* when the beam is lost: the ROI is set back to the full frame
+
+All coordinates are in (unbinned) sensor pixels.
+"""
+from time import perf_counter
+from typing import Optional, Tuple
+
+import numpy as np
+
+from pymodaq_plugins_thorlabs.hardware.beam_profile import BeamMoments
+
+
+auto_roi_params = [
+    {'title': 'Auto ROI', 'name': 'auto_roi', 'type': 'group', 'children': [
+        {'title': 'Track the beam:', 'name': 'enabled', 'type': 'bool', 'value': False,
+         'tip': 'Needs the beam profile analysis'},
+        {'title': 'Margin (x D4σ):', 'name': 'margin', 'type': 'float', 'value': 3., 'min': 1.},
+        {'title': 'Edge fraction:', 'name': 'edge', 'type': 'float', 'value': 0.1, 'min': 0., 'max': 0.5,
+         'tip': 'The ROI is moved and grown when the beam is closer to its edge than this fraction of its size'},
+        {'title': 'Shrink ratio:', 'name': 'shrink', 'type': 'float', 'value': 0.5, 'min': 0.05, 'max': 1.,
+         'tip': 'The ROI is shrunk when the needed size is less than this ratio of the current one'},
+        {'title': 'Hold time (s):', 'name': 'hold_time', 'type': 'float', 'value': 1., 'min': 0.},
+        {'title': 'Min size (pxls):', 'name': 'min_size', 'type': 'int', 'value': 32, 'min': 1},
+        {'title': 'ROI changes:', 'name': 'n_changes', 'type': 'int', 'value': 0, 'readonly': True},
+    ]}]
+
+
+class AutoROI:
+    """ Compute the hardware ROI following the beam with hysteresis (see module docstring)
+
+    Parameters
+    ----------
+    detector_size: tuple of int
+        (width, height) of the sensor
+    """
+
+    def __init__(self, detector_size: Tuple[int, int]):
+        self.detector_size = detector_size
+        self.margin = 3.
+        self.edge = 0.1
+        self.shrink = 0.5
+        self.hold_time = 1.
+        self.min_size = 32
+        self.n_changes = 0
+        self._last_change = -np.inf
+
+    def _axis_range(self, center: float, width: float, current: Tuple[int, int], size: int,
+                    grow: bool) -> Tuple[int, int]:
+        needed = max(self.margin * width, self.min_size)
+        if grow:
+            needed = max(needed, 2 * (current[1] - current[0]))
+        needed = int(min(np.ceil(needed), size))
+        start = int(round(center - needed / 2))
+        start = min(max(start, 0), size - needed)
+        return start, start + needed
+
+    def _needs_change(self, center: float, width: float, current: Tuple[int, int], size: int) -> Tuple[bool, bool]:
+        """ Return (change, grow) for one axis"""
+        start, end = current
+        extent = end - start
+        edge = self.edge * extent
+        near_edge = (center - width / 2 < start + edge and start > 0) or \
+                    (center + width / 2 > end - edge and end < size)
+        if near_edge:
+            return True, True
+        needed = max(self.margin * width, self.min_size)
+        return needed < self.shrink * extent, False
+
+    def update(self, moments: BeamMoments, roi: Tuple[int, int, int, int],
+               now: Optional[float] = None) -> Optional[Tuple[int, int, int, int]]:
+        """ Get the new ROI (hstart, hend, vstart, vend) or None if the current one is to be kept
+
+        moments have to be converted in sensor pixels
+        """
+        now = perf_counter() if now is None else now
+        if now - self._last_change < self.hold_time:
+            return None
+        width, height = self.detector_size
+        hstart, hend, vstart, vend = roi
+        full = (0, width, 0, height)
+        values = (moments.x0, moments.y0, moments.d4sigma_x, moments.d4sigma_y)
+        if not np.all(np.isfinite(values)) or moments.d4sigma_x <= 0 or moments.d4sigma_y <= 0:
+            new_roi = full  # beam lost
+        else:
+            change_x, grow_x = self._needs_change(moments.x0, moments.d4sigma_x, (hstart, hend), width)
+            change_y, grow_y = self._needs_change(moments.y0, moments.d4sigma_y, (vstart, vend), height)
+            if not (change_x or change_y):
+                return None
+            new_roi = (self._axis_range(moments.x0, moments.d4sigma_x, (hstart, hend), width, grow_x) +
+                       self._axis_range(moments.y0, moments.d4sigma_y, (vstart, vend), height, grow_y))
+        if new_roi == tuple(roi):
+            return None
+        self._last_change = now
+        self.n_changes += 1
+        return new_roi
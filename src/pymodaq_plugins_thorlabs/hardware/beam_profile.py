@@ -0,0 +1,162 @@
+"""
+Beam profile analysis of camera frames following ISO 11146 (second order moments).
+
+For each frame the BeamAnalyzer estimates the background, then computes the centroid, the D4σ widths along
+the principal axes, the ellipticity and the orientation of the beam. The integration area is iteratively narrowed
+to a rectangle of three times the beam widths centered on the centroid (ISO 11146-3), the background being
+re-estimated from the pixels outside of it.
+
+All computations are vectorized: the first and diagonal second order moments are obtained from the projections
+of the frame on both axes, the cross moment from a single matrix-vector product.
+
+The second order moments are kept in the BeamMoments so that they can be converted to other coordinates (sensor
+pixels, µm) before being diagonalised again (BeamMoments.scaled): the principal widths cannot be obtained by
+scaling the ones along the frame axes when the pixels are not square (binning) and the beam is rotated.
+"""
+from dataclasses import dataclass, astuple, fields
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+beam_profile_params = [
+    {'title': 'Beam profile', 'name': 'beam_profile', 'type': 'group', 'children': [
+        {'title': 'Analyse frames:', 'name': 'enabled', 'type': 'bool', 'value': False,
+         'tip': 'Emit the beam moments of each frame as Data0D, frames being emitted at a reduced rate'},
+        {'title': 'Frame rate (Hz):', 'name': 'frame_rate', 'type': 'float', 'value': 2., 'min': 0.,
+         'tip': 'Rate at which the full frames are emitted along with the moments, 0 to never emit them'},
+        {'title': 'Pixel size (µm):', 'name': 'pixel_size', 'type': 'float', 'value': 1., 'min': 0.,
+         'tip': 'Positions and widths are in pixels if set to 1'},
+        {'title': 'Max iterations:', 'name': 'max_iterations', 'type': 'int', 'value': 10, 'min': 1},
+        {'title': 'Border for background (%):', 'name': 'border', 'type': 'float', 'value': 5., 'min': 0.,
+         'max': 50., 'tip': 'Initial background estimate from the frame borders'},
+    ]}]
+
+
+@dataclass
+class BeamMoments:
+    """ ISO 11146 beam parameters, positions and widths in pixels of the analysed frame"""
+    x0: float = np.nan
+    y0: float = np.nan
+    d4sigma_x: float = np.nan  # along the principal axis closest to x
+    d4sigma_y: float = np.nan
+    ellipticity: float = np.nan  # d_min / d_max
+    orientation: float = np.nan  # angle (degrees) between the x axis and the principal axis
+    background: float = np.nan
+    iterations: int = 0
+    sxx: float = np.nan  # second order moments
+    syy: float = np.nan
+    sxy: float = np.nan
+
+    @classmethod
+    def names(cls) -> List[str]:
+        return [field.name for field in fields(cls)]
+
+    def to_array(self) -> np.ndarray:
+        return np.array(astuple(self), dtype=float)
+
+    def scaled(self, x_offset: float = 0., x_scaling: float = 1., y_offset: float = 0.,
+               y_scaling: float = 1.) -> 'BeamMoments':
+        """ The moments in the coordinates x_offset + x_scaling * x, y_offset + y_scaling * y
+
+        The second order moments are converted first, the widths, ellipticity and orientation being computed
+        from them in the new coordinates.
+        """
+        beam = moments_to_beam(x_offset + x_scaling * self.x0, y_offset + y_scaling * self.y0,
+                               self.sxx * x_scaling ** 2, self.syy * y_scaling ** 2,
+                               self.sxy * x_scaling * y_scaling)
+        beam.background = self.background
+        beam.iterations = self.iterations
+        return beam
+
+
+def border_background(frame: np.ndarray, border: float = 0.05) -> float:
+    """ Mean of the pixels within a border (in fraction of the frame size) of the frame"""
+    height, width = frame.shape
+    by, bx = max(1, int(height * border)), max(1, int(width * border))
+    pixels = np.concatenate((frame[:by].ravel(), frame[-by:].ravel(),
+                             frame[by:-by, :bx].ravel(), frame[by:-by, -bx:].ravel()))
+    return float(np.mean(pixels))
+
+
+def second_moments(frame: np.ndarray, background: float = 0.,
+                   window: Tuple[slice, slice] = (slice(None), slice(None))) -> Optional[tuple]:
+    """ Centroid and second order moments (x0, y0, sxx, syy, sxy) of the background subtracted frame within window
+
+    Return None if the integrated intensity is not positive.
+    """
+    data = frame[window].astype(np.float64)
+    data -= background
+    total = data.sum()
+    if total <= 0:
+        return None
+    y = np.arange(frame.shape[0])[window[0]]
+    x = np.arange(frame.shape[1])[window[1]]
+    px = data.sum(axis=0)
+    py = data.sum(axis=1)
+    x0 = px @ x / total
+    y0 = py @ y / total
+    dx = x - x0
+    dy = y - y0
+    sxx = px @ dx ** 2 / total
+    syy = py @ dy ** 2 / total
+    sxy = dy @ (data @ dx) / total
+    return x0, y0, sxx, syy, sxy
+
+
+def moments_to_beam(x0, y0, sxx, syy, sxy) -> BeamMoments:
+    """ ISO 11146 widths, ellipticity and orientation from the second order moments"""
+    if not np.all(np.isfinite((sxx, syy, sxy))):
+        return BeamMoments(x0, y0)
+    diff = sxx - syy
+    root = np.sqrt(diff ** 2 + 4 * sxy ** 2)
+    gamma = np.sign(diff) if diff != 0 else 1.
+    dx = 2 * np.sqrt(2) * np.sqrt(max(sxx + syy + gamma * root, 0.))
+    dy = 2 * np.sqrt(2) * np.sqrt(max(sxx + syy - gamma * root, 0.))
+    orientation = 0.5 * np.degrees(np.arctan2(2 * sxy, diff)) if root > 0 else 0.
+    ellipticity = min(dx, dy) / max(dx, dy) if max(dx, dy) > 0 else np.nan
+    return BeamMoments(x0, y0, dx, dy, ellipticity, orientation, sxx=sxx, syy=syy, sxy=sxy)
+
+
+class BeamAnalyzer:
+    """ Iterative ISO 11146 analysis of frames (see module docstring)
+
+    Frames without a beam (non positive second order moments once the background is subtracted, or an
+    integration window collapsing outside of the frame) give NaN moments.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.max_iterations = 10
+        self.border = 0.05
+
+    def analyze(self, frame: np.ndarray) -> BeamMoments:
+        height, width = frame.shape[-2:]
+        frame = frame.reshape((height, width))
+        background = border_background(frame, self.border)
+        window = (slice(0, height), slice(0, width))
+        beam = BeamMoments(background=background)
+        for iteration in range(1, self.max_iterations + 1):
+            moments = second_moments(frame, background, window)
+            if moments is None:
+                break
+            x0, y0, sxx, syy, _ = moments
+            if not np.all(np.isfinite(moments)) or sxx <= 0 or syy <= 0:  # no beam, only (subtracted) noise
+                return BeamMoments(background=background, iterations=iteration)
+            beam = moments_to_beam(*moments)
+            beam.background = background
+            beam.iterations = iteration
+            half_x = 3 * 2 * np.sqrt(sxx)  # 3 times the D4σ width along x
+            half_y = 3 * 2 * np.sqrt(syy)
+            new_window = (slice(max(0, int(np.floor(y0 - half_y))), min(height, int(np.ceil(y0 + half_y)) + 1)),
+                          slice(max(0, int(np.floor(x0 - half_x))), min(width, int(np.ceil(x0 + half_x)) + 1)))
+            if new_window[0].stop <= new_window[0].start or new_window[1].stop <= new_window[1].start:
+                return BeamMoments(background=background, iterations=iteration)
+            if new_window == window:
+                break
+            window = new_window
+            outside = height * width - (window[0].stop - window[0].start) * (window[1].stop - window[1].start)
+            if outside > 0:
+                inside_sum = frame[window].sum(dtype=np.float64)
+                background = (frame.sum(dtype=np.float64) - inside_sum) / outside
+        return beam
@@ -0,0 +1,289 @@
+"""
+Synchronized acquisition of a group of TSI cameras opened in the same process.
+
+All the cameras of a CameraGroup acquire one frame per trigger, either:
+
+* software: the cameras are armed without being started, then a trigger thread sends a software trigger to all of
+  them, back to back, at the group frame rate
+* hardware: the cameras are armed in external trigger mode and wait for the (shared) trigger line
+
+Each camera is read by its own CameraStream: an acquisition thread copying its frames into its own FrameRing
+(see camera_pipeline) along with the index of the trigger they answer to (from the camera frame counter). A slow
+camera thus never stalls the others, it only delays the matching. The group matches frames by trigger index: a
+trigger is complete once every camera has its frame in its ring. Triggers whose frame has been dropped (or already
+overwritten in the ring) by one of the cameras are counted as incomplete and skipped, complete triggers not emitted
+because a more recent one was already complete are counted as late.
+"""
+import threading
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.hardware.camera_pipeline import FrameRing, FrameStatistics
+
+logger = set_logger(get_module_name(__file__))
+
+
+class CameraStream:
+    """ Acquisition thread of one camera of the group, reading its frames into its own FrameRing
+
+    Parameters
+    ----------
+    name: str
+        name of the camera (its serial number)
+    camera: pylablib camera
+        the (opened) camera, its frame format being set to chunks
+    ring_size: int
+        number of frames kept in the ring
+    on_frames: callable
+        called from the acquisition thread with the stream each time new frames have been read
+    """
+
+    def __init__(self, name: str, camera, ring_size: int, on_frames: Callable[['CameraStream'], None] = None):
+        self.name = name
+        self.camera = camera
+        self.ring_size = ring_size
+        self.ring: Optional[FrameRing] = None
+        self.counters = np.full((ring_size,), -1, dtype=np.int64)
+        self.statistics = FrameStatistics()
+        self.on_frames = on_frames
+        self.error: Optional[Exception] = None
+        self._next_frame = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def latest(self) -> int:
+        """ Trigger index of the newest frame, -1 if none"""
+        return int(self.counters[(self.ring.count - 1) % self.ring_size]) if self.ring is not None and \
+            self.ring.count > 0 else -1
+
+    def reset(self, ring_size: Optional[int] = None):
+        """ To be called (thread stopped) before arming the camera"""
+        if ring_size is not None and ring_size != self.ring_size:
+            self.ring_size = ring_size
+            self.ring = None
+        self.counters = np.full((self.ring_size,), -1, dtype=np.int64)
+        if self.ring is not None:
+            self.ring.count = 0
+        self._next_frame = 0
+        self.error = None
+        self.statistics.reset()
+
+    def start(self):
+        if not self.active:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._read_loop, name=f'CameraStream {self.name}', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def frame(self, index: int) -> Optional[np.ndarray]:
+        """ View on the frame answering the given trigger index, None if not (or no more) in the ring"""
+        if self.ring is None:
+            return None
+        slots = np.flatnonzero(self.counters == index)
+        if slots.size == 0:
+            return None
+        return self.ring.frames[slots[0]]
+
+    def oldest(self) -> int:
+        """ Trigger index of the oldest frame still in the ring, -1 if none"""
+        valid = self.counters[self.counters >= 0]
+        return int(valid.min()) if valid.size > 0 else -1
+
+    @staticmethod
+    def trigger_indexes(info: np.ndarray) -> np.ndarray:
+        """ Trigger indexes of a chunk of frames from their info array (frame_index, framestamp, ...)
+
+        The camera frame counter (framestamp, starting at 1 once armed) is used when available: unlike the pylablib
+        frame index it is not shifted by the triggers the camera missed.
+        """
+        if info.shape[1] > 1 and np.all(info[:, 1] > 0):
+            return info[:, 1].astype(np.int64) - 1
+        return info[:, 0].astype(np.int64)
+
+    def read_frames(self) -> int:
+        """ Read the new frames from the pylablib buffer into the ring, return the number of frames read"""
+        chunks, infos, rng = self.camera.read_multiple_images(missing_frame='skip', return_info=True,
+                                                              return_rng=True)
+        if chunks is None or len(chunks) == 0:
+            return 0
+        if isinstance(chunks, np.ndarray):
+            chunks, infos = [chunks], [infos]
+        now = perf_counter()
+        if rng[0] > self._next_frame:
+            self.statistics.dropped += rng[0] - self._next_frame
+        self._next_frame = rng[1]
+        n_frames = 0
+        for chunk, info in zip(chunks, infos):
+            if chunk.ndim == 2:
+                chunk, info = chunk[np.newaxis], np.atleast_2d(info)
+            if self.ring is None or not self.ring.matches(chunk.shape[1:], chunk.dtype):
+                self.ring = FrameRing(self.ring_size, chunk.shape[1:], chunk.dtype)
+                self.counters[:] = -1
+            indexes = self.trigger_indexes(info)
+            n = chunk.shape[0]
+            if n > self.ring_size:  # only the newest frames fit in the ring
+                chunk, indexes = chunk[-self.ring_size:], indexes[-self.ring_size:]
+            slots = np.arange(self.ring.count, self.ring.count + chunk.shape[0]) % self.ring_size
+            self.counters[slots] = -1  # invalidated while being overwritten
+            self.ring.write(chunk, now)
+            self.counters[slots] = indexes
+            n_frames += n
+        self.statistics.add_frames(n_frames, now)
+        return n_frames
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                if not self.camera.wait_for_frame(since='lastread', nframes=1, timeout=(None, 0.2)):
+                    self._stop.wait(0.01)  # not armed yet
+                    continue
+                if self.read_frames() > 0 and self.on_frames is not None:
+                    self.on_frames(self)
+            except self.camera.TimeoutError:
+                pass
+            except Exception as e:
+                logger.exception(f'Camera {self.name}: {e}')
+                self.error = e
+                if self.on_frames is not None:
+                    self.on_frames(self)
+                break
+
+
+class SoftwareTrigger:
+    """ Thread sending software triggers to all the cameras at a given rate"""
+
+    def __init__(self, cameras: List, rate: float):
+        self.cameras = cameras
+        self.period = 1 / rate if rate > 0 else 0.
+        self.n_triggers = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._trigger_loop, name='SoftwareTrigger', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _trigger_loop(self):
+        next_trigger = perf_counter()
+        while not self._stop.is_set():
+            for camera in self.cameras:
+                camera.send_software_trigger()
+            self.n_triggers += 1
+            next_trigger += self.period
+            self._stop.wait(max(next_trigger - perf_counter(), 0.))
+
+
+class CameraGroup:
+    """ Synchronized acquisition of several cameras, frames being matched by trigger index (see module docstring)
+
+    Parameters
+    ----------
+    cameras: dict
+        the opened cameras by name (serial number)
+    ring_size: int
+        number of frames kept in each camera ring
+    on_frames: callable
+        called from the acquisition threads each time a camera has read new frames
+    """
+
+    def __init__(self, cameras: Dict[str, object], ring_size: int = 32,
+                 on_frames: Callable[[CameraStream], None] = None):
+        self.cameras = cameras
+        self.streams = [CameraStream(name, camera, ring_size, on_frames) for name, camera in cameras.items()]
+        self.trigger: Optional[SoftwareTrigger] = None
+        self.matched = 0
+        self.late = 0
+        self.incomplete = 0
+        self.next_index = 0  # lowest trigger index not yet matched or skipped
+
+    @property
+    def acquiring(self) -> bool:
+        return any(stream.active for stream in self.streams)
+
+    def arm(self, mode: str = 'software', rate: float = 10., polarity: str = 'rise', ring_size: int = 32,
+            buffer_size: int = 100):
+        """ Arm all the cameras for one frame per trigger and start their acquisition threads
+
+        In software mode the triggers are then sent at the given rate, in hardware mode the cameras wait for the
+        external trigger with the given polarity.
+        """
+        self.stop()
+        self.matched = 0
+        self.late = 0
+        self.incomplete = 0
+        self.next_index = 0
+        for stream in self.streams:
+            camera = stream.camera
+            camera.clear_acquisition()
+            if mode == 'hardware':
+                camera.set_trigger_mode('ext')
+                camera.setup_ext_trigger(polarity)
+            else:
+                camera.set_trigger_mode('int')
+            camera.start_acquisition(frames_per_trigger=1, auto_start=False, nframes=buffer_size)
+            stream.reset(ring_size)
+            stream.start()
+        if mode == 'software':
+            self.trigger = SoftwareTrigger([stream.camera for stream in self.streams], rate)
+            self.trigger.start()
+
+    def stop(self):
+        """ Stop the triggers, the acquisition threads and the cameras"""
+        if self.trigger is not None:
+            self.trigger.stop()
+            self.trigger = None
+        for stream in self.streams:
+            stream.stop()
+        for stream in self.streams:
+            stream.camera.stop_acquisition()
+
+    def errors(self) -> List[Tuple[str, Exception]]:
+        return [(stream.name, stream.error) for stream in self.streams if stream.error is not None]
+
+    def latest_complete(self) -> int:
+        """ Highest trigger index every camera has acquired, -1 if none"""
+        return min(stream.latest for stream in self.streams) if self.streams else -1
+
+    def match(self) -> Optional[Tuple[int, List[np.ndarray]]]:
+        """ Get the most recent complete trigger not matched yet: its index and one frame view per camera
+
+        The older triggers not matched yet are skipped: counted as late if complete, as incomplete otherwise.
+        Return None if no new trigger is complete.
+        """
+        newest = self.latest_complete()
+        if newest < self.next_index:
+            return None
+        oldest = max([self.next_index] + [stream.oldest() for stream in self.streams])
+        self.incomplete += max(oldest - self.next_index, 0)  # already overwritten in a ring
+        found = None
+        for index in range(newest, oldest - 1, -1):
+            frames = [stream.frame(index) for stream in self.streams]
+            complete = all(frame is not None for frame in frames)
+            if complete and found is None:
+                found = index, frames
+            elif complete:
+                self.late += 1
+            else:
+                self.incomplete += 1
+        self.next_index = newest + 1
+        if found is not None:
+            self.matched += 1
+        return found
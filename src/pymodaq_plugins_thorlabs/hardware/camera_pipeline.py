@@ -0,0 +1,617 @@
+"""
+Ring buffered acquisition of pylablib camera frames (TSI and UC480 cameras).
+
+Instead of starting an acquisition and allocating new arrays for each grab, the camera runs a continuous
+sequence acquisition (pylablib buffered mode) read by a worker thread. The frames are copied, in their native
+dtype (uint16 for the sCMOS), into a preallocated FrameRing and the plugin is only notified of the index of
+the newest frame. Data are then emitted as views on the ring slots, without any further copy nor conversion.
+
+Frame statistics are reported in the plugin settings:
+
+* dropped: frames lost by the camera driver (overwritten in the pylablib buffer before being read)
+* late: frames stored in the ring but never emitted, because the plugin was still processing a previous one
+* achieved fps: rate of the frames read from the camera
+
+Note that emitted frames are views on the ring: they stay valid for ring size frames only, consumers keeping
+them longer (data saving, accumulation...) have to copy them.
+
+When accumulation or corrections are enabled (see frame_processing), every frame is also fed by the worker to a
+FrameProcessor and only its finished results are emitted.
+
+When the beam profile analysis is enabled (see beam_profile), the worker analyses every frame (or processor
+result) and its ISO 11146 moments are emitted as Data0D, full frames being emitted along at a reduced rate only.
+The moments can also drive a hardware ROI following the beam (see auto_roi).
+
+While recording (see frame_recorder), every frame written in the ring is also queued to the writer thread of a
+FrameRecorder and the plugin only emits a preview of the frames at a reduced rate.
+"""
+import threading
+from collections import deque
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Optional, Tuple
+
+import numpy as np
+from qtpy import QtCore, QtWidgets
+
+from pymodaq_data import DataToExport
+from pymodaq_utils.logger import set_logger, get_module_name
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq.utils.data import DataFromPlugins
+
+from pymodaq.control_modules.viewer_utility_classes import comon_parameters
+
+from pymodaq_plugins_utils.hardware.camera_base_pylablib import CameraBasePyLabLib, Grab, cam_params
+
+from pymodaq_plugins_thorlabs.hardware.frame_processing import FrameProcessor, processing_params
+from pymodaq_plugins_thorlabs.hardware.beam_profile import BeamAnalyzer, BeamMoments, beam_profile_params
+from pymodaq_plugins_thorlabs.hardware.auto_roi import AutoROI, auto_roi_params
+from pymodaq_plugins_thorlabs.hardware.frame_recorder import FrameRecorder, recording_params
+
+logger = set_logger(get_module_name(__file__))
+
+
+pipeline_params = [
+    {'title': 'Pipeline', 'name': 'pipeline', 'type': 'group', 'children': [
+        {'title': 'Ring size (frames):', 'name': 'ring_size', 'type': 'int', 'value': 32, 'min': 2},
+        {'title': 'Achieved FPS:', 'name': 'achieved_fps', 'type': 'float', 'value': 0., 'readonly': True},
+        {'title': 'Dropped frames:', 'name': 'dropped', 'type': 'int', 'value': 0, 'readonly': True},
+        {'title': 'Late frames:', 'name': 'late', 'type': 'int', 'value': 0, 'readonly': True},
+        {'title': 'Reset statistics:', 'name': 'reset_stats', 'type': 'bool_push', 'value': False,
+         'label': 'Reset'},
+    ]}]
+
+
+class FrameRing:
+    """ Preallocated ring of frames written by a single producer
+
+    Frames are identified by their (ever increasing) index, frame ``index`` being stored in slot
+    ``index % size``. A frame is valid as long as less than size frames have been written after it.
+
+    The write sequence counter is incremented before and after each write (seqlock, odd while a write is in
+    progress) so that readers from other threads can detect a copy torn by a concurrent write (see copy_frame).
+    """
+
+    def __init__(self, size: int, shape: Tuple[int, ...], dtype=np.uint16):
+        self.size = size
+        self.frames = np.empty((size,) + tuple(shape), dtype=dtype)
+        self.timestamps = np.zeros((size,))
+        self.count = 0  # number of frames written so far, the newest one has index count - 1
+        self.sequence = 0  # write sequence counter, odd while a write is in progress
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.frames.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.frames.dtype
+
+    def matches(self, shape: Tuple[int, ...], dtype) -> bool:
+        return self.shape == tuple(shape) and self.dtype == np.dtype(dtype)
+
+    def write(self, frames: np.ndarray, timestamp: float):
+        """ Copy a chunk of frames (n, ...) in the ring"""
+        self.sequence += 1
+        try:
+            n = frames.shape[0]
+            if n > self.size:
+                frames = frames[-self.size:]
+                self.count += n - self.size
+                n = self.size
+            start = self.count % self.size
+            first = min(n, self.size - start)
+            np.copyto(self.frames[start:start + first], frames[:first])
+            if first < n:
+                np.copyto(self.frames[:n - first], frames[first:])
+            self.timestamps[np.arange(self.count, self.count + n) % self.size] = timestamp
+            self.count += n
+        finally:
+            self.sequence += 1
+
+    def is_valid(self, index: int) -> bool:
+        return self.count - self.size <= index < self.count
+
+    def copy_frame(self, index: int, out: np.ndarray, retries: int = 3) -> bool:
+        """ Copy the frame with the given index into out from another thread than the writer one
+
+        The copy is retried while it overlaps a write (the write sequence changed meanwhile) and the frame is
+        still valid. Returns False if the frame has been overwritten or no copy could be made without overlap.
+        """
+        for _ in range(retries + 1):
+            sequence = self.sequence
+            if not self.is_valid(index):
+                return False
+            if sequence % 2 == 0:
+                np.copyto(out, self.frames[index % self.size])
+                if self.sequence == sequence:
+                    return True
+            sleep(0)  # let the writer finish
+        return False
+
+    def frame(self, index: int) -> np.ndarray:
+        """ View on the frame with the given index"""
+        return self.frames[index % self.size]
+
+    def last(self, n: int = 1) -> np.ndarray:
+        """ Copy of the n newest frames, as a (n, ...) array"""
+        n = min(n, self.size, self.count)
+        return self.frames[np.arange(self.count - n, self.count) % self.size]
+
+
+class FrameStatistics:
+    """ Dropped/late frames counters and achieved frame rate over a sliding window"""
+
+    def __init__(self, window: float = 1.):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.acquired = 0
+        self.dropped = 0
+        self.late = 0
+        self._ticks = deque()
+
+    def add_frames(self, n: int, timestamp: float):
+        self.acquired += n
+        self._ticks.append((timestamp, n))
+        while self._ticks and self._ticks[0][0] < timestamp - self.window:
+            self._ticks.popleft()
+
+    @property
+    def fps(self) -> float:
+        if len(self._ticks) < 2:
+            return 0.
+        duration = self._ticks[-1][0] - self._ticks[0][0]
+        return sum(n for _, n in list(self._ticks)[1:]) / duration if duration > 0 else 0.
+
+
+class RingCameraCallback(QtCore.QObject):
+    """ Worker reading the pylablib buffer into the FrameRing, living in the callback thread
+
+    The ring is (re)allocated by the worker when the shape or dtype of the frames change. Only the index of the
+    newest frame is signaled, and only when the plugin has processed the previous one.
+    """
+    frame_ready = QtCore.Signal(int)
+    result_ready = QtCore.Signal(object)
+    moments_ready = QtCore.Signal(object, object)  # BeamMoments and the frame index in the ring or the frame
+    error = QtCore.Signal()
+
+    def __init__(self, controller, ring_size: int, statistics: FrameStatistics, processor: FrameProcessor,
+                 analyzer: BeamAnalyzer):
+        super().__init__()
+        self.controller = controller
+        self.ring_size = ring_size
+        self.ring: Optional[FrameRing] = None
+        self.statistics = statistics
+        self.processor = processor
+        self.analyzer = analyzer
+        self.processing = True  # False if frames have to be color converted
+        self.do_acquisition = True
+        self.consumer_idle = threading.Event()
+        self.consumer_idle.set()
+        self._next_frame = 0
+        self._mode = Grab()
+        self._to_read = 1
+        self._acquiring = False
+        self.recorder: Optional[FrameRecorder] = None
+        self._recording_request: Optional[dict] = None
+        self.preview_period = 0.
+        self._last_preview = 0.
+
+    def set_do_grab(self, mode: Grab):
+        """ Start, update or stop the acquisition loop
+
+        A new mode received (through processEvents) while the loop is running updates it instead of starting a
+        nested loop.
+        """
+        self.do_acquisition = mode.do_acquisition
+        if mode.do_acquisition:
+            self._mode = mode
+            self._to_read = mode.n_average
+            if mode.snap:
+                self.processor.reset()
+            if not self._acquiring:
+                self.wait_for_acquisition()
+
+    def reset(self, ring_size: Optional[int] = None):
+        """ To be called before starting a new acquisition"""
+        if ring_size is not None and ring_size != self.ring_size:
+            self.ring_size = ring_size
+            self.ring = None
+        self._next_frame = 0
+        self.consumer_idle.set()
+
+    def start_recording(self, preview_rate: float, **recorder_kwargs):
+        """ Record the next frames, the FrameRecorder being created with the ring (see FrameRecorder)"""
+        self.preview_period = 1 / preview_rate if preview_rate > 0 else np.inf
+        self._recording_request = recorder_kwargs
+
+    def stop_recording(self):
+        self._recording_request = None
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.stop(wait=False)
+
+    @property
+    def recording(self) -> bool:
+        return self.recorder is not None and self.recorder.active
+
+    def preview_due(self) -> bool:
+        """ True if a frame can be emitted: always when not recording, at the preview rate otherwise"""
+        if not self.recording:
+            return True
+        now = perf_counter()
+        if now - self._last_preview >= self.preview_period:
+            self._last_preview = now
+            return True
+        return False
+
+    def read_frames(self) -> int:
+        """ Read the new frames from the pylablib buffer into the ring, return the number of frames read"""
+        chunks, rng = self.controller.read_multiple_images(missing_frame='skip', return_rng=True)
+        if chunks is None or len(chunks) == 0:
+            return 0
+        if isinstance(chunks, np.ndarray):
+            chunks = [chunks]
+        now = perf_counter()
+        if rng[0] > self._next_frame:
+            self.statistics.dropped += rng[0] - self._next_frame
+        self._next_frame = rng[1]
+        n_frames = 0
+        for chunk in chunks:
+            if chunk.ndim == 2:
+                chunk = chunk[np.newaxis]
+            if self.ring is None or not self.ring.matches(chunk.shape[1:], chunk.dtype):
+                self.ring = FrameRing(self.ring_size, chunk.shape[1:], chunk.dtype)
+                if self.recorder is not None:  # frames of another shape cannot be written in the same file
+                    self.stop_recording()
+            if self._recording_request is not None:
+                self.recorder = FrameRecorder(ring=self.ring, **self._recording_request)
+                self._recording_request = None
+            self.ring.write(chunk, now)
+            if self.recording:
+                self.recorder.submit(self.ring.count - chunk.shape[0],
+                                     range(rng[0] + n_frames, rng[0] + n_frames + chunk.shape[0]), now)
+            if self.processing and self.processor.enabled:
+                self.processor.add(chunk)
+            elif self.processing and self.analyzer.enabled:
+                first_index = self.ring.count - chunk.shape[0]
+                for ind, frame in enumerate(chunk):
+                    self.moments_ready.emit(self.analyzer.analyze(frame), first_index + ind)
+            n_frames += chunk.shape[0]
+        self.statistics.add_frames(n_frames, now)
+        return n_frames
+
+    def wait_for_acquisition(self):
+        self._acquiring = True
+        while self.do_acquisition:
+            try:
+                if not self.controller.wait_for_frame(since='lastread', nframes=1, timeout=(None, 1.)):
+                    # acquisition stopped: wait for it to be restarted (ROI change) or for the loop to be stopped
+                    QtCore.QThread.msleep(10)
+                    QtWidgets.QApplication.processEvents()
+                    continue
+                self._to_read -= self.read_frames()
+                if self.processing and self.processor.enabled:
+                    result = self.processor.pop_result()
+                    if result is not None:
+                        if self.analyzer.enabled:
+                            self.moments_ready.emit(self.analyzer.analyze(result), result)
+                        else:
+                            self.result_ready.emit(result)
+                        if self._mode.snap:
+                            break
+                elif self.ring is not None and (not self._mode.snap or self._to_read <= 0):
+                    if self.processing and self.analyzer.enabled:
+                        pass  # moments already emitted while reading the frames
+                    elif self.consumer_idle.is_set() and self.preview_due():
+                        self.consumer_idle.clear()
+                        self.frame_ready.emit(self.ring.count - 1)
+                    if self._mode.snap:
+                        break
+            except self.controller.TimeoutError:
+                pass
+            except Exception as e:
+                logger.exception(str(e))
+                self.error.emit()
+                break
+            QtWidgets.QApplication.processEvents()
+        self._acquiring = False
+
+
+class CameraBaseRingBuffer(CameraBasePyLabLib):
+    """ Camera plugin base using a continuous buffered acquisition and a FrameRing (see module docstring)
+
+    Frames are emitted in the native dtype of the camera, unless averaging, corrections or color conversion are
+    requested. Averaging (from the viewer or the processing settings) and corrections are done by a FrameProcessor
+    on grayscale frames only.
+
+    Dropped and late frames as well as the achieved frame rate are reported in the Pipeline settings. Frames can be
+    accumulated, dark and flat corrected in the plugin, see the Processing settings. In beam profile mode, the
+    ISO 11146 beam moments of each frame are emitted as Data0D and the hardware ROI can automatically follow the
+    beam (Auto ROI settings), raising the frame rate. Long sequences can be streamed to disk from the ring buffer
+    (Recording settings), only a decimated preview being emitted meanwhile.
+
+    The camera plugins build their params as comon_parameters + their serial_params + camera_params.
+    """
+    camera_params = (cam_params + pipeline_params + processing_params + beam_profile_params + auto_roi_params +
+                     recording_params)
+    params = comon_parameters + CameraBasePyLabLib.serial_params + camera_params
+
+    recording_done = QtCore.Signal(object)
+
+    def ini_attributes(self):
+        super().ini_attributes()
+        self.statistics = FrameStatistics()
+        self.processor = FrameProcessor()
+        self.analyzer = BeamAnalyzer()
+        self.auto_roi: Optional[AutoROI] = None
+        self._last_full_frame = 0.
+        self._last_emitted = -1
+        self._last_stats_update = 0.
+
+    @property
+    def ring(self) -> Optional[FrameRing]:
+        return self.callback_thread.callback.ring if self.callback_thread is not None else None
+
+    def commit_settings(self, param):
+        if self.settings.childPath(param)[0] == 'processing':
+            self.commit_processing_settings(param)
+        elif self.settings.childPath(param)[0] == 'recording':
+            if param.name() == 'start' and param.value():
+                param.setValue(False)
+                self.start_recording()
+            elif param.name() == 'stop' and param.value():
+                param.setValue(False)
+                self.callback_thread.callback.stop_recording()
+        elif self.settings.childPath(param)[0] == 'beam_profile':
+            if param.name() == 'enabled':
+                self.analyzer.enabled = param.value()
+            elif param.name() == 'max_iterations':
+                self.analyzer.max_iterations = param.value()
+            elif param.name() == 'border':
+                self.analyzer.border = param.value() / 100
+        elif self.settings.childPath(param)[0] == 'auto_roi':
+            if param.name() in ('margin', 'edge', 'shrink', 'hold_time', 'min_size'):
+                setattr(self.auto_roi, param.name(), param.value())
+        elif param.name() == 'ring_size':
+            self.stop()
+        elif param.name() == 'reset_stats':
+            if param.value():
+                self.reset_statistics()
+                param.setValue(False)
+        else:
+            super().commit_settings(param)
+
+    def commit_processing_settings(self, param):
+        processor = self.processor
+        if param.name() == 'n_accumulate':
+            processor.n_accumulate = max(param.value(), self.Naverage)
+            processor.reset()
+        elif param.name() == 'accumulator':
+            processor.accumulator_dtype = np.dtype(param.value()).type
+        elif param.name() == 'sigma_clip':
+            processor.clip = param.value()
+        elif param.name() == 'sigma':
+            processor.sigma = param.value()
+        elif param.parent().name() in ('dark', 'flat'):
+            name = param.parent().name()
+            if param.name() == 'use':
+                setattr(processor, f'use_{name}', param.value())
+            elif param.name() == 'record':
+                if param.value():
+                    processor.record(name)
+                    param.setValue(False)
+            elif param.name() == 'path':
+                if param.value() and Path(param.value()).is_file():
+                    processor.load(name, param.value())
+                    self.settings.child('processing', name, 'recorded').setValue(True)
+
+    def recorded(self, name: str):
+        """ Update the settings once the processor has recorded the dark or flat frame"""
+        self.settings.child('processing', name, 'recorded').setValue(True)
+        path = self.settings['processing', name, 'path']
+        if path:
+            self.processor.save(name, path)
+        self.emit_status(ThreadCommand('Update_Status', [f'{name.capitalize()} frame recorded']))
+
+    def reset_statistics(self):
+        self.statistics.reset()
+        self.update_statistics()
+
+    def update_statistics(self):
+        self.settings.child('pipeline', 'achieved_fps').setValue(round(self.statistics.fps, 1))
+        self.settings.child('pipeline', 'dropped').setValue(self.statistics.dropped)
+        self.settings.child('pipeline', 'late').setValue(self.statistics.late)
+        recorder = self.callback_thread.callback.recorder if self.callback_thread is not None else None
+        if recorder is not None:
+            self.settings.child('recording', 'written').setValue(recorder.written)
+            self.settings.child('recording', 'lost').setValue(recorder.lost)
+
+    def start_recording(self):
+        """ Record the next frames to disk, starting a live acquisition if none is running"""
+        if not self.settings['recording', 'path']:
+            self.emit_status(ThreadCommand('Update_Status', ['No file selected for the recording', 'log']))
+            return
+        callback = self.callback_thread.callback
+        if callback.recording:
+            return
+        metadata = dict(camera=self.settings['camera_name'],
+                        roi=self.controller.get_roi(),
+                        exposure_s=self.controller.get_exposure())
+        callback.start_recording(self.settings['recording', 'preview_rate'],
+                                 path=self.settings['recording', 'path'],
+                                 n_frames=self.settings['recording', 'n_frames'],
+                                 metadata=metadata,
+                                 on_finished=self.recording_done.emit)
+        self.settings.child('recording', 'recording').setValue(True)
+        if not self.controller.acquisition_in_progress():
+            self.grab_data(self.Naverage, live=True)
+
+    def recording_finished(self, recorder: FrameRecorder):
+        self.settings.child('recording', 'recording').setValue(False)
+        self.settings.child('recording', 'written').setValue(recorder.written)
+        self.settings.child('recording', 'lost').setValue(recorder.lost)
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Recorded {recorder.written} frames in {recorder.path} ({recorder.lost} lost)', 'log']))
+
+    def ini_detector(self, controller=None):
+        info, initialized = super().ini_detector(controller)
+        self.controller.set_frame_format('chunks')  # frames read as 3D chunks, copied once into the ring
+        self.auto_roi = AutoROI(self.controller.get_detector_size())
+        for name in ('margin', 'edge', 'shrink', 'hold_time', 'min_size'):
+            setattr(self.auto_roi, name, self.settings['auto_roi', name])
+        return info, initialized
+
+    def setup_callback_thread(self):
+        callback = RingCameraCallback(self.controller, self.settings['pipeline', 'ring_size'], self.statistics,
+                                      self.processor, self.analyzer)
+        self.settings.child('buffer', 'mode').setReadonly(True)
+
+        self.callback_thread = QtCore.QThread(self)
+        callback.moveToThread(self.callback_thread)
+        callback.frame_ready.connect(self.emit_frame)
+        callback.result_ready.connect(self.emit_result)
+        callback.moments_ready.connect(self.emit_moments)
+        self.recording_done.connect(self.recording_finished)
+        callback.error.connect(self.handle_error)
+
+        self.callback_signal.connect(callback.set_do_grab)
+        self.callback_thread.callback = callback
+        self.callback_thread.start()
+
+        self._prepare_view()
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """ Start (if needed) the continuous sequence acquisition and the worker reading it"""
+        try:
+            self.is_live = kwargs.get('live', False)
+            self.Naverage = Naverage
+            self.n_frames = 1
+            self.processor.n_accumulate = max(self.settings['processing', 'n_accumulate'], Naverage)
+            self.callback_thread.callback.processing = self.settings['color_conversion'] in (None, 'None')
+
+            if not self.controller.acquisition_in_progress():
+                self.controller.clear_acquisition()
+                self.callback_thread.callback.reset(max(self.settings['pipeline', 'ring_size'], Naverage))
+                self._last_emitted = -1
+                self.controller.start_acquisition(nframes=max(self.settings['buffer', 'size'], Naverage))
+            self.callback_signal.emit(Grab(do_acquisition=True,
+                                           snap=not self.is_live,
+                                           n_average=Naverage,
+                                           nframes=self.n_frames,
+                                           since='lastread'))
+
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), "log"]))
+
+    def emit_frame(self, index: int):
+        """ Emit the frame with the given index (color converted and averaged with the previous ones if asked)"""
+        try:
+            if self._last_emitted >= 0 and index > self._last_emitted + 1 and \
+                    not self.callback_thread.callback.recording:  # decimated preview while recording
+                self.statistics.late += index - self._last_emitted - 1
+            self._last_emitted = index
+            ring = self.ring
+
+            if self.settings['color_conversion'] not in (None, 'None'):
+                self.emit_data(ring.last(self.Naverage)[:, np.newaxis])
+            else:
+                frame = ring.frame(index)
+                self.dte_signal.emit(
+                    DataToExport('Camera',
+                                 data=[DataFromPlugins(name='Camera',
+                                                       data=[frame],
+                                                       dim=self.data_shape,
+                                                       labels=['Intensity'],
+                                                       axes=[self.y_axis, self.x_axis])]))
+                if self.settings['timing_opts', 'fps_on']:
+                    self.update_fps()
+
+            now = perf_counter()
+            if now - self._last_stats_update > 0.5:
+                self._last_stats_update = now
+                self.update_statistics()
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+        finally:
+            self.callback_thread.callback.consumer_idle.set()
+
+    def emit_result(self, result: np.ndarray):
+        """ Emit a finished result of the FrameProcessor"""
+        try:
+            recorded = self.processor.pop_recorded()
+            if recorded is not None:
+                self.recorded(recorded)
+            self.dte_signal.emit(
+                DataToExport('Camera',
+                             data=[DataFromPlugins(name='Camera',
+                                                   data=[result],
+                                                   dim=self.data_shape,
+                                                   labels=['Intensity'],
+                                                   axes=[self.y_axis, self.x_axis])]))
+            if self.settings['processing', 'sigma_clip']:
+                self.settings.child('processing', 'n_clipped').setValue(self.processor.n_clipped)
+            if self.settings['timing_opts', 'fps_on']:
+                self.update_fps()
+            self.update_statistics()
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+
+    def emit_moments(self, moments: BeamMoments, frame):
+        """ Emit the beam moments as Data0D, with the frame if the last one was emitted long enough ago
+
+        The moments are converted from frame pixels to sensor pixels (roi and binning) then to µm before computing
+        the widths, ellipticity and orientation, the binning being possibly different along x and y.
+        """
+        try:
+            pixel_size = self.settings['beam_profile', 'pixel_size']
+            x_offset, x_scaling = (self.x_axis.offset, self.x_axis.scaling) if self.x_axis is not None else (0, 1)
+            y_offset, y_scaling = (self.y_axis.offset, self.y_axis.scaling) if self.y_axis is not None else (0, 1)
+            sensor_moments = moments.scaled(x_offset, x_scaling, y_offset, y_scaling)
+            beam = sensor_moments.scaled(0., pixel_size, 0., pixel_size)
+            values = [beam.x0, beam.y0, beam.d4sigma_x, beam.d4sigma_y, beam.ellipticity, beam.orientation]
+            data = [DataFromPlugins(name='Beam', data=[np.array([value]) for value in values], dim='Data0D',
+                                    labels=['x0', 'y0', 'D4σ x', 'D4σ y', 'Ellipticity', 'Orientation (°)'])]
+
+            frame_rate = self.settings['beam_profile', 'frame_rate']
+            now = perf_counter()
+            if frame_rate > 0 and now - self._last_full_frame >= 1 / frame_rate:
+                if isinstance(frame, int):
+                    frame = self.ring.frame(frame) if self.ring.is_valid(frame) else None
+                if frame is not None:
+                    self._last_full_frame = now
+                    data.append(DataFromPlugins(name='Camera', data=[frame], dim=self.data_shape,
+                                                labels=['Intensity'], axes=[self.y_axis, self.x_axis]))
+            self.dte_signal.emit(DataToExport('Camera', data=data))
+
+            if self.settings['auto_roi', 'enabled']:
+                self.track_beam(sensor_moments)
+
+            if now - self._last_stats_update > 0.5:
+                self._last_stats_update = now
+                self.update_statistics()
+                if self.settings['timing_opts', 'fps_on']:
+                    self.settings.child('timing_opts', 'fps').setValue(round(self.statistics.fps, 1))
+        except Exception as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+
+    def track_beam(self, moments: BeamMoments):
+        """ Move the hardware ROI to follow the beam (moments in sensor pixels) and restart the acquisition"""
+        hstart, hend, vstart, vend, hbin, vbin = self.controller.get_roi()
+        new_roi = self.auto_roi.update(moments, (hstart, hend, vstart, vend))
+        if new_roi is not None:
+            hstart, hend, vstart, vend = new_roi
+            self.update_rois((hstart, hend - hstart, hbin, vstart, vend - vstart, vbin))
+            self.settings.child('auto_roi', 'n_changes').setValue(self.auto_roi.n_changes)
+            if self.is_live:
+                self.grab_data(self.Naverage, live=True)
+
+    def stop(self):
+        """Stop the acquisition (and the recording)."""
+        if self.callback_thread is not None:
+            self.callback_thread.callback.stop_recording()
+        super().stop()
+        self.update_statistics()
+        return ''
@@ -0,0 +1,125 @@
+"""
+Per-serial cache of the wavelength calibration of the CCSXXX spectrometers.
+
+The wavelength axis of a spectrometer and its user calibration points are saved, keyed by the serial number of the
+device, as a npz file in the ``ccs_calibration`` folder of the plugin configuration directory. They are also kept in
+memory, so that reconnecting to a spectrometer from the same process does not even read the file.
+
+The cached calibration is only used if its checksum matches the one of the device, computed from the (cheap)
+identification query (serial number, firmware revision) and the user calibration points: the wavelength axis is
+queried again whenever the device has been recalibrated. The cache can be disabled in the plugin configuration::
+
+    [CCSXXX]
+    calibration_cache = false
+"""
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.utils import Config
+
+logger = set_logger(get_module_name(__file__))
+config = Config()
+
+
+@dataclass
+class WavelengthCalibration:
+    """ Wavelength axis of a spectrometer and the calibration it comes from"""
+    serial_number: str
+    data_set: int  # 0 for the factory calibration, 1 for the user one
+    wavelengths: np.ndarray
+    user_pixels: np.ndarray
+    user_wavelengths: np.ndarray
+    checksum: str
+
+
+_calibrations: Dict[Tuple[str, int], WavelengthCalibration] = {}
+
+
+def calibration_checksum(identification: dict, user_pixels: np.ndarray, user_wavelengths: np.ndarray) -> str:
+    digest = hashlib.sha1()
+    digest.update(identification['serial_number'].encode())
+    digest.update(identification['firmware_revision'].encode())
+    digest.update(np.ascontiguousarray(user_pixels, dtype='<i4').tobytes())
+    digest.update(np.ascontiguousarray(user_wavelengths, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def cache_directory() -> Path:
+    return config.config_path.parent.joinpath('ccs_calibration')
+
+
+def cache_path(serial_number: str, data_set: int = 0) -> Path:
+    name = ''.join(char if char.isalnum() else '_' for char in serial_number)
+    return cache_directory().joinpath(f'{name}_{data_set}.npz')
+
+
+def load_calibration(serial_number: str, data_set: int = 0) -> Optional[WavelengthCalibration]:
+    """ Load a cached calibration from its file, None if there is none (or if it cannot be read)"""
+    path = cache_path(serial_number, data_set)
+    if not path.is_file():
+        return None
+    try:
+        with np.load(path) as cache:
+            return WavelengthCalibration(serial_number=str(cache['serial_number']),
+                                         data_set=int(cache['data_set']),
+                                         wavelengths=cache['wavelengths'],
+                                         user_pixels=cache['user_pixels'],
+                                         user_wavelengths=cache['user_wavelengths'],
+                                         checksum=str(cache['checksum']))
+    except Exception as e:
+        logger.warning(f'Could not load the cached calibration {path}: {e}')
+        return None
+
+
+def save_calibration(calibration: WavelengthCalibration):
+    path = cache_path(calibration.serial_number, calibration.data_set)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, serial_number=calibration.serial_number, data_set=calibration.data_set,
+                 wavelengths=calibration.wavelengths, user_pixels=calibration.user_pixels,
+                 user_wavelengths=calibration.user_wavelengths, checksum=calibration.checksum)
+    except OSError as e:
+        logger.warning(f'Could not cache the calibration in {path}: {e}')
+
+
+def get_wavelength_calibration(spectrometer, data_set: int = 0,
+                               use_cache: Optional[bool] = None) -> WavelengthCalibration:
+    """ Get the wavelength calibration of a connected CCSXXX, from the cache if its checksum is still valid
+
+    Parameters
+    ----------
+    spectrometer: CCSXXX
+    data_set: int
+        0 for the factory calibration, 1 for the user one
+    use_cache: bool
+        defaults to the calibration_cache entry of the configuration
+    """
+    if use_cache is None:
+        use_cache = config('CCSXXX', 'calibration_cache')
+    identification = spectrometer.get_identification()
+    user_pixels, user_wavelengths = spectrometer.get_user_calibration_points()
+    checksum = calibration_checksum(identification, user_pixels, user_wavelengths)
+    serial_number = identification['serial_number']
+
+    if use_cache:
+        calibration = _calibrations.get((serial_number, data_set))
+        if calibration is None:
+            calibration = load_calibration(serial_number, data_set)
+        if calibration is not None and calibration.checksum == checksum:
+            _calibrations[(serial_number, data_set)] = calibration
+            return calibration
+
+    calibration = WavelengthCalibration(serial_number=serial_number, data_set=data_set,
+                                        wavelengths=spectrometer.get_wavelength_data(data_set),
+                                        user_pixels=user_pixels, user_wavelengths=user_wavelengths,
+                                        checksum=checksum)
+    if use_cache:
+        _calibrations[(serial_number, data_set)] = calibration
+        save_calibration(calibration)
+    return calibration
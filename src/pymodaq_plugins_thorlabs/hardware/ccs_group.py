@@ -0,0 +1,63 @@
+"""
+Parallel acquisition from several CCSXXX spectrometers.
+
+The TLCCS library is loaded once (at the import of ccsxxx) and each spectrometer gets its own session handle. The
+CCSGroup drives all of them from a thread pool (one worker per device): scans are started on all devices at once
+and read concurrently, the ctypes calls releasing the GIL while the library waits for the end of the integration.
+A stitched broadband measurement thus takes a single integration time (the longest one) instead of their sum.
+
+The spectra of one acquisition share the same timestamp: the epoch time at which the scans have been started.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from pymodaq_plugins_thorlabs.hardware.ccsxxx import CCSXXX
+
+
+def parse_resource_names(text: str) -> List[str]:
+    """ Resource names separated by commas, semicolons or new lines"""
+    return [name.strip() for name in text.replace(';', ',').replace('\n', ',').split(',') if name.strip()]
+
+
+class CCSGroup:
+    """ Several CCSXXX acquiring concurrently from a thread pool (see module docstring)
+
+    Parameters
+    ----------
+    resource_names: list of str
+        VISA resource names of the spectrometers
+    """
+
+    def __init__(self, resource_names: Sequence[str]):
+        self.devices: Dict[str, CCSXXX] = {name: CCSXXX(name) for name in resource_names}
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.devices), 1), thread_name_prefix='CCSGroup')
+
+    def _map(self, function, *args) -> list:
+        """ Call function(device, *args) on all the devices concurrently, results in the devices order"""
+        futures = [self._pool.submit(function, device, *args) for device in self.devices.values()]
+        return [future.result() for future in futures]
+
+    def connect(self):
+        self._map(CCSXXX.connect)
+
+    def set_integration_time(self, integration_time: float):
+        self._map(CCSXXX.set_integration_time, integration_time)
+
+    @staticmethod
+    def _scan(device: CCSXXX, raw: bool) -> np.ndarray:
+        device.start_scan()
+        return device.get_raw_scan_data() if raw else device.get_scan_data()
+
+    def acquire(self, raw: bool = False) -> Tuple[float, List[np.ndarray]]:
+        """ Scan all the devices at once, return the shared timestamp and the spectra in the devices order"""
+        timestamp = time()
+        return timestamp, self._map(self._scan, raw)
+
+    def close(self):
+        try:
+            self._map(CCSXXX.close)
+        finally:
+            self._pool.shutdown(wait=False)
@@ -2,14 +2,38 @@ import os
 import ctypes
 import numpy as np
 
+from pymodaq_plugins_thorlabs.hardware.instrumentation import instrument
+
 dll_path = r"C:\Program Files\IVI Foundation\VISA\Win64\Bin"
 os.chdir(dll_path)
 lib = ctypes.cdll.LoadLibrary("TLCCS_64.dll")
 
+NUM_PIXELS = 3648
+ADC_MAX = 0xFFFF  # full scale of the raw counts
+ACOR_FROM_CURRENT = 1  # amplitude correction factors currently in use
+MAX_USER_POINTS = 10  # maximum number of user calibration points
+
+
+def raw_to_intensity(raw: np.ndarray, amplitude_correction: np.ndarray = None) -> np.ndarray:
+    """ Convert raw counts (..., NUM_PIXELS) into float64 intensities normalized to the ADC full scale
+
+    Vectorized over any number of spectra, the amplitude correction factors (if any) being applied along the
+    last axis.
+    """
+    intensity = raw.astype(np.float64)
+    intensity *= 1 / ADC_MAX
+    if amplitude_correction is not None:
+        intensity *= amplitude_correction
+    return intensity
+
+
+@instrument
 class CCSXXX:
     def __init__(self, rsrc_name):
         self.rsrc_name = rsrc_name.encode('utf-8')
         self.ccs_handle = ctypes.c_int(0)
+        self._scan_buffer = np.zeros((NUM_PIXELS,), dtype=np.float64)
+        self._raw_buffer = np.zeros((NUM_PIXELS,), dtype=np.int32)  # ViInt32 in the TLCCS API
 
     def connect(self):
         # connect to the device using DLL's init function'
@@ -36,21 +60,73 @@ class CCSXXX:
         if status != 0:
             raise Exception(f"Error starting scan: {status}")
 
-    def get_wavelength_data(self):
-        wavelengths = (ctypes.c_double * 3648)()
-        status = lib.tlccs_getWavelengthData(self.ccs_handle, 0, ctypes.byref(wavelengths), ctypes.c_void_p(None), ctypes.c_void_p(None))
+    def get_identification(self) -> dict:
+        """ Manufacturer, device name, serial number, firmware and driver revisions"""
+        fields = [ctypes.create_string_buffer(256) for _ in range(5)]
+        status = lib.tlccs_identificationQuery(self.ccs_handle, *fields)
+        if status != 0:
+            raise Exception(f"Error querying identification: {status}")
+        names = ('manufacturer', 'device_name', 'serial_number', 'firmware_revision', 'driver_revision')
+        return {name: field.value.decode('utf-8', errors='replace').strip() for name, field in zip(names, fields)}
+
+    def get_wavelength_data(self, data_set: int = 0):
+        """
+
+        Args:
+            data_set: 0 for the factory calibration, 1 for the user one
+
+        Returns:
+            the wavelength (nm) of each pixel
+        """
+        wavelengths = np.zeros((NUM_PIXELS,), dtype=np.float64)
+        status = lib.tlccs_getWavelengthData(self.ccs_handle, data_set, np.ctypeslib.as_ctypes(wavelengths),
+                                             ctypes.c_void_p(None), ctypes.c_void_p(None))
         if status != 0:
             raise Exception(f"Error getting wavelength data: {status}")
-        wavelengths = np.array(list(wavelengths))
         return wavelengths
 
+    def get_user_calibration_points(self):
+        """ Pixels and wavelengths of the user calibration points, empty arrays if there is no user calibration"""
+        pixels = np.zeros((MAX_USER_POINTS,), dtype=np.int32)
+        wavelengths = np.zeros((MAX_USER_POINTS,), dtype=np.float64)
+        length = ctypes.c_int32(0)
+        status = lib.tlccs_getUserCalibrationPoints(self.ccs_handle, np.ctypeslib.as_ctypes(pixels),
+                                                    np.ctypeslib.as_ctypes(wavelengths), ctypes.byref(length))
+        if status != 0:  # no user calibration stored in the device
+            length.value = 0
+        return pixels[:length.value], wavelengths[:length.value]
+
     def get_scan_data(self):
-        data_array = (ctypes.c_double * 3648)()
-        status = lib.tlccs_getScanData(self.ccs_handle, ctypes.byref(data_array))
+        status = lib.tlccs_getScanData(self.ccs_handle, np.ctypeslib.as_ctypes(self._scan_buffer))
         if status != 0:
             raise Exception(f"Error getting scan data: {status}")
-        data_array = np.array(list(data_array))
-        return data_array
+        return self._scan_buffer.copy()
+
+    def get_raw_scan_data(self, out: np.ndarray = None) -> np.ndarray:
+        """ Raw counts of the last scan as uint16 (4 times smaller than the float64 scan data)
+
+        Args:
+            out: optional uint16 array of NUM_PIXELS elements the counts are written into
+
+        Returns:
+            the raw counts, not amplitude corrected (see raw_to_intensity)
+        """
+        status = lib.tlccs_getRawScanData(self.ccs_handle, np.ctypeslib.as_ctypes(self._raw_buffer))
+        if status != 0:
+            raise Exception(f"Error getting raw scan data: {status}")
+        if out is None:
+            out = np.empty((NUM_PIXELS,), dtype=np.uint16)
+        np.copyto(out, self._raw_buffer, casting='unsafe')
+        return out
+
+    def get_amplitude_correction(self) -> np.ndarray:
+        """ Amplitude correction factors currently in use, one per pixel"""
+        factors = np.zeros((NUM_PIXELS,), dtype=np.float64)
+        status = lib.tlccs_getAmplitudeData(self.ccs_handle, np.ctypeslib.as_ctypes(factors), 0, NUM_PIXELS,
+                                            ACOR_FROM_CURRENT)
+        if status != 0:
+            raise Exception(f"Error getting amplitude correction: {status}")
+        return factors
 
     def close(self):
         lib.tlccs_close(self.ccs_handle)
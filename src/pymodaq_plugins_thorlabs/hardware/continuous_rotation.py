@@ -0,0 +1,210 @@
+"""
+Continuous rotation of the Kinesis cage rotator with angle-stamped acquisition.
+
+Instead of stepping a waveplate and settling at each angle, the IntegratedStepper spins at constant velocity while a
+PositionTrace (see flyscan) records (timestamp, angle) pairs. The detector samples (TLPM power, CCSXXX spectra...)
+acquired meanwhile are given angles by interpolating the trace at their timestamps (``DataWithAxes.timestamp``) and
+are demodulated at the harmonics of the rotation::
+
+    rotation = ContinuousRotation(stepper)
+    rotation.start(velocity=360.)
+    ...  # acquire
+    rotation.stop()
+    angles = rotation.angles_at([dwa.timestamp for dwa in spectra])
+    coefficients = demodulate(angles, np.array([dwa[0] for dwa in spectra]), harmonics=(0, 2, 4))
+
+The angle reported by the device wraps at 360°, the trace is unwrapped so that the interpolation holds over several
+turns. demodulate resamples the signal on a regular angle grid spanning a whole number of turns and takes its FFT,
+giving the coefficients a_n and b_n of the signal a_0 + sum(a_n cos(nθ) + b_n sin(nθ)) for all the pixels of a
+spectrum at once (the 2θ and 4θ ones giving the Stokes parameters for a rotating quarter waveplate polarimeter).
+"""
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+from pymodaq_utils.utils import ThreadCommand
+
+from pymodaq_plugins_thorlabs.hardware.flyscan import PositionTrace, interpolate_positions
+
+logger = set_logger(get_module_name(__file__))
+
+
+def demodulate(angles: Union[Iterable[float], np.ndarray], signals: np.ndarray, harmonics: Sequence[int] = (0, 2, 4),
+               points_per_turn: int = 360) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """ Coefficients (a_n, b_n) of the harmonics n of signals sampled at angles (in degrees)
+
+    Parameters
+    ----------
+    angles: array of shape (n_samples,)
+        unwrapped angles of the samples, NaN ones are ignored
+    signals: array of shape (n_samples, ...)
+        the samples (scalars or spectra), demodulated along their first axis
+    harmonics: sequence of int
+        orders n of the harmonics
+    points_per_turn: int
+        resolution of the regular angle grid on which the signals are resampled
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    signals = np.asarray(signals, dtype=np.float64)
+    valid = np.isfinite(angles)
+    order = np.argsort(angles[valid])
+    angles = angles[valid][order]
+    signals = signals[valid][order]
+    if angles.size < 2:
+        raise ValueError('At least two samples are needed to demodulate a signal')
+    n_turns = int(np.floor((angles[-1] - angles[0]) / 360))
+    if n_turns < 1:
+        raise ValueError('The samples do not span a whole turn')
+
+    grid = angles[0] + np.arange(n_turns * points_per_turn) * 360 / points_per_turn
+    index = np.clip(np.searchsorted(angles, grid, side='right') - 1, 0, angles.size - 2)
+    step = angles[index + 1] - angles[index]
+    weight = np.divide(grid - angles[index], step, out=np.zeros_like(grid), where=step > 0)
+    weight = weight.reshape((-1,) + (1,) * (signals.ndim - 1))
+    resampled = (1 - weight) * signals[index] + weight * signals[index + 1]
+
+    spectrum = np.fft.rfft(resampled, axis=0) / grid.size
+    coefficients = {}
+    for harmonic in harmonics:
+        if harmonic == 0:
+            coefficients[0] = (spectrum[0].real, np.zeros_like(spectrum[0].real))
+            continue
+        # the grid starts at angles[0]: back to the phase of the signal at θ = 0
+        amplitude = 2 * spectrum[harmonic * n_turns] * np.exp(-1j * harmonic * np.deg2rad(angles[0]))
+        coefficients[harmonic] = (amplitude.real, -amplitude.imag)
+    return coefficients
+
+
+class ContinuousRotation:
+    """ Spin an IntegratedStepper at constant velocity while recording its angle (see module docstring)
+
+    The velocity parameters and the polling period of the device are restored once stopped.
+
+    Parameters
+    ----------
+    motor: IntegratedStepper
+    """
+
+    def __init__(self, motor):
+        self.motor = motor
+        self.trace: Optional[PositionTrace] = None
+        self._saved_velocity: Optional[Tuple[float, float]] = None
+        self._saved_polling: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._saved_velocity is not None
+
+    def start(self, velocity: float, rate: float = 100., forward: bool = True):
+        """ Start the rotation at velocity (°/s) and record the angle at rate (Hz)"""
+        if velocity <= 0:
+            raise ValueError(f'The rotation velocity must be positive, got {velocity}')
+        with self._lock:
+            if self.running:
+                raise RuntimeError('The continuous rotation is already running')
+            max_velocity, max_acceleration = self.motor.get_velocity_limits()
+            self._saved_velocity = self.motor.get_velocity_params()
+            self._saved_polling = self.motor.polling_period
+            self.motor.set_velocity_params(min(velocity, max_velocity),
+                                           min(self._saved_velocity[1], max_acceleration))
+            self.motor.set_polling_period(max(1, int(1000 / rate)))
+            self.trace = PositionTrace(self.motor.get_position, rate)
+            self.trace.start()
+            self.motor.move_continuous(forward)
+
+    def stop(self) -> Optional[PositionTrace]:
+        """ Stop the rotation and the recording, return the trace"""
+        with self._lock:
+            if not self.running:
+                return self.trace
+            try:
+                self.motor.stop()
+            finally:
+                self.trace.stop()
+                self.motor.set_polling_period(self._saved_polling)
+                self.motor.set_velocity_params(*self._saved_velocity)
+                self._saved_velocity = None
+        logger.info(f'Continuous rotation stopped: {len(self.trace)} angles recorded at '
+                    f'{self.trace.achieved_rate:.1f} Hz')
+        return self.trace
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.trace.timestamps if self.trace is not None else np.zeros((0,))
+
+    @property
+    def angles(self) -> np.ndarray:
+        """ Unwrapped angles of the trace"""
+        if self.trace is None:
+            return np.zeros((0,))
+        return np.unwrap(self.trace.positions, period=360.)
+
+    def angles_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ Unwrapped angles at the given timestamps (NaN if outside the trace)"""
+        return interpolate_positions(self.timestamps, self.angles, timestamps)
+
+    def save(self, path: Union[str, Path]):
+        np.savez(path, timestamps=self.timestamps, angles=self.angles)
+
+
+continuous_rotation_params = [
+    {'title': 'Continuous rotation:', 'name': 'rotation', 'type': 'group', 'expanded': False, 'children': [
+        {'title': 'Velocity (°/s):', 'name': 'velocity', 'type': 'float', 'value': 90., 'min': 0.001},
+        {'title': 'Forward:', 'name': 'forward', 'type': 'bool', 'value': True},
+        {'title': 'Trace rate (Hz):', 'name': 'rate', 'type': 'float', 'value': 100., 'min': 1.},
+        {'title': 'Trace file:', 'name': 'trace_path', 'type': 'browsepath', 'value': '', 'filetype': True,
+         'tip': 'npz file where to save the (timestamp, angle) trace, not saved if empty'},
+        {'title': 'Start rotation:', 'name': 'start', 'type': 'bool_push', 'value': False, 'label': 'Start'},
+        {'title': 'Stop rotation:', 'name': 'stop', 'type': 'bool_push', 'value': False, 'label': 'Stop'},
+        {'title': 'Achieved rate (Hz):', 'name': 'achieved_rate', 'type': 'float', 'value': 0., 'readonly': True},
+    ]}]
+
+
+class ContinuousRotationPlugin:
+    """ Mixin adding the continuous rotation settings (continuous_rotation_params) to the IntegratedStepper plugin
+
+    Angles are in degrees (the scaling of the actuator is not applied). The rotated motor is the controller of the
+    plugin, which has to call commit_rotation_settings from its commit_settings.
+    """
+    rotation: Optional[ContinuousRotation] = None
+
+    def commit_rotation_settings(self, param) -> bool:
+        """ Start or stop the rotation if a button has been pushed, return True if param was a rotation one"""
+        if param.parent() is None or param.parent().name() != 'rotation':
+            return False
+        if param.name() in ('start', 'stop') and param.value():
+            param.setValue(False)
+            if param.name() == 'start':
+                self.start_rotation()
+            else:
+                self.stop_rotation()
+        return True
+
+    def start_rotation(self):
+        if self.rotation is None:
+            self.rotation = ContinuousRotation(self.controller)
+        try:
+            self.rotation.start(self.settings['rotation', 'velocity'], self.settings['rotation', 'rate'],
+                                self.settings['rotation', 'forward'])
+        except (RuntimeError, ValueError) as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+
+    def stop_rotation(self):
+        if self.rotation is None or not self.rotation.running:
+            return
+        trace = self.rotation.stop()
+        self.settings.child('rotation', 'achieved_rate').setValue(trace.achieved_rate)
+        if self.settings['rotation', 'trace_path']:
+            self.rotation.save(self.settings['rotation', 'trace_path'])
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Continuous rotation stopped: {len(trace)} angles recorded at {trace.achieved_rate:.1f} Hz', 'log']))
+
+    def rotation_angles_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ Unwrapped angles (°) at the given timestamps of the last continuous rotation"""
+        if self.rotation is None:
+            return np.full(np.shape(timestamps), np.nan)
+        return self.rotation.angles_at(timestamps)
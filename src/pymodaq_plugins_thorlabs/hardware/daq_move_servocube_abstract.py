@@ -6,10 +6,12 @@ from pymodaq_gui.parameter import Parameter
 
 from pymodaq_utils.logger import set_logger, get_module_name
 
+from pymodaq_plugins_thorlabs.hardware.flyscan import FlyScanPlugin
+
 logger = set_logger(get_module_name(__file__))
 
 
-class DAQ_Move_DCServoCube_Abstract(DAQ_Move_base):
+class DAQ_Move_DCServoCube_Abstract(FlyScanPlugin, DAQ_Move_base):
     """ Abstract class for Thorlabs DCServo cube instrument plugin.
 
     This object inherits all functionalities to communicate with PyMoDAQ’s DAQ_Move module through inheritance via
@@ -92,7 +94,7 @@ class DAQ_Move_DCServoCube_Abstract(DAQ_Move_base):
         param: Parameter
             A given parameter (within detector_settings) whose value has been changed by the user
         """
-        pass
+        self.commit_fly_scan_settings(param)
 
 
     def ini_stage(self, controller=None):
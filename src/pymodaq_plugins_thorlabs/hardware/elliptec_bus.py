@@ -0,0 +1,440 @@
+"""
+Shared serial bus of the Elliptec devices.
+
+The Elliptec devices (rotation mounts, linear stages, sliders...) are chained on a multi-drop serial bus, each one
+answering at its own address (0 to F). An ElliptecBus owns a serial port once per process (see open_bus: all the
+plugin instances using a port share the same bus) and multiplexes the commands of all the devices on it:
+
+* a command is written right away if no other command is pending for its address, otherwise it is queued behind the
+  previous ones for this address (a device processes one command at a time)
+* a reader thread routes each reply (prefixed by the address of the answering device) to the pending command of
+  this address, completes its future and writes the next queued command for this address
+
+Commands to different addresses are thus pipelined: moving N rotators costs a single round trip (the longest move)
+instead of N. Pending commands without reply are failed after their timeout, replies not expected by any command
+are passed to the listeners of their address. A stop is written immediately (see interrupt), completing the
+interrupted motion of its device.
+
+Moves of an ElliptecDevice are non-blocking: the move command is sent and its future returned, the position
+reported by the device at the end of the motion (or the error status) being cached from the reader thread. The
+position is thus known without polling the device over the serial port, the move_done event signaling the
+completion of the last move.
+"""
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import serial
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.utils import Config
+
+logger = set_logger(get_module_name(__file__))
+config = Config()
+
+ADDRESSES = '0123456789ABCDEF'
+
+# header of the reply completing each instruction, any instruction may also be answered by a status (GS)
+REPLIES = {'in': 'IN', 'gs': 'GS', 'gp': 'PO', 'ma': 'PO', 'mr': 'PO', 'ho': 'PO', 'fw': 'PO', 'bw': 'PO',
+           'st': 'GS'}
+MOTIONS = ('ma', 'mr', 'ho', 'fw', 'bw')
+
+STATUS_OK = 0
+STATUS_BUSY = 9
+STATUS = {0: 'OK', 1: 'communication timeout', 2: 'mechanical timeout', 3: 'command error', 4: 'value out of range',
+          5: 'module isolated', 6: 'module out of isolation', 7: 'initializing error', 8: 'thermal error', 9: 'busy',
+          10: 'sensor error', 11: 'motor error', 12: 'out of range', 13: 'over current error'}
+
+ROTARY_MOTORS = (8, 14, 18)  # ELL8, ELL14 and ELL18 rotation mounts, positions in degrees (mm for the others)
+STOPPABLE_MOTORS = (14, 18)  # only the ELL14 and ELL18 implement the st instruction
+
+
+@dataclass
+class ElliptecReply:
+    """ A message sent by a device: its address, a two letters header (PO, GS, IN...) and data"""
+    address: str
+    header: str
+    data: str
+    timestamp: float  # perf_counter at reception
+
+    @property
+    def status(self) -> Optional[int]:
+        """ The status code of a GS reply, None for other replies"""
+        return int(self.data, 16) if self.header == 'GS' and self.data else None
+
+
+@dataclass
+class ElliptecCommand:
+    address: str
+    instruction: str
+    data: str = ''
+    timeout: float = 1.
+    future: Future = field(default_factory=Future)
+    sent: Optional[float] = None  # perf_counter at which the command has been written
+
+    @property
+    def message(self) -> bytes:
+        return f'{self.address}{self.instruction}{self.data}'.encode('ascii')
+
+    def accepts(self, reply: ElliptecReply) -> bool:
+        if reply.header == 'GS':  # a busy status (sent during the motions) does not complete a motion nor a stop
+            return not ((self.instruction in MOTIONS or self.instruction == 'st') and reply.status == STATUS_BUSY)
+        return reply.header == REPLIES.get(self.instruction, self.instruction.upper())
+
+
+class ElliptecBus:
+    """ Serial port multiplexing the commands to the Elliptec devices by address (see module docstring)
+
+    Use open_bus to get the bus of a port shared by all its users.
+
+    Parameters
+    ----------
+    port: str
+        serial port (COM3, /dev/ttyUSB0...)
+    """
+
+    def __init__(self, port: str, reply_timeout: float = config('Elliptec', 'reply_timeout_s'),
+                 move_timeout: float = config('Elliptec', 'move_timeout_s')):
+        self.port = port
+        self.reply_timeout = reply_timeout
+        self.move_timeout = move_timeout
+        self._serial = serial.Serial(port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=0.05)
+        if not self._serial.is_open:
+            raise IOError(f'Could not open the serial port {port}')
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Deque[ElliptecCommand]] = defaultdict(deque)  # the first one is being processed
+        self._interrupts: Dict[str, Deque[ElliptecCommand]] = defaultdict(deque)  # written out of the queues
+        self._listeners: Dict[str, List[Callable[[ElliptecReply], None]]] = defaultdict(list)
+        self._users = 0
+        self._running = True
+        self._reader = threading.Thread(target=self._read_loop, name=f'ElliptecBus {port}', daemon=True)
+        self._reader.start()
+
+    @property
+    def is_open(self) -> bool:
+        return self._running
+
+    def add_listener(self, address: str, listener: Callable[[ElliptecReply], None]):
+        """ Call listener (from the reader thread) with the replies of this address not expected by a command"""
+        self._listeners[address.upper()].append(listener)
+
+    def remove_listener(self, address: str, listener: Callable[[ElliptecReply], None]):
+        if listener in self._listeners[address.upper()]:
+            self._listeners[address.upper()].remove(listener)
+
+    def send(self, address: str, instruction: str, data: str = '', timeout: Optional[float] = None) -> Future:
+        """ Queue a command, return the future of its ElliptecReply"""
+        if not self._running:
+            raise IOError(f'The Elliptec bus on {self.port} is closed')
+        if timeout is None:
+            timeout = self.move_timeout if instruction in MOTIONS else self.reply_timeout
+        command = ElliptecCommand(address.upper(), instruction, data, timeout)
+        with self._lock:
+            queue = self._pending[command.address]
+            queue.append(command)
+            if len(queue) == 1:
+                self._write(command)
+        return command.future
+
+    def interrupt(self, address: str, instruction: str = 'st', data: str = '') -> Future:
+        """ Write a command right away, its successful reply completing the pending motion of the device"""
+        if not self._running:
+            raise IOError(f'The Elliptec bus on {self.port} is closed')
+        command = ElliptecCommand(address.upper(), instruction, data, self.reply_timeout)
+        with self._lock:
+            self._interrupts[command.address].append(command)
+            self._write(command, self._interrupts)
+        return command.future
+
+    def request(self, address: str, instruction: str, data: str = '',
+                timeout: Optional[float] = None) -> ElliptecReply:
+        """ Send a command and wait for its reply"""
+        return self.send(address, instruction, data, timeout).result()
+
+    def request_many(self, commands: Iterable[Sequence[str]]) -> List[ElliptecReply]:
+        """ Send commands (address, instruction[, data]) to several devices at once and wait for all the replies"""
+        futures = [self.send(*command) for command in commands]
+        return [future.result() for future in futures]
+
+    def _write(self, command: ElliptecCommand, queues: Optional[Dict[str, Deque[ElliptecCommand]]] = None):
+        """ Write a command, self._lock being held"""
+        command.sent = perf_counter()
+        try:
+            self._serial.write(command.message)
+        except serial.SerialException as e:
+            (self._pending if queues is None else queues)[command.address].remove(command)
+            command.future.set_exception(IOError(f'Could not write to {self.port}: {e}'))
+
+    def _read_loop(self):
+        buffer = b''
+        while self._running:
+            try:
+                chunk = self._serial.read(max(self._serial.in_waiting, 1))
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._running:
+                    logger.error(f'Elliptec bus on {self.port} failed: {e}')
+                    self._fail_all(IOError(f'Elliptec bus on {self.port} failed: {e}'))
+                break
+            if chunk:
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    self._dispatch(line.strip())
+            self._expire()
+
+    def _dispatch(self, line: bytes):
+        text = line.decode('ascii', errors='replace')
+        if len(text) < 3:
+            return
+        reply = ElliptecReply(text[0].upper(), text[1:3].upper(), text[3:], perf_counter())
+        completed: List[ElliptecCommand] = []
+        with self._lock:
+            queue = self._pending.get(reply.address)
+            interrupts = self._interrupts.get(reply.address)
+            if interrupts and interrupts[0].accepts(reply):
+                completed.append(interrupts.popleft())
+                interrupted = reply.status == STATUS_OK and queue and queue[0].instruction in MOTIONS
+            else:
+                interrupted = queue and queue[0].accepts(reply)
+            if interrupted:
+                completed.append(queue.popleft())
+                if queue:
+                    self._write(queue[0])
+        for command in completed:
+            command.future.set_result(reply)
+        if not completed:
+            for listener in list(self._listeners.get(reply.address, [])):
+                try:
+                    listener(reply)
+                except Exception as e:
+                    logger.warning(f'Elliptec listener of address {reply.address} failed: {e}')
+
+    def _expire(self):
+        """ Fail the commands waiting for their reply for longer than their timeout"""
+        now = perf_counter()
+        expired: List[ElliptecCommand] = []
+        with self._lock:
+            for queue in self._pending.values():
+                while queue and queue[0].sent is not None and now - queue[0].sent > queue[0].timeout:
+                    expired.append(queue.popleft())
+                    if queue:
+                        self._write(queue[0])
+            for interrupts in self._interrupts.values():
+                while interrupts and now - interrupts[0].sent > interrupts[0].timeout:
+                    expired.append(interrupts.popleft())
+        for command in expired:
+            command.future.set_exception(TimeoutError(f'No reply from the Elliptec device {command.address} on '
+                                                      f'{self.port} to {command.instruction}{command.data}'))
+
+    def _fail_all(self, exception: Exception):
+        with self._lock:
+            commands = [command for queues in (self._pending, self._interrupts)
+                        for queue in queues.values() for command in queue]
+            self._pending.clear()
+            self._interrupts.clear()
+        for command in commands:
+            if not command.future.done():
+                command.future.set_exception(exception)
+
+    def release(self):
+        """ Release the bus obtained from open_bus, the port being closed once it has no more users"""
+        with _buses_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _buses.get(self.port) is self:
+                del _buses[self.port]
+        self.close()
+
+    def close(self):
+        self._running = False
+        self._reader.join(1.)
+        self._fail_all(IOError(f'The Elliptec bus on {self.port} is closed'))
+        self._serial.close()
+
+
+_buses: Dict[str, ElliptecBus] = {}
+_buses_lock = threading.Lock()
+
+
+def open_bus(port: str) -> ElliptecBus:
+    """ Get the bus of a serial port, opening it if it is not already used (call release once done with it)"""
+    with _buses_lock:
+        bus = _buses.get(port)
+        if bus is None or not bus.is_open:
+            bus = _buses[port] = ElliptecBus(port)
+        bus._users += 1
+        return bus
+
+
+def to_hex(value: int) -> str:
+    """ 32 bits two's complement hexadecimal encoding of the positions"""
+    return f'{value & 0xFFFFFFFF:08X}'
+
+
+def from_hex(data: str) -> int:
+    value = int(data, 16)
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def parse_info(data: str) -> dict:
+    """ Decode the data of the IN reply"""
+    hardware = int(data[16:18], 16)
+    return {'Motor Type': int(data[0:2], 16),
+            'Serial No.': data[2:10],
+            'Year': data[10:14],
+            'Firmware': data[14:16],
+            'Thread': 'Imperial' if hardware & 0x80 else 'Metric',
+            'Hardware': hardware & 0x7F,
+            'Range': int(data[18:22], 16),
+            'Pulse/Rev': int(data[22:30], 16)}
+
+
+class ElliptecDevice:
+    """ An Elliptec device at a given address of a bus, positions in degrees (rotation mounts) or mm
+
+    Moves are non-blocking (see module docstring): position holds the last position reported by the device and
+    move_done is set once the last move is over.
+
+    Parameters
+    ----------
+    bus: ElliptecBus
+    address: str
+        hexadecimal address of the device on the bus (0 to F)
+    """
+
+    def __init__(self, bus: ElliptecBus, address: str = '0'):
+        self.bus = bus
+        self.address = address.upper()
+        self.position: Optional[float] = None
+        self.error: Optional[str] = None
+        self.move_done = threading.Event()
+        self.move_done.set()
+        self._move: Optional[Future] = None
+        self.info = self.get_info()
+        pulses = self.info['Pulse/Rev']
+        self.pulses_per_unit = pulses / 360 if self.is_rotary else pulses
+        self.bus.add_listener(self.address, self._update)
+
+    @property
+    def is_rotary(self) -> bool:
+        return self.info['Motor Type'] in ROTARY_MOTORS
+
+    @property
+    def can_stop(self) -> bool:
+        return self.info['Motor Type'] in STOPPABLE_MOTORS
+
+    @property
+    def units(self) -> str:
+        return '°' if self.is_rotary else 'mm'
+
+    @property
+    def moving(self) -> bool:
+        return not self.move_done.is_set()
+
+    def get_info(self) -> dict:
+        reply = self.bus.request(self.address, 'in')
+        self.check(reply)
+        return parse_info(reply.data)
+
+    def check(self, reply: ElliptecReply):
+        """ Raise an IOError if the reply is an error status"""
+        status = reply.status
+        if status is not None and status != STATUS_OK:
+            raise IOError(f'Elliptec device {self.address} on {self.bus.port}: '
+                          f'{STATUS.get(status, f"error {status}")}')
+
+    def to_position(self, reply: ElliptecReply) -> float:
+        self.check(reply)
+        if reply.header != 'PO':
+            raise IOError(f'Elliptec device {self.address} did not report its position: {reply}')
+        return from_hex(reply.data) / self.pulses_per_unit
+
+    def to_pulses(self, value: float) -> str:
+        return to_hex(int(round(value * self.pulses_per_unit)))
+
+    def _update(self, reply: ElliptecReply):
+        """ Cache the position or the error reported by the device (called from the reader thread)"""
+        try:
+            if reply.header == 'PO':
+                self.position = self.to_position(reply)
+            elif reply.status != STATUS_BUSY:  # busy is reported during the motions, not an error
+                self.check(reply)
+        except IOError as e:
+            self.error = str(e)
+
+    def _move_finished(self, future: Future):
+        try:
+            self._update(future.result())
+        except Exception as e:
+            self.error = str(e)
+        if future is self._move:
+            self.move_done.set()
+
+    def _start_move(self, instruction: str, data: str) -> Future:
+        # the new move is the current one before move_done is cleared, so that the end of the previous one
+        # cannot set move_done anymore
+        move = self._move = self.bus.send(self.address, instruction, data)
+        self.move_done.clear()
+        move.add_done_callback(self._move_finished)
+        return move
+
+    def pop_error(self) -> Optional[str]:
+        """ The error reported since the last call, if any"""
+        error, self.error = self.error, None
+        return error
+
+    def get_position(self) -> float:
+        """ Read the position from the device"""
+        self.position = self.to_position(self.bus.request(self.address, 'gp'))
+        return self.position
+
+    def move_abs_async(self, position: float) -> Future:
+        """ Start a move to the position, return the future of the reply (without waiting for it)"""
+        return self._start_move('ma', self.to_pulses(position))
+
+    def move_rel_async(self, step: float) -> Future:
+        return self._start_move('mr', self.to_pulses(step))
+
+    def home_async(self, clockwise: bool = True) -> Future:
+        return self._start_move('ho', '0' if clockwise else '1')
+
+    def wait_move(self, timeout: Optional[float] = None) -> float:
+        """ Wait for the end of the last move, return the position reached"""
+        if self._move is not None:
+            self.check(self._move.result(timeout))
+        self.move_done.wait(timeout)
+        return self.position
+
+    def move_abs(self, position: float) -> float:
+        """ Move to the position, return the position reached"""
+        self.move_abs_async(position)
+        return self.wait_move()
+
+    def move_rel(self, step: float) -> float:
+        self.move_rel_async(step)
+        return self.wait_move()
+
+    def home(self, clockwise: bool = True) -> float:
+        self.home_async(clockwise)
+        return self.wait_move()
+
+    def stop(self):
+        """ Stop the motion (ELL14 and ELL18 only, see can_stop), the position being read again once stopped"""
+        self.check(self.bus.interrupt(self.address, 'st').result())
+        self.move_done.wait(self.bus.reply_timeout)
+        self.get_position()
+
+    def close(self):
+        self.bus.remove_listener(self.address, self._update)
+
+
+def move_all(moves: Sequence[Tuple[ElliptecDevice, float]]) -> List[float]:
+    """ Move several devices (of one or several buses) at once, return the positions reached"""
+    for device, position in moves:
+        device.move_abs_async(position)
+    return [device.wait_move() for device, _ in moves]
@@ -0,0 +1,157 @@
+"""
+Lazy and cached discovery of the Elliptec ports and devices.
+
+Listing the serial ports (and worse, opening each of them or creating a VISA resource manager) at the import of the
+plugins slows down every PyMoDAQ startup and may hang on busy ports. The ElliptecDiscovery instead remembers, in
+the ``elliptec_devices.json`` file of the plugin configuration directory, the ports (or VISA resources) that hosted
+Elliptec devices and their addresses:
+
+* nothing is enumerated nor opened at import: the serial ports and VISA resources offered are the remembered ones
+  (none before the first use), all of them being only listed on a rescan or at the initialization of a plugin
+  without a selected port
+* the plugins remember the devices found at their initialization
+* discover re-probes the remembered ports and addresses first, all the ports and addresses being only probed if
+  none of them answers anymore, or on an explicit rescan
+
+A probe sends the identification request to all the addresses of a port at once through the ElliptecBus (reusing
+the bus of the port if a plugin already uses it), costing a single reply timeout per port.
+"""
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.utils import Config
+from pymodaq_plugins_thorlabs.hardware.elliptec_bus import ADDRESSES, open_bus, parse_info
+
+logger = set_logger(get_module_name(__file__))
+config = Config()
+
+
+class ElliptecDiscovery:
+    """ Remember the ports hosting Elliptec devices and probe them first (see module docstring)
+
+    Parameters
+    ----------
+    path: Path or str
+        json file where the ports and devices are remembered
+    """
+
+    def __init__(self, path: Union[str, Path], probe_timeout: float = config('Elliptec', 'probe_timeout_s')):
+        self.path = Path(path)
+        self.probe_timeout = probe_timeout
+        self._ports: Optional[Dict[str, Dict[str, dict]]] = None  # serial port -> address -> device info
+        self._resources: Optional[Dict[str, list]] = None  # VISA resource -> devices (as listed by pymeasure)
+
+    def _load(self):
+        self._ports, self._resources = {}, {}
+        if not self.path.is_file():
+            return
+        try:
+            cache = json.loads(self.path.read_text())
+            self._ports = cache.get('ports', {})
+            self._resources = cache.get('resources', {})
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read the Elliptec devices cache {self.path}: {e}')
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps({'ports': self._ports, 'resources': self._resources}, indent=2,
+                                            default=str))
+        except OSError as e:
+            logger.warning(f'Could not save the Elliptec devices cache {self.path}: {e}')
+
+    @property
+    def ports(self) -> Dict[str, Dict[str, dict]]:
+        if self._ports is None:
+            self._load()
+        return self._ports
+
+    @property
+    def resources(self) -> Dict[str, list]:
+        if self._resources is None:
+            self._load()
+        return self._resources
+
+    def serial_ports(self, refresh: bool = False) -> List[str]:
+        """ The serial ports remembered as hosting Elliptec devices, followed by all the others if refresh"""
+        known = [port for port, devices in self.ports.items() if devices]
+        if not refresh:
+            return known
+        from serial.tools import list_ports
+        available = [port.device for port in list_ports.comports()]
+        return known + [port for port in available if port not in known]
+
+    def visa_resources(self, refresh: bool = False) -> List[str]:
+        """ The remembered VISA resources, followed by all the other serial VISA resources if refresh"""
+        known = list(self.resources)
+        if not refresh:
+            return known
+        import pyvisa
+        manager = pyvisa.ResourceManager()
+        try:
+            available = list(manager.list_resources('ASRL?*::INSTR'))
+        finally:
+            manager.close()
+        return known + [resource for resource in available if resource not in known]
+
+    def probe(self, port: str, addresses: Sequence[str] = ADDRESSES) -> Dict[str, dict]:
+        """ Identify the devices answering at the addresses of a port and remember them"""
+        found = {}
+        try:
+            bus = open_bus(port)
+        except Exception as e:
+            logger.info(f'Could not probe {port}: {e}')
+            return found
+        try:
+            futures = {address: bus.send(address, 'in', timeout=self.probe_timeout) for address in addresses}
+            for address, future in futures.items():
+                try:
+                    reply = future.result()
+                except (TimeoutError, FutureTimeoutError, IOError):
+                    continue
+                if reply.header == 'IN':
+                    found[address] = parse_info(reply.data)
+        finally:
+            bus.release()
+        if found:
+            self.ports[port] = found
+        else:
+            self.ports.pop(port, None)
+        self.save()
+        return found
+
+    def discover(self, rescan: bool = False) -> Dict[str, Dict[str, dict]]:
+        """ Devices per port, probing the remembered ports and addresses first"""
+        if not rescan:
+            found = {}
+            for port, devices in list(self.ports.items()):
+                devices = self.probe(port, list(devices))
+                if devices:
+                    found[port] = devices
+            if found:
+                return found
+        found = {}
+        for port in self.serial_ports(refresh=True):
+            devices = self.probe(port)
+            if devices:
+                found[port] = devices
+        return found
+
+    def remember(self, port: str, address: str, info: dict):
+        """ Remember a device found by a plugin"""
+        if self.ports.get(port, {}).get(address) != info:
+            self.ports.setdefault(port, {})[address] = info
+            self.save()
+
+    def remember_resource(self, resource: str, devices: list):
+        """ Remember the devices found on a VISA resource"""
+        if self.resources.get(resource) != devices:
+            self.resources[resource] = devices
+            self.save()
+
+
+discovery = ElliptecDiscovery(config.config_path.parent.joinpath('elliptec_devices.json'))
@@ -0,0 +1,248 @@
+"""
+Toggle sequences of the Kinesis flipper with timestamped transits.
+
+Beam blocking reference measurements toggle a flipper thousands of times per run. Instead of polling the position
+of the flipper after each move, a FlipperSequence plays a pattern of states (0 or 1) with the completion of each
+flip signaled by the Kinesis move callback. For each flip, the time at which it has been commanded and the time at
+which the flipper reported the end of its transit are recorded (epoch times, as ``DataWithAxes.timestamp``), and
+an on_state callback is called once the flipper is fully in its new state, so that detectors can gate their
+acquisitions on it::
+
+    sequence = FlipperSequence(flipper)
+    sequence.run([0, 1], repeats=1000, dwell=0.2, on_state=lambda event: print(event.state))
+    states = sequence.states_at([dwa.timestamp for dwa in spectra])  # -1 for the samples taken during a transit
+"""
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq.utils.data import DataActuator
+
+from pymodaq_plugins_thorlabs.hardware.flyscan import epoch_time
+
+logger = set_logger(get_module_name(__file__))
+
+IN_TRANSIT = -1
+
+
+@dataclass
+class FlipEvent:
+    """ A flip of the sequence: the state reached, the command and arrival times (epoch)"""
+    index: int
+    state: int
+    commanded: float
+    arrived: float
+
+    @property
+    def transit_time(self) -> float:
+        return self.arrived - self.commanded
+
+
+def parse_pattern(text: str) -> List[int]:
+    """ States (0 or 1) separated by commas or spaces"""
+    states = [int(value) for value in text.replace(',', ' ').split()]
+    if not states or any(state not in (0, 1) for state in states):
+        raise ValueError(f'Invalid flipper pattern: {text!r}, states are 0 or 1')
+    return states
+
+
+class FlipperSequence:
+    """ Play a toggle pattern on a Flipper, completion driven by the Kinesis callbacks (see module docstring)
+
+    Parameters
+    ----------
+    flipper: Flipper
+    """
+
+    def __init__(self, flipper):
+        self.flipper = flipper
+        self.events: List[FlipEvent] = []
+        self.initial_state: Optional[int] = None
+        self.start_time = 0.
+        self.error: Optional[Exception] = None
+        self.finished = threading.Event()
+        self.finished.set()
+        self._arrived = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _move_done_callback(self, val: int = 0):
+        self._arrived.set()
+
+    def flip(self, state: int, timeout: float = 5.) -> FlipEvent:
+        """ Move to a state and wait for the end of the transit"""
+        self._arrived.clear()
+        commanded = epoch_time()
+        self.flipper.move_abs(state, callback=self._move_done_callback)
+        if not self._arrived.wait(timeout):
+            raise TimeoutError(f'The flipper did not reach the state {state} within {timeout} s')
+        event = FlipEvent(len(self.events), state, commanded, epoch_time())
+        self.events.append(event)
+        return event
+
+    def run(self, pattern: Sequence[int], repeats: int = 1, dwell: float = 0., timeout: float = 5.,
+            on_state: Callable[[FlipEvent], None] = None) -> List[FlipEvent]:
+        """ Play the pattern repeats times (blocking), staying dwell seconds in each state"""
+        self.events = []
+        self.error = None
+        self._stop.clear()
+        self.finished.clear()
+        self.start_time = epoch_time()
+        self.initial_state = self.flipper.get_position()
+        state = self.initial_state
+        try:
+            for _ in range(repeats):
+                for target in pattern:
+                    if self._stop.is_set():
+                        return self.events
+                    if target != state:
+                        event = self.flip(target, timeout)
+                    else:  # already there, no transit
+                        now = epoch_time()
+                        event = FlipEvent(len(self.events), target, now, now)
+                        self.events.append(event)
+                    state = target
+                    if on_state is not None:
+                        on_state(event)
+                    if dwell > 0 and self._stop.wait(dwell):
+                        return self.events
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.finished.set()
+        return self.events
+
+    def start(self, pattern: Sequence[int], repeats: int = 1, dwell: float = 0., timeout: float = 5.,
+              on_state: Callable[[FlipEvent], None] = None,
+              on_finished: Callable[['FlipperSequence'], None] = None):
+        """ Play the pattern in a background thread, on_finished being called at the end"""
+        def _run():
+            try:
+                self.run(pattern, repeats, dwell, timeout, on_state)
+            except Exception as e:
+                logger.warning(f'Flipper sequence failed: {e}')
+            if on_finished is not None:
+                on_finished(self)
+
+        self.finished.clear()
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the sequence after the current flip"""
+        self._stop.set()
+
+    @property
+    def states(self) -> np.ndarray:
+        return np.array([event.state for event in self.events], dtype=int)
+
+    @property
+    def commanded(self) -> np.ndarray:
+        return np.array([event.commanded for event in self.events])
+
+    @property
+    def arrived(self) -> np.ndarray:
+        return np.array([event.arrived for event in self.events])
+
+    @property
+    def transit_times(self) -> np.ndarray:
+        return self.arrived - self.commanded
+
+    def states_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ State of the flipper at the given timestamps, IN_TRANSIT (-1) during the transits
+
+        Timestamps before the start of the sequence get the initial state.
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        if len(self.events) == 0:
+            return np.full(timestamps.shape, IN_TRANSIT if self.initial_state is None else self.initial_state)
+        index = np.searchsorted(self.commanded, timestamps, side='right') - 1  # last flip commanded before
+        states = np.where(index >= 0, self.states[np.maximum(index, 0)], self.initial_state)
+        in_transit = (index >= 0) & (timestamps < self.arrived[np.maximum(index, 0)])
+        return np.where(in_transit, IN_TRANSIT, states)
+
+    def save(self, path: Union[str, Path]):
+        np.savez(path, states=self.states, commanded=self.commanded, arrived=self.arrived)
+
+
+flipper_sequence_params = [
+    {'title': 'Toggle sequence:', 'name': 'sequence', 'type': 'group', 'expanded': False, 'children': [
+        {'title': 'Pattern:', 'name': 'pattern', 'type': 'str', 'value': '0, 1',
+         'tip': 'States (0 or 1) played in order'},
+        {'title': 'Repeats:', 'name': 'repeats', 'type': 'int', 'value': 10, 'min': 1},
+        {'title': 'Dwell (s):', 'name': 'dwell', 'type': 'float', 'value': 0.5, 'min': 0.},
+        {'title': 'Flip timeout (s):', 'name': 'timeout', 'type': 'float', 'value': 5., 'min': 0.1},
+        {'title': 'Transits file:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+         'tip': 'npz file where to save the states and transit timestamps, not saved if empty'},
+        {'title': 'Start sequence:', 'name': 'start', 'type': 'bool_push', 'value': False, 'label': 'Start'},
+        {'title': 'Stop sequence:', 'name': 'stop', 'type': 'bool_push', 'value': False, 'label': 'Stop'},
+        {'title': 'Flips done:', 'name': 'flips', 'type': 'int', 'value': 0, 'readonly': True},
+        {'title': 'Mean transit (ms):', 'name': 'transit', 'type': 'float', 'value': 0., 'readonly': True},
+    ]}]
+
+
+class FlipperSequencePlugin:
+    """ Mixin adding the toggle sequence settings (flipper_sequence_params) to the Kinesis flipper plugin
+
+    The plugin has to call commit_sequence_settings from its commit_settings. Each state reached is emitted as the
+    current value of the actuator, detectors being gated on the move done signal or on sequence_states_at.
+    """
+    sequence: Optional[FlipperSequence] = None
+
+    def commit_sequence_settings(self, param) -> bool:
+        """ Start or stop a sequence if a button has been pushed, return True if param was a sequence one"""
+        if param.parent() is None or param.parent().name() != 'sequence':
+            return False
+        if param.name() in ('start', 'stop') and param.value():
+            param.setValue(False)
+            if param.name() == 'start':
+                self.start_sequence()
+            elif self.sequence is not None:
+                self.sequence.stop()
+        return True
+
+    def start_sequence(self):
+        if self.sequence is not None and not self.sequence.finished.is_set():
+            self.emit_status(ThreadCommand('Update_Status', ['A flipper sequence is already running', 'log']))
+            return
+        try:
+            pattern = parse_pattern(self.settings['sequence', 'pattern'])
+        except ValueError as e:
+            self.emit_status(ThreadCommand('Update_Status', [str(e), 'log']))
+            return
+        self.sequence = FlipperSequence(self.controller)
+        self.sequence.start(pattern, self.settings['sequence', 'repeats'], self.settings['sequence', 'dwell'],
+                            self.settings['sequence', 'timeout'], on_state=self._sequence_state,
+                            on_finished=self._sequence_finished)
+
+    def _sequence_state(self, event: FlipEvent):
+        self.emit_value(DataActuator(self._title, data=self.get_position_with_scaling(float(event.state)),
+                                     units=self.axis_unit))
+
+    def _sequence_finished(self, sequence: FlipperSequence):
+        """ Called from the sequence thread: the settings are updated through update_settings commands"""
+        transits = sequence.transit_times
+        transits = transits[transits > 0]  # states already reached need no flip
+        self.emit_status(ThreadCommand('update_settings', [['sequence', 'flips'], len(transits), 'value']))
+        self.emit_status(ThreadCommand('update_settings',
+                                       [['sequence', 'transit'],
+                                        1e3 * float(np.mean(transits)) if len(transits) else 0., 'value']))
+        if self.settings['sequence', 'path']:
+            sequence.save(self.settings['sequence', 'path'])
+        if sequence.error is not None:
+            message = f'Flipper sequence failed after {len(transits)} flips: {sequence.error}'
+        else:
+            message = f'Flipper sequence done: {len(transits)} flips'
+        self.emit_status(ThreadCommand('Update_Status', [message, 'log']))
+
+    def sequence_states_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ State of the flipper at the given timestamps of the last sequence (-1 during the transits)"""
+        if self.sequence is None:
+            return np.full(np.shape(timestamps), IN_TRANSIT)
+        return self.sequence.states_at(timestamps)
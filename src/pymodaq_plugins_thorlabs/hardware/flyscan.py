@@ -0,0 +1,290 @@
+"""
+Fly scans: continuous motion of a Kinesis stage at constant velocity while recording its position.
+
+Instead of moving and settling at each point of a line scan, the stage sweeps the whole line at constant
+velocity. A PositionTrace of (timestamp, position) is recorded during the sweep and the detector samples
+(CCSXXX spectra, TLPM power...) acquired meanwhile are given positions afterwards by interpolating the trace
+at their timestamps (``DataWithAxes.timestamp``)::
+
+    fly_scan = FlyScan(motor)
+    fly_scan.run(start=0., stop=10., velocity=1.)
+    positions = fly_scan.trace.positions_at([dwa.timestamp for dwa in spectra])
+
+Timestamps are epoch times (as time.time) computed from perf_counter to keep its resolution.
+"""
+import threading
+from pathlib import Path
+from time import perf_counter, sleep, time
+from typing import Callable, Iterable, Optional, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+from pymodaq_utils.utils import ThreadCommand
+
+logger = set_logger(get_module_name(__file__))
+
+_EPOCH_OFFSET = time() - perf_counter()
+
+
+def epoch_time() -> float:
+    """ time.time() like timestamp with the resolution of perf_counter"""
+    return _EPOCH_OFFSET + perf_counter()
+
+
+def interpolate_positions(trace_timestamps: np.ndarray, trace_positions: np.ndarray,
+                          timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+    """ Vectorized linear interpolation of a position trace at given timestamps
+
+    Timestamps outside the trace get NaN as position.
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    if len(trace_timestamps) == 0:
+        return np.full(timestamps.shape, np.nan)
+    return np.interp(timestamps, trace_timestamps, trace_positions, left=np.nan, right=np.nan)
+
+
+class PositionTrace:
+    """ Record (timestamp, position) pairs at a given rate from a background thread
+
+    Parameters
+    ----------
+    read_position: callable
+        function returning the current position
+    rate: float
+        sampling rate in Hz
+    capacity: int
+        initial number of samples of the buffers (doubled when full)
+    """
+
+    def __init__(self, read_position: Callable[[], float], rate: float = 100., capacity: int = 4096):
+        self._read_position = read_position
+        self.rate = rate
+        self._timestamps = np.zeros((capacity,))
+        self._positions = np.zeros((capacity,))
+        self._length = 0
+        self._thread: Optional[threading.Thread] = None
+        self._running = threading.Event()
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self._length]
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self._length]
+
+    @property
+    def achieved_rate(self) -> float:
+        if self._length < 2:
+            return 0.
+        return (self._length - 1) / (self._timestamps[self._length - 1] - self._timestamps[0])
+
+    def append(self, timestamp: float, position: float):
+        if self._length == self._timestamps.size:
+            self._timestamps = np.concatenate((self._timestamps, np.zeros_like(self._timestamps)))
+            self._positions = np.concatenate((self._positions, np.zeros_like(self._positions)))
+        self._timestamps[self._length] = timestamp
+        self._positions[self._length] = position
+        self._length += 1
+
+    def start(self):
+        self._length = 0
+        self._running.set()
+        self._thread = threading.Thread(target=self._record, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _record(self):
+        period = 1 / self.rate
+        next_time = perf_counter()
+        while self._running.is_set():
+            position = self._read_position()
+            self.append(epoch_time(), position)
+            next_time += period
+            delay = next_time - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            else:
+                next_time = perf_counter()
+
+    def positions_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ Positions of the stage at the given timestamps (NaN if outside the trace)"""
+        return interpolate_positions(self.timestamps, self.positions, timestamps)
+
+    def save(self, path: Union[str, Path]):
+        np.savez(path, timestamps=self.timestamps, positions=self.positions)
+
+
+class FlyScan:
+    """ Sweep a Kinesis stage at constant velocity between two positions while recording a PositionTrace
+
+    The stage is first moved (at its current velocity) before the start position by the distance needed to
+    reach the scan velocity, so that the whole [start, stop] range is covered at constant velocity. The run-up
+    is shortened if it would leave the travel of the stage, and a scan outside the travel is rejected. The
+    velocity parameters and the polling period of the device are restored at the end of the scan.
+
+    Parameters
+    ----------
+    motor: Kinesis
+        any Kinesis object implementing move_abs with a callback, get_position, the velocity methods and
+        get_travel_limits (DCServoKCube, DCServoTCube, BrushlessMotorChannel...)
+    """
+
+    def __init__(self, motor):
+        self.motor = motor
+        self.trace: Optional[PositionTrace] = None
+        self.finished = threading.Event()
+        self.finished.set()
+        self.error: Optional[Exception] = None
+        self._move_done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _move_done_callback(self, val: int = 0):
+        self._move_done.set()
+
+    def _move_and_wait(self, position: float, timeout: float):
+        self._move_done.clear()
+        self.motor.move_abs(position, callback=self._move_done_callback)
+        if not self._move_done.wait(timeout):
+            raise TimeoutError(f'The stage did not reach {position} within {timeout} s')
+
+    def run(self, start: float, stop: float, velocity: float, rate: float = 100.,
+            timeout: float = 60.) -> PositionTrace:
+        """ Perform the fly scan (blocking) and return the recorded trace"""
+        if velocity <= 0:
+            raise ValueError(f'The fly scan velocity must be positive, got {velocity}')
+        min_position, max_position = self.motor.get_travel_limits()
+        if not (min_position <= start <= max_position and min_position <= stop <= max_position):
+            raise ValueError(f'The fly scan [{start}, {stop}] is outside the travel of the stage '
+                             f'[{min_position}, {max_position}]')
+        max_velocity, max_acceleration = self.motor.get_velocity_limits()
+        velocity = min(velocity, max_velocity)
+        saved_velocity, saved_acceleration = self.motor.get_velocity_params()
+        acceleration = min(saved_acceleration, max_acceleration)
+        run_up = velocity ** 2 / (2 * acceleration)
+        direction = 1 if stop >= start else -1
+        run_up_start = min(max(start - direction * run_up, min_position), max_position)
+        run_up_stop = min(max(stop + direction * run_up, min_position), max_position)
+        if abs(run_up_start - start) < run_up or abs(run_up_stop - stop) < run_up:
+            logger.warning('The run-up is limited by the travel of the stage: the ends of the scan are not at '
+                           'constant velocity')
+
+        saved_polling = self.motor.polling_period
+        self.trace = PositionTrace(self.motor.get_position, rate)
+        self.finished.clear()
+        self.error = None
+        try:
+            self._move_and_wait(run_up_start, timeout)
+            self.motor.set_velocity_params(velocity, acceleration)
+            self.motor.set_polling_period(max(1, int(1000 / rate)))
+            self.trace.start()
+            self._move_and_wait(run_up_stop, timeout + abs(stop - start) / velocity)
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.trace.stop()
+            self.motor.set_polling_period(saved_polling)
+            self.motor.set_velocity_params(saved_velocity, saved_acceleration)
+            self.finished.set()
+        logger.info(f'Fly scan done: {len(self.trace)} positions recorded at '
+                    f'{self.trace.achieved_rate:.1f} Hz')
+        return self.trace
+
+    def start(self, start: float, stop: float, velocity: float, rate: float = 100.,
+              timeout: float = 60., on_finished: Callable[['FlyScan'], None] = None):
+        """ Perform the fly scan in a background thread, on_finished being called at the end"""
+        def _run():
+            try:
+                self.run(start, stop, velocity, rate, timeout)
+            except Exception as e:
+                logger.warning(f'Fly scan failed: {e}')
+            if on_finished is not None:
+                on_finished(self)
+
+        self.finished.clear()
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.motor.stop()
+
+
+fly_scan_params = [
+    {'title': 'Fly scan:', 'name': 'fly_scan', 'type': 'group', 'expanded': False, 'children': [
+        {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+        {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1.},
+        {'title': 'Velocity (/s):', 'name': 'velocity', 'type': 'float', 'value': 1., 'min': 0.001},
+        {'title': 'Trace rate (Hz):', 'name': 'rate', 'type': 'float', 'value': 100., 'min': 1.},
+        {'title': 'Trace file:', 'name': 'trace_path', 'type': 'browsepath', 'value': '', 'filetype': True,
+         'tip': 'npz file where to save the position trace, not saved if empty'},
+        {'title': 'Run fly scan:', 'name': 'run', 'type': 'bool_push', 'value': False, 'label': 'Run'},
+    ]}]
+
+
+class FlyScanPlugin:
+    """ Mixin adding the fly scan settings (fly_scan_params) to a Kinesis DAQ_Move plugin
+
+    Start, stop and velocity are in the (scaled) units of the actuator, the trace positions are converted
+    back to these units. The plugin has to call commit_fly_scan_settings from its commit_settings. The stage swept
+    is fly_scan_motor, the controller of the plugin if None.
+    """
+    fly_scan: Optional[FlyScan] = None
+    fly_scan_motor = None
+
+    def _to_controller(self, value: float) -> float:
+        if self.settings['scaling', 'use_scaling']:
+            return value / self.settings['scaling', 'scaling'] + self.settings['scaling', 'offset']
+        return value
+
+    def _from_controller(self, values: np.ndarray) -> np.ndarray:
+        if self.settings['scaling', 'use_scaling']:
+            return (values - self.settings['scaling', 'offset']) * self.settings['scaling', 'scaling']
+        return values
+
+    def commit_fly_scan_settings(self, param) -> bool:
+        """ Start a fly scan if the run button has been pushed, return True if param was a fly scan one"""
+        if param.parent() is None or param.parent().name() != 'fly_scan':
+            return False
+        if param.name() == 'run' and param.value():
+            param.setValue(False)
+            self.start_fly_scan()
+        return True
+
+    def start_fly_scan(self):
+        if self.fly_scan is not None and not self.fly_scan.finished.is_set():
+            self.emit_status(ThreadCommand('Update_Status', ['A fly scan is already running', 'log']))
+            return
+        scaling = abs(self.settings['scaling', 'scaling']) if self.settings['scaling', 'use_scaling'] else 1.
+        self.fly_scan = FlyScan(self.fly_scan_motor if self.fly_scan_motor is not None else self.controller)
+        self.fly_scan.start(self._to_controller(self.settings['fly_scan', 'start']),
+                            self._to_controller(self.settings['fly_scan', 'stop']),
+                            self.settings['fly_scan', 'velocity'] / scaling,
+                            self.settings['fly_scan', 'rate'],
+                            on_finished=self._fly_scan_finished)
+
+    def _fly_scan_finished(self, fly_scan: FlyScan):
+        if fly_scan.error is not None:
+            self.emit_status(ThreadCommand('Update_Status', [f'Fly scan failed: {fly_scan.error}', 'log']))
+            return
+        trace = fly_scan.trace
+        if self.settings['fly_scan', 'trace_path']:
+            np.savez(self.settings['fly_scan', 'trace_path'], timestamps=trace.timestamps,
+                     positions=self._from_controller(trace.positions))
+        self.emit_status(ThreadCommand('Update_Status', [
+            f'Fly scan done: {len(trace)} positions recorded at {trace.achieved_rate:.1f} Hz', 'log']))
+
+    def fly_scan_positions_at(self, timestamps: Union[Iterable[float], np.ndarray]) -> np.ndarray:
+        """ Positions (in the units of the actuator) at the given timestamps of the last fly scan"""
+        if self.fly_scan is None or self.fly_scan.trace is None:
+            return np.full(np.shape(timestamps), np.nan)
+        return self._from_controller(self.fly_scan.trace.positions_at(timestamps))
@@ -0,0 +1,163 @@
+"""
+In-plugin processing of camera frames: accumulation, dark subtraction, flat field and hot pixels clipping.
+
+The FrameProcessor is fed by the acquisition worker of the ring buffered cameras (see camera_pipeline) with
+every frame read from the camera. Frames are accumulated in place into a float32 (or int32) accumulator and only
+the finished result (the mean of n frames, dark subtracted, divided by the normalized flat and with its hot pixels
+replaced by the local median) is emitted, dividing the Qt and GUI load by the accumulation factor.
+
+Dark and flat frames are recorded from the next finished result, and can be saved to/loaded from npy files.
+"""
+from pathlib import Path
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+
+processing_params = [
+    {'title': 'Processing', 'name': 'processing', 'type': 'group', 'children': [
+        {'title': 'Frames to accumulate:', 'name': 'n_accumulate', 'type': 'int', 'value': 1, 'min': 1,
+         'tip': 'The viewer averaging is used instead if larger'},
+        {'title': 'Accumulator:', 'name': 'accumulator', 'type': 'list', 'value': 'float32',
+         'limits': ['float32', 'int32']},
+        {'title': 'Dark', 'name': 'dark', 'type': 'group', 'children': [
+            {'title': 'Subtract dark:', 'name': 'use', 'type': 'bool', 'value': False},
+            {'title': 'Record dark:', 'name': 'record', 'type': 'bool_push', 'value': False,
+             'label': 'Record'},
+            {'title': 'Recorded:', 'name': 'recorded', 'type': 'led', 'value': False, 'readonly': True},
+            {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+             'tip': 'npy file the dark is loaded from, or saved to when recorded'},
+        ]},
+        {'title': 'Flat', 'name': 'flat', 'type': 'group', 'children': [
+            {'title': 'Divide by flat:', 'name': 'use', 'type': 'bool', 'value': False},
+            {'title': 'Record flat:', 'name': 'record', 'type': 'bool_push', 'value': False,
+             'label': 'Record'},
+            {'title': 'Recorded:', 'name': 'recorded', 'type': 'led', 'value': False, 'readonly': True},
+            {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+             'tip': 'npy file the flat is loaded from, or saved to when recorded'},
+        ]},
+        {'title': 'Clip hot pixels:', 'name': 'sigma_clip', 'type': 'bool', 'value': False},
+        {'title': 'Clip threshold (sigma):', 'name': 'sigma', 'type': 'float', 'value': 5., 'min': 1.},
+        {'title': 'Clipped pixels:', 'name': 'n_clipped', 'type': 'int', 'value': 0, 'readonly': True},
+    ]}]
+
+
+def sigma_clip(frame: np.ndarray, sigma: float = 5.) -> int:
+    """ Replace in place the pixels deviating from their 3x3 median by more than sigma robust deviations
+
+    The deviation is estimated from the median absolute deviation of the residuals. Return the number of
+    replaced pixels.
+    """
+    median = cv2.medianBlur(frame, 3)
+    residual = frame - median
+    deviation = 1.4826 * np.median(np.abs(residual))
+    if deviation == 0:
+        return 0
+    mask = np.abs(residual) > sigma * deviation
+    frame[mask] = median[mask]
+    return int(np.count_nonzero(mask))
+
+
+class FrameProcessor:
+    """ Accumulate frames and correct the finished results (see module docstring)
+
+    Frames are added from the acquisition thread, settings may be changed from the plugin thread: they are only
+    read when a result is finished.
+    """
+
+    def __init__(self):
+        self.n_accumulate = 1
+        self.accumulator_dtype = np.float32
+        self.use_dark = False
+        self.use_flat = False
+        self.clip = False
+        self.sigma = 5.
+        self.dark: Optional[np.ndarray] = None
+        self.flat: Optional[np.ndarray] = None
+        self.n_clipped = 0
+        self._record: Optional[str] = None
+        self._recorded: Optional[str] = None
+        self._accumulator: Optional[np.ndarray] = None
+        self._count = 0
+        self._result: Optional[np.ndarray] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.n_accumulate > 1 or self.use_dark or self.use_flat or self.clip or self._record is not None
+
+    def reset(self):
+        """ Discard the current accumulation"""
+        self._count = 0
+        self._result = None
+
+    def record(self, what: str):
+        """ Record the next finished result as the 'dark' or the 'flat'"""
+        self._record = what
+
+    def pop_recorded(self) -> Optional[str]:
+        """ Name of the frame ('dark' or 'flat') recorded since the last call, if any"""
+        recorded, self._recorded = self._recorded, None
+        return recorded
+
+    def add(self, frames: np.ndarray):
+        """ Accumulate a chunk (n, ...) of frames"""
+        for frame in frames:
+            if self._accumulator is None or self._accumulator.shape != frame.shape or \
+                    self._accumulator.dtype != self.accumulator_dtype:
+                self._accumulator = np.zeros(frame.shape, dtype=self.accumulator_dtype)
+                self._count = 0
+            if self._count == 0:
+                np.copyto(self._accumulator, frame, casting='unsafe')
+            else:
+                np.add(self._accumulator, frame, out=self._accumulator, casting='unsafe')
+            self._count += 1
+            if self._count >= self.n_accumulate:
+                self._result = self._finish()
+                self._count = 0
+
+    def pop_result(self) -> Optional[np.ndarray]:
+        """ Return the last finished result (None if none has been finished since the last call)"""
+        result, self._result = self._result, None
+        return result
+
+    def _correction(self, name: str, shape) -> Optional[np.ndarray]:
+        frame = getattr(self, name)
+        if frame is not None and frame.shape != shape:
+            logger.warning(f'The {name} frame {frame.shape} does not match the frames {shape} and is discarded')
+            setattr(self, name, None)
+            return None
+        return frame
+
+    def _finish(self) -> np.ndarray:
+        result = self._accumulator.astype(np.float32)
+        result /= self._count
+        if self._record == 'dark':
+            self.dark = result.copy()
+            self._record, self._recorded = None, 'dark'
+        dark = self._correction('dark', result.shape)
+        if self.use_dark and dark is not None:
+            result -= dark
+        if self._record == 'flat':
+            flat = result.copy()
+            mean = flat.mean()
+            flat /= mean if mean != 0 else 1.
+            flat[flat <= 0] = 1.
+            self.flat = flat
+            self._record, self._recorded = None, 'flat'
+        flat = self._correction('flat', result.shape)
+        if self.use_flat and flat is not None:
+            result /= flat
+        if self.clip:
+            self.n_clipped = sigma_clip(result, self.sigma)
+        return result
+
+    def save(self, name: str, path: Union[str, Path]):
+        np.save(path, getattr(self, name))
+
+    def load(self, name: str, path: Union[str, Path]):
+        setattr(self, name, np.load(path).astype(np.float32))
@@ -0,0 +1,153 @@
+"""
+Stream-to-disk recording of camera frames from the acquisition ring buffer.
+
+Long sequences are written by a dedicated writer thread straight from the FrameRing (see camera_pipeline) into
+preallocated memory mapped files, without going through PyMoDAQ (and the GUI, receiving only a decimated
+preview meanwhile). For a recording named ``path``:
+
+* ``path.raw``: the frames, raw in their native dtype (uint16 for the sCMOS), C ordered, one after the other
+* ``path.index``: raw structured array of one (frame counter, timestamp) record per frame, the frame counter
+  being the camera one (gaps are dropped frames) and the timestamp the epoch time the frame has been read at
+* ``path.json``: the header describing both files (shape, dtypes, number of frames...) and the camera settings
+
+The recording can be loaded back with::
+
+    frames, index, header = load_recording(path)
+"""
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter, time
+from typing import Callable, Sequence, Tuple, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+INDEX_DTYPE = np.dtype([('frame', '<i8'), ('timestamp', '<f8')])
+
+
+recording_params = [
+    {'title': 'Recording', 'name': 'recording', 'type': 'group', 'children': [
+        {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+         'tip': 'Base path of the recording, .raw, .index and .json files are created'},
+        {'title': 'Frames:', 'name': 'n_frames', 'type': 'int', 'value': 1000, 'min': 1},
+        {'title': 'Preview rate (Hz):', 'name': 'preview_rate', 'type': 'float', 'value': 5., 'min': 0.},
+        {'title': 'Start:', 'name': 'start', 'type': 'bool_push', 'value': False, 'label': 'Record'},
+        {'title': 'Stop:', 'name': 'stop', 'type': 'bool_push', 'value': False, 'label': 'Stop'},
+        {'title': 'Recording:', 'name': 'recording', 'type': 'led', 'value': False, 'readonly': True},
+        {'title': 'Written frames:', 'name': 'written', 'type': 'int', 'value': 0, 'readonly': True},
+        {'title': 'Lost frames:', 'name': 'lost', 'type': 'int', 'value': 0, 'readonly': True,
+         'tip': 'Frames overwritten in the ring before being written, increase the ring size'},
+    ]}]
+
+
+def load_recording(path: Union[str, Path]) -> Tuple[np.memmap, np.ndarray, dict]:
+    """ Memory map the frames of a recording, and load its index and header"""
+    path = Path(path)
+    header = json.loads(path.with_suffix('.json').read_text())
+    n_frames = header['n_written']
+    frames = np.memmap(path.with_suffix('.raw'), dtype=header['dtype'], mode='r',
+                       shape=(n_frames,) + tuple(header['shape']))
+    index = np.fromfile(path.with_suffix('.index'), dtype=INDEX_DTYPE, count=n_frames)
+    return frames, index, header
+
+
+class FrameRecorder:
+    """ Write frames from a FrameRing into memory mapped files from a writer thread
+
+    Parameters
+    ----------
+    path: str or Path
+        base path of the files
+    ring: FrameRing
+        ring the frames are copied from, its size sets how late the writer may be
+    n_frames: int
+        number of frames to record, the files are preallocated accordingly
+    metadata: dict
+        saved in the header
+    on_finished: callable
+        called (from the writer thread) once the recording is finished
+    """
+
+    def __init__(self, path: Union[str, Path], ring, n_frames: int, metadata: dict = None,
+                 on_finished: Callable[['FrameRecorder'], None] = None):
+        self.path = Path(path).with_suffix('')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ring = ring
+        self.n_frames = n_frames
+        self.metadata = metadata if metadata is not None else {}
+        self.on_finished = on_finished
+        self.written = 0
+        self.lost = 0
+        self._frames = np.memmap(self.path.with_suffix('.raw'), dtype=ring.dtype, mode='w+',
+                                 shape=(n_frames,) + tuple(ring.shape))
+        self._index = np.memmap(self.path.with_suffix('.index'), dtype=INDEX_DTYPE, mode='w+',
+                                shape=(n_frames,))
+        self._epoch_offset = time() - perf_counter()
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._started = datetime.now().isoformat()
+        self._write_header()
+        self._thread.start()
+
+    @property
+    def active(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, first_index: int, frame_counters: Sequence[int], timestamp: float):
+        """ Queue frames just written in the ring (from first_index) with their camera counters"""
+        if not self._stop.is_set():
+            self._queue.put((first_index, frame_counters, timestamp))
+
+    def stop(self, wait: bool = True):
+        """ Stop the recording, the already queued frames being written"""
+        self._stop.set()
+        self._queue.put(None)
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _write_loop(self):
+        try:
+            while self.written < self.n_frames:
+                job = self._queue.get()
+                if job is None:
+                    break
+                first_index, frame_counters, timestamp = job
+                for ind, counter in enumerate(frame_counters):
+                    if self.written >= self.n_frames:
+                        break
+                    if not self.ring.copy_frame(first_index + ind, self._frames[self.written]):
+                        self.lost += 1  # overwritten before or while being copied
+                        continue
+                    self._index[self.written] = (counter, timestamp + self._epoch_offset)
+                    self.written += 1
+        except Exception as e:
+            logger.exception(f'Recording to {self.path} failed: {e}')
+        finally:
+            self._stop.set()
+            self._close()
+            if self.on_finished is not None:
+                self.on_finished(self)
+
+    def _close(self):
+        self._frames.flush()
+        self._index.flush()
+        del self._frames, self._index
+        frame_size = int(np.prod(self.ring.shape)) * self.ring.dtype.itemsize
+        os.truncate(self.path.with_suffix('.raw'), self.written * frame_size)
+        os.truncate(self.path.with_suffix('.index'), self.written * INDEX_DTYPE.itemsize)
+        self._write_header()
+
+    def _write_header(self):
+        header = dict(shape=list(self.ring.shape), dtype=self.ring.dtype.str, order='C',
+                      n_frames=self.n_frames, n_written=self.written, n_lost=self.lost,
+                      index_dtype=[list(field) for field in INDEX_DTYPE.descr],
+                      started=self._started, **self.metadata)
+        self.path.with_suffix('.json').write_text(json.dumps(header, indent=2, default=str))
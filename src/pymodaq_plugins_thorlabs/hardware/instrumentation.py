@@ -0,0 +1,268 @@
+"""
+Opt-in instrumentation of the calls to the vendor libraries.
+
+Classes of the hardware wrappers (kinesis, powermeter, ccsxxx) are decorated with ``instrument``. When the
+instrumentation is enabled in the plugin configuration file::
+
+    [instrumentation]
+    enabled = true
+    dump_interval_s = 10  # periodic dump, 0 to disable it
+    dump_path = ''  # json file where to dump the statistics, if empty they are logged
+
+each public method (and property) of these classes is wrapped to record its latency into a
+``LatencyHistogram`` and to count the calls. When disabled (the default) the classes are left untouched,
+hence there is no overhead at all.
+
+The recorded statistics can be accessed with::
+
+    from pymodaq_plugins_thorlabs.hardware.instrumentation import instrumentation
+    instrumentation.snapshot()
+"""
+import atexit
+import functools
+import json
+import threading
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+from typing import Dict, List, Optional
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.utils import Config
+
+logger = set_logger(get_module_name(__file__))
+config = Config()
+
+
+class LatencyHistogram:
+    """ HDR like histogram of durations (in ns)
+
+    Values are bucketed by powers of two, each power of two being split into 2**sub_bucket_bits linear
+    sub buckets, giving a constant relative precision (about 6% with the default 4 bits) from the ns up to
+    hours, with a fixed memory footprint and an O(1) recording cost.
+
+    Recording is not locked: concurrent recordings from several threads may (rarely) lose a count.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 4):
+        self._sub_bits = sub_bucket_bits
+        self._sub_count = 1 << sub_bucket_bits
+        self._counts: List[int] = [0] * (self._sub_count * (66 - sub_bucket_bits))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self._sub_bits - 1
+        if shift <= 0:
+            return value
+        return self._sub_count * shift + (value >> shift)
+
+    def _bucket_range(self, index: int) -> (int, int):
+        if index < 2 * self._sub_count:
+            return index, index + 1
+        shift = index // self._sub_count - 1
+        top = index - self._sub_count * shift
+        return top << shift, (top + 1) << shift
+
+    def record(self, value: int):
+        """ Record a duration in ns"""
+        if value < 0:
+            value = 0
+        self._counts[self._index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def reset(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.
+
+    def percentile(self, percent: float) -> float:
+        """ Get the duration (in ns) below which percent % of the recorded durations are"""
+        if self.count == 0:
+            return 0.
+        threshold = percent / 100 * self.count
+        cumulated = 0
+        for index, count in enumerate(self._counts):
+            cumulated += count
+            if count and cumulated >= threshold:
+                low, high = self._bucket_range(index)
+                return min(max((low + high - 1) / 2, self.min), self.max)
+        return float(self.max)
+
+    def to_dict(self, percentiles=(50, 90, 99, 99.9)) -> dict:
+        """ Summary of the histogram, durations in µs"""
+        summary = dict(count=self.count,
+                       mean_us=self.mean / 1e3,
+                       min_us=self.min / 1e3,
+                       max_us=self.max / 1e3)
+        for percent in percentiles:
+            summary[f'p{percent:g}_us'] = self.percentile(percent) / 1e3
+        return summary
+
+
+class CallStatistics:
+    """ Latency histogram and call rate of a given wrapped function"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self._start = perf_counter()
+        self._last_snapshot_time = self._start
+        self._last_snapshot_count = 0
+
+    def snapshot(self, reset: bool = False) -> dict:
+        now = perf_counter()
+        count = self.histogram.count
+        elapsed = now - self._last_snapshot_time
+        summary = self.histogram.to_dict()
+        summary['errors'] = self.errors
+        summary['calls_per_s'] = (count - self._last_snapshot_count) / elapsed if elapsed > 0 else 0.
+        summary['mean_calls_per_s'] = count / (now - self._start) if now > self._start else 0.
+        self._last_snapshot_time = now
+        self._last_snapshot_count = count
+        if reset:
+            self.histogram.reset()
+            self.errors = 0
+            self._start = now
+            self._last_snapshot_count = 0
+        return summary
+
+
+class Instrumentation:
+    """ Registry of the call statistics of the instrumented classes"""
+
+    def __init__(self):
+        self.enabled: bool = config('instrumentation', 'enabled')
+        self._stats: Dict[str, CallStatistics] = {}
+        self._lock = threading.Lock()
+        self._dump_timer: Optional[threading.Timer] = None
+        self._dump_interval = 0.
+        self._dump_path: Optional[Path] = None
+
+    def get_statistics(self, name: str) -> CallStatistics:
+        stats = self._stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(name, CallStatistics(name))
+        return stats
+
+    def snapshot(self, reset: bool = False) -> Dict[str, dict]:
+        """ Get the summary of all the recorded statistics, keyed by Class.method"""
+        with self._lock:
+            stats = list(self._stats.values())
+        return {stat.name: stat.snapshot(reset) for stat in sorted(stats, key=lambda stat: stat.name)}
+
+    def reset(self):
+        self.snapshot(reset=True)
+
+    def dump(self, path: Optional[Path] = None):
+        """ Dump the snapshot as a json file if a path is given otherwise in the log"""
+        snapshot = self.snapshot()
+        if path is not None:
+            Path(path).write_text(json.dumps(snapshot, indent=2))
+        else:
+            for name, summary in snapshot.items():
+                logger.info(f"{name}: {summary['count']} calls ({summary['calls_per_s']:.1f}/s), "
+                            f"median {summary['p50_us']:.1f} µs, p99 {summary['p99_us']:.1f} µs, "
+                            f"max {summary['max_us']:.1f} µs")
+
+    def start_periodic_dump(self, interval: float, path: Optional[Path] = None):
+        """ Dump the statistics every interval (in s) from a daemon thread"""
+        self.stop_periodic_dump()
+        self._dump_interval = interval
+        self._dump_path = path
+        self._schedule_dump()
+
+    def stop_periodic_dump(self):
+        if self._dump_timer is not None:
+            self._dump_timer.cancel()
+            self._dump_timer = None
+
+    def _schedule_dump(self):
+        self._dump_timer = threading.Timer(self._dump_interval, self._periodic_dump)
+        self._dump_timer.daemon = True
+        self._dump_timer.start()
+
+    def _periodic_dump(self):
+        try:
+            self.dump(self._dump_path)
+        except Exception as e:
+            logger.warning(f'Could not dump the instrumentation statistics: {e}')
+        self._schedule_dump()
+
+
+instrumentation = Instrumentation()
+
+if instrumentation.enabled:
+    _dump_path = Path(config('instrumentation', 'dump_path')) if config('instrumentation', 'dump_path') else None
+    if config('instrumentation', 'dump_interval_s') > 0:
+        instrumentation.start_periodic_dump(config('instrumentation', 'dump_interval_s'), _dump_path)
+    if _dump_path is not None:
+        atexit.register(instrumentation.dump, _dump_path)
+
+
+_running = threading.local()  # keys of the instrumented calls being executed by each thread
+
+
+def _timed(func, name: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not instrumentation.enabled:
+            return func(*args, **kwargs)
+        key = f'{type(args[0]).__name__}.{name}' if args else name
+        running = _running.__dict__.setdefault('keys', set())
+        if key in running:  # a decorated parent method called through super(), recorded by the outer call
+            return func(*args, **kwargs)
+        stats = instrumentation.get_statistics(key)
+        running.add(key)
+        start = perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.histogram.record(perf_counter_ns() - start)
+            running.discard(key)
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def instrument(cls):
+    """ Class decorator wrapping the public methods and properties of a hardware wrapper class
+
+    The class is returned untouched if the instrumentation is not enabled in the configuration. Only the
+    attributes defined by the class itself are wrapped, inherited ones being wrapped when decorating the
+    parent class. Statistics are keyed by the name of the class of the instance and of the method, a parent
+    method called through super() being only recorded as part of the overriding one.
+    """
+    if not instrumentation.enabled:
+        return cls
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith('_'):
+            continue
+        if isinstance(attribute, property):
+            setattr(cls, name, property(
+                _timed(attribute.fget, name) if attribute.fget is not None else None,
+                _timed(attribute.fset, f'{name}.setter') if attribute.fset is not None else None,
+                attribute.fdel, attribute.__doc__))
+        elif isinstance(attribute, (staticmethod, classmethod)):
+            continue
+        elif callable(attribute) and not isinstance(attribute, type) and \
+                not getattr(attribute, '__instrumented__', False):
+            setattr(cls, name, _timed(attribute, name))
+    return cls
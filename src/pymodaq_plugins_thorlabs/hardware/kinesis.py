@@ -1,7 +1,8 @@
 import clr
 import sys
-from typing import Dict
-from time import sleep
+import threading
+from typing import Dict, Iterable
+from time import sleep, perf_counter
 
 from System import Decimal
 from System import Action
@@ -9,6 +10,8 @@ from System import UInt64
 from System import UInt32
 import logging
 
+from pymodaq_plugins_thorlabs.hardware.instrumentation import instrument
+
 kinesis_path = 'C:\\Program Files\\Thorlabs\\Kinesis'
 sys.path.append(kinesis_path)
 
@@ -52,8 +55,10 @@ serialnumbers_kcube_dcservo = _sn_list(KCubeDCServo.KCubeDCServo.DevicePrefix)
 serialnumbers_inertial_motor = [str(ser) for ser in Device.DeviceManagerCLI.GetDeviceList(InertialMotor.KCubeInertialMotor.DevicePrefix_KIM101)] 
 
 
+@instrument
 class Kinesis:
     default_units = ''
+    polling_period = 250
 
     def __init__(self):
         self._device = None
@@ -61,7 +66,31 @@ class Kinesis:
     def connect(self, serial: int):
         self._device.Connect(serial)
         self._device.WaitForSettingsInitialized(5000)
-        self._device.StartPolling(250)
+        self._device.StartPolling(self.polling_period)
+
+    def set_polling_period(self, period: int):
+        """ Change the period (in ms) at which the device position and status are updated"""
+        self._device.StopPolling()
+        self.polling_period = int(period)
+        self._device.StartPolling(self.polling_period)
+
+    def get_velocity_params(self) -> (float, float):
+        """ Get the maximum velocity and the acceleration used for the moves"""
+        params = self._device.GetVelocityParams()
+        return Decimal.ToDouble(params.MaxVelocity), Decimal.ToDouble(params.Acceleration)
+
+    def set_velocity_params(self, velocity: float, acceleration: float):
+        self._device.SetVelocityParams(Decimal(velocity), Decimal(acceleration))
+
+    def get_velocity_limits(self) -> (float, float):
+        """ Get the maximum velocity and acceleration allowed by the stage"""
+        limits = self._device.AdvancedMotorLimits
+        return Decimal.ToDouble(limits.VelocityMaximum), Decimal.ToDouble(limits.AccelerationMaximum)
+
+    def get_travel_limits(self) -> (float, float):
+        """ Get the minimum and maximum positions of the stage"""
+        params = self._device.GetStageAxisParams()
+        return Decimal.ToDouble(params.MinPosition), Decimal.ToDouble(params.MaxPosition)
 
     def close(self):
         """
@@ -144,6 +173,7 @@ class Kinesis:
         return units
 
 
+@instrument
 class IntegratedStepper(Kinesis):
     """ Specific Kinesis class for Integrated Stepper motor"""
 
@@ -167,10 +197,15 @@ class IntegratedStepper(Kinesis):
     def get_position(self, **kwargs):
         return Decimal.ToDouble(self._device.ContinuousRotationPosition)
 
+    def move_continuous(self, forward: bool = True):
+        """ Rotate at the velocity set with set_velocity_params until stop is called"""
+        self._device.MoveContinuous(Generic.MotorDirection.Forward if forward else Generic.MotorDirection.Backward)
+
     def get_units(self, *args, **kwargs) -> str:
         return super().get_units()
 
 
+@instrument
 class BrushlessMotorChannel(Kinesis):
     properties = ['MaxPosition', 'MinPosition',
                   'MaxAcceleration', 'MaxDecceleration',
@@ -203,13 +238,17 @@ class BrushlessMotorChannel(Kinesis):
             raise (Exception("no Stage Connected"))
         else:
             self.motorConfiguration = self._device.LoadMotorConfiguration(self._device.DeviceID)
-        self._device.StartPolling(250)
+        self._device.StartPolling(self.polling_period)
         self._device.EnableDevice()
 
+    def get_velocity_limits(self) -> (float, float):
+        return self.get_property('MaxVelocity'), self.get_property('MaxAcceleration')
+
     def get_position(self) -> float:
         return Decimal.ToDouble(self._device.get_DevicePosition())
 
 
+@instrument
 class BrushlessDCMotor(Kinesis):
     """ Specific Kinesis class for Brushless DC Motors"""
     n_channels = 3
@@ -232,6 +271,11 @@ class BrushlessDCMotor(Kinesis):
         self._channels[channel].connect()
         return self._channels[channel]
 
+    def get_channel(self, channel: int = 1) -> BrushlessMotorChannel:
+        if channel not in self._channels:
+            self.init_channel(channel)
+        return self._channels[channel]
+
     def get_position(self, channel: int = 1) -> float:
         if channel not in self._channels:
             self.init_channel(channel)
@@ -275,6 +319,7 @@ class BrushlessDCMotor(Kinesis):
         return self._channels[channel].get_target_position()
 
 
+@instrument
 class Flipper(Kinesis):
     """ Specific Kinesis class for Flipper"""
 
@@ -298,7 +343,11 @@ class Flipper(Kinesis):
             position = 1
         else:
             position = 2
-        self._device.SetPosition(UInt32(position), 0)
+        if callback is not None:
+            callback = Action[UInt64](callback)
+        else:
+            callback = 0
+        self._device.SetPosition(UInt32(position), callback)
 
     def get_position(self, **kwargs):
         position = int(self._device.Position)
@@ -309,6 +358,7 @@ class Flipper(Kinesis):
         return position
 
 
+@instrument
 class Piezo(Kinesis):
     default_units = 'V'
 
@@ -338,6 +388,7 @@ class Piezo(Kinesis):
     def stop(self):
         pass
 
+@instrument
 class KIM101(Kinesis): 
     default_units = ' '
 
@@ -380,13 +431,49 @@ class KIM101(Kinesis):
     def home(self, channel: int): 
         self._device.MoveTo(self._channel[channel-1], 0, 6000)
 
-    def stop(self): 
-        pass
+    def move_abs_many(self, positions: Dict[int, int], timeout: float = 6.):
+        """ Move several channels together to their target positions (channel: position)
+
+        The moves are started at once with the non blocking MoveTo, their completion being signaled by the Kinesis
+        callbacks, then waited for with a single deadline: a tip/tilt step lasts as long as the longest of its moves
+        instead of their sum. The channels still moving at the deadline are stopped before raising a TimeoutError.
+        """
+        done = {}
+        for channel, position in positions.items():
+            if self.get_position(channel) == int(position):
+                continue
+            done[channel] = threading.Event()
+            self._device.MoveTo(self._channel[channel-1], int(position),
+                                Action[UInt64](lambda val, event=done[channel]: event.set()))
+        deadline = perf_counter() + timeout
+        for event in done.values():
+            event.wait(max(deadline - perf_counter(), 0.))
+        late = [channel for channel, event in done.items() if not event.is_set()]
+        if late:
+            for channel in late:
+                self.stop(channel)
+            raise TimeoutError(f'The channels {late} of the KIM101 did not reach their target within {timeout} s')
+
+    def move_rel_many(self, increments: Dict[int, int], timeout: float = 6.):
+        """ Move several channels together by their increments (channel: increment), see move_abs_many"""
+        self.move_abs_many({channel: self.get_position(channel) + int(increment)
+                            for channel, increment in increments.items() if int(increment) != 0}, timeout)
+
+    def home_many(self, channels: Iterable[int], timeout: float = 6.):
+        """ Move several channels together to their zero position, see move_abs_many"""
+        self.move_abs_many({channel: 0 for channel in channels}, timeout)
+
+    def stop(self, channel: int = None):
+        """ Stop the given channel, all of them if None"""
+        channels = range(1, len(self._channel) + 1) if channel is None else [channel]
+        for channel in channels:
+            self._device.Stop(self._channel[channel-1])
 
     def close(self): 
         self._device.StopPolling()
         self._device.Disconnect()
 
+@instrument
 class DCServoTCube(Kinesis):
     """ Specific Kinesis class for Brushless DC Motors"""
     n_channels = 1
@@ -411,6 +498,7 @@ class DCServoTCube(Kinesis):
         return Decimal.ToDouble(self._device.get_DevicePosition())
 
 
+@instrument
 class DCServoKCube(Kinesis):
     """ Specific Kinesis class for KCube controllers"""
     n_channels = 1
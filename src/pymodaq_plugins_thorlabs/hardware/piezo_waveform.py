@@ -0,0 +1,190 @@
+"""
+Voltage waveforms (dithering, lock-in modulation...) streamed to the KPZ101 piezo controller.
+
+One period of the waveform (sine, triangle, square, sawtooth or an arbitrary one loaded from a file) is precomputed
+as a numpy array of voltages. A worker thread then sets the output voltage at each update, on an absolute schedule
+(t0 + n / rate) so that delays do not accumulate: the thread sleeps until shortly before the update time and spins
+for the last instants, sleep being too coarse on some platforms. The voltage written is the one of the period at
+the phase frac(frequency * (t - t0)) of the scheduled time, so that the waveform is played at the requested
+frequency whatever the update rate (the update rate only setting how finely it is sampled), and its phase stays
+locked to the time when an update is late, the missed updates being counted as skipped.
+
+The streamer reports the achieved update rate and the timing jitter (lateness of the updates with respect to their
+schedule) in a WaveformStats.
+"""
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+SHAPES = ['sine', 'triangle', 'square', 'sawtooth', 'file']
+SPIN_TIME = 2e-3  # s, the last instants before an update are spent spinning instead of sleeping
+PERIOD_SAMPLES = 1000  # resolution of the precomputed period of the waveforms
+
+
+waveform_params = [
+    {'title': 'Waveform:', 'name': 'waveform', 'type': 'group', 'expanded': False, 'children': [
+        {'title': 'Shape:', 'name': 'shape', 'type': 'list', 'value': 'sine', 'limits': SHAPES},
+        {'title': 'Amplitude (V):', 'name': 'amplitude', 'type': 'float', 'value': 1., 'min': 0.,
+         'tip': 'Half of the peak to peak voltage'},
+        {'title': 'Offset (V):', 'name': 'offset', 'type': 'float', 'value': 10.},
+        {'title': 'Frequency (Hz):', 'name': 'frequency', 'type': 'float', 'value': 10., 'min': 0.001},
+        {'title': 'Update rate (Hz):', 'name': 'rate', 'type': 'float', 'value': 500., 'min': 1.},
+        {'title': 'Waveform file:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+         'tip': 'npy or text file with the voltages of one period, played at the frequency'},
+        {'title': 'Max voltage (V):', 'name': 'max_voltage', 'type': 'float', 'value': 75., 'min': 0.},
+        {'title': 'Start waveform:', 'name': 'start', 'type': 'bool_push', 'value': False, 'label': 'Start'},
+        {'title': 'Stop waveform:', 'name': 'stop', 'type': 'bool_push', 'value': False, 'label': 'Stop'},
+        {'title': 'Achieved rate (Hz):', 'name': 'achieved_rate', 'type': 'float', 'value': 0., 'readonly': True},
+        {'title': 'Jitter rms (µs):', 'name': 'jitter', 'type': 'float', 'value': 0., 'readonly': True},
+        {'title': 'Jitter max (µs):', 'name': 'jitter_max', 'type': 'float', 'value': 0., 'readonly': True},
+        {'title': 'Skipped samples:', 'name': 'skipped', 'type': 'int', 'value': 0, 'readonly': True},
+    ]}]
+
+
+def make_waveform(shape: str, amplitude: float, offset: float, n_samples: int = PERIOD_SAMPLES) -> np.ndarray:
+    """ Voltages of one period of a periodic waveform, sampled on n_samples phases"""
+    phase = np.arange(n_samples) / n_samples
+    if shape == 'sine':
+        wave = np.sin(2 * np.pi * phase)
+    elif shape == 'triangle':
+        wave = 1 - 4 * np.abs(((phase + 0.25) % 1) - 0.5)
+    elif shape == 'square':
+        wave = np.where(phase < 0.5, 1., -1.)
+    elif shape == 'sawtooth':
+        wave = 2 * phase - 1
+    else:
+        raise ValueError(f'Unknown waveform shape: {shape}')
+    return offset + amplitude * wave
+
+
+def load_waveform(path: Union[str, Path]) -> np.ndarray:
+    """ Voltages of one period from a npy or text file"""
+    path = Path(path)
+    if path.suffix == '.npy':
+        voltages = np.load(path)
+    else:
+        voltages = np.loadtxt(path, delimiter=',' if path.suffix == '.csv' else None)
+    return np.asarray(voltages, dtype=np.float64).ravel()
+
+
+@dataclass
+class WaveformStats:
+    """ Timing statistics of the updates since the start of the waveform"""
+    updates: int = 0
+    skipped: int = 0
+    achieved_rate: float = 0.  # Hz
+    jitter_rms: float = 0.  # s, rms lateness of the updates with respect to their schedule
+    jitter_max: float = 0.  # s
+
+
+class WaveformStreamer:
+    """ Play a voltage waveform in a loop from a timed worker thread (see module docstring)
+
+    Parameters
+    ----------
+    set_voltage: callable
+        function setting the output voltage of the controller
+    voltages: ndarray
+        one period of the waveform
+    frequency: float
+        frequency of the waveform in Hz
+    rate: float
+        update rate in Hz
+    on_stats: callable
+        called (from the worker thread) with the WaveformStats every report_interval seconds
+    """
+
+    def __init__(self, set_voltage: Callable[[float], None], voltages: np.ndarray, frequency: float, rate: float,
+                 on_stats: Callable[[WaveformStats], None] = None, report_interval: float = 1.):
+        self._set_voltage = set_voltage
+        self.voltages = np.asarray(voltages, dtype=np.float64)
+        self.frequency = frequency
+        self.rate = rate
+        self.on_stats = on_stats
+        self.report_interval = report_interval
+        self.error: Optional[Exception] = None
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lateness_sum = 0.
+        self._lateness_sum2 = 0.
+        self._lateness_max = 0.
+        self._updates = 0
+        self._skipped = 0
+        self._t0 = 0.
+        self._last = 0.
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set()
+
+    @property
+    def stats(self) -> WaveformStats:
+        updates = self._updates
+        if updates == 0:
+            return WaveformStats()
+        mean = self._lateness_sum / updates
+        variance = max(self._lateness_sum2 / updates - mean ** 2, 0.)
+        elapsed = self._last - self._t0
+        return WaveformStats(updates=updates, skipped=self._skipped,
+                             achieved_rate=(updates - 1) / elapsed if elapsed > 0 else 0.,
+                             jitter_rms=float(np.sqrt(variance + mean ** 2)), jitter_max=self._lateness_max)
+
+    def start(self):
+        if self.running:
+            return
+        self.error = None
+        self._lateness_sum = self._lateness_sum2 = self._lateness_max = 0.
+        self._updates = self._skipped = 0
+        self._running.set()
+        self._thread = threading.Thread(target=self._stream, name='WaveformStreamer', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> WaveformStats:
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.stats
+
+    def _stream(self):
+        period = 1 / self.rate
+        n_samples = len(self.voltages)
+        self._t0 = perf_counter()
+        next_report = self._t0 + self.report_interval
+        index = 0  # index of the next scheduled update since t0
+        try:
+            while self._running.is_set():
+                due = self._t0 + index * period
+                delay = due - perf_counter()
+                if delay > SPIN_TIME:
+                    sleep(delay - SPIN_TIME)
+                while perf_counter() < due:
+                    pass
+                now = perf_counter()
+                current = max(int((now - self._t0) * self.rate), index)  # late updates skip samples
+                self._skipped += current - index
+                index = current
+                phase = (self.frequency * index * period) % 1.
+                self._set_voltage(float(self.voltages[int(phase * n_samples) % n_samples]))
+                lateness = now - (self._t0 + index * period)
+                self._lateness_sum += lateness
+                self._lateness_sum2 += lateness ** 2
+                self._lateness_max = max(self._lateness_max, lateness)
+                self._updates += 1
+                self._last = now
+                index += 1
+                if self.on_stats is not None and now >= next_report:
+                    next_report = now + self.report_interval
+                    self.on_stats(self.stats)
+        except Exception as e:
+            self.error = e
+            logger.warning(f'Waveform streaming stopped: {e}')
+            self._running.clear()
@@ -0,0 +1,96 @@
+"""
+Bounded acquisition of positions from devices that may report an unknown state.
+
+pylablib based stages (PRM1Z8 rotation mount, MFF101 flipper...) return None as position when the device
+state is unknown (during a flip, just after power up...). Instead of spinning on the device until a valid
+value is returned, the PositionPoller retries with an exponential backoff until a deadline and, if no valid
+value could be read, returns the last known-good position flagged as stale.
+
+The StalePositionPlugin mixin reflects the stale flag on the stale_position led of the plugins.
+"""
+from dataclasses import dataclass
+from time import perf_counter, sleep
+from typing import Callable, Optional
+
+from pymodaq_utils.utils import ThreadCommand
+
+from pymodaq_plugins_thorlabs.utils import Config
+
+config = Config()
+
+
+@dataclass
+class PolledPosition:
+    """ A position value with the time (perf_counter) at which it has been read from the device
+
+    stale is True if the device could not report a valid position before the deadline, value is then the
+    last known-good position (None if the device never reported one)
+    """
+    value: Optional[float]
+    timestamp: float
+    stale: bool = False
+
+    @property
+    def age(self) -> float:
+        return perf_counter() - self.timestamp
+
+
+class PositionPoller:
+    """ Read a position with exponential backoff and deadline, caching the last known-good value
+
+    Parameters
+    ----------
+    read_position: callable
+        function returning the position from the device, None if unknown
+    timeout: float
+        maximum time (in s) spent trying to get a valid position
+    initial_delay: float
+        delay (in s) before the first retry, doubled at each retry
+    max_delay: float
+        maximum delay (in s) between two retries
+    """
+
+    def __init__(self, read_position: Callable[[], Optional[float]],
+                 timeout: float = config('position_polling', 'timeout_s'),
+                 initial_delay: float = config('position_polling', 'initial_delay_s'),
+                 max_delay: float = config('position_polling', 'max_delay_s')):
+        self._read_position = read_position
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.last_known: Optional[PolledPosition] = None
+
+    def read(self, timeout: Optional[float] = None) -> PolledPosition:
+        """ Get the position from the device or the last known-good one flagged as stale"""
+        deadline = perf_counter() + (self.timeout if timeout is None else timeout)
+        delay = self.initial_delay
+        while True:
+            value = self._read_position()
+            now = perf_counter()
+            if value is not None:
+                self.last_known = PolledPosition(value, now)
+                return self.last_known
+            if now + delay > deadline:
+                break
+            sleep(delay)
+            delay = min(2 * delay, self.max_delay)
+        if self.last_known is None:
+            return PolledPosition(None, now, stale=True)
+        return PolledPosition(self.last_known.value, self.last_known.timestamp, stale=True)
+
+
+class StalePositionPlugin:
+    """ Mixin updating the stale_position led (a readonly led parameter) of a plugin using a PositionPoller
+
+    stale_description names what could not be read in the status logged when the device stops reporting it.
+    """
+    stale_description = 'position'
+
+    def update_stale_status(self, position: PolledPosition):
+        """ Update the stale_position led and log when the device stops/starts reporting its position"""
+        if position.stale != self.settings['stale_position']:
+            self.settings.child('stale_position').setValue(position.stale)
+            if position.stale:
+                self.emit_status(ThreadCommand('Update_Status', [
+                    f'Unknown {self.stale_description}, using the last known one ({position.age:.1f} s old)',
+                    'log']))
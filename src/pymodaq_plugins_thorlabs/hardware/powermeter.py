@@ -35,9 +35,18 @@ import importlib
 from pathlib import Path
 import ctypes
 import functools
+from collections import defaultdict
+from time import perf_counter
+from typing import Callable, Dict
 
 from pymodaq.utils import daq_utils as utils
 from pymodaq.utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.hardware.instrumentation import instrument
+from pymodaq_plugins_thorlabs.utils import Config
+
+config = Config()
+
 logger = set_logger(get_module_name(__file__))
 if utils.is_64bits():
     path_dll = str(Path(os.environ['VXIPNPPATH64']).joinpath('Win64', 'Bin'))
@@ -67,16 +76,122 @@ if module_error:
             f"{tlpm_path('Examples')}"
     raise ModuleNotFoundError(error)
 
+class ErrorAccounting:
+    """ Per function error counters with rate limited logging
+
+    The first error of a given function is logged immediately, the following ones at most once every
+    log_interval seconds (with the number of errors that have not been logged in between).
+    """
+
+    def __init__(self, log_interval: float = config('TLPM', 'error_log_interval_s')):
+        self.log_interval = log_interval
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.last_errors: Dict[str, str] = {}
+        self._last_log_time: Dict[str, float] = {}
+        self._not_logged: Dict[str, int] = defaultdict(int)
+
+    def record(self, function: str, message: str):
+        self.counts[function] += 1
+        self.last_errors[function] = message
+        now = perf_counter()
+        if now - self._last_log_time.get(function, -self.log_interval) >= self.log_interval:
+            not_logged = self._not_logged.pop(function, 0)
+            logger.warning(f'The function {function} returned the error: {message}'
+                           f'{f" ({not_logged} other errors since last report)" if not_logged else ""}')
+            self._last_log_time[function] = now
+        else:
+            self._not_logged[function] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def to_dict(self) -> dict:
+        return dict(counts=dict(self.counts), last_errors=dict(self.last_errors))
+
+
+class CircuitBreaker:
+    """ Stop calling a failing device and retry to connect to it with an exponential backoff
+
+    The breaker opens after failure_threshold consecutive failures. While open, calls are refused until
+    the backoff delay has elapsed, then a reconnection is attempted: on failure the delay is doubled (up to
+    backoff_max), on success the breaker is half open. A half open breaker lets the calls through but opens
+    again on their first failure, with a doubled delay: only a call succeeding closes the breaker and resets
+    the delay, so that a dying device whose session still reopens is retried less and less often.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half open'
+
+    def __init__(self, failure_threshold: int = config('TLPM', 'failure_threshold'),
+                 backoff_initial: float = config('TLPM', 'backoff_initial_s'),
+                 backoff_max: float = config('TLPM', 'backoff_max_s')):
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.backoff = backoff_initial
+        self.retry_time = 0.
+
+    def success(self):
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info('Connection to the device recovered')
+        self.state = self.CLOSED
+        self.backoff = self.backoff_initial
+
+    def failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.backoff = min(2 * self.backoff, self.backoff_max)
+            self.retry_time = perf_counter() + self.backoff
+            logger.warning(f'Device still failing after reconnection. Next attempt in {self.backoff:.1f} s')
+        elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.retry_time = perf_counter() + self.backoff
+            logger.warning(f'{self.consecutive_failures} consecutive errors, device considered as '
+                           f'failing. Reconnection in {self.backoff:.1f} s')
+
+    def allow_call(self, reconnect: Callable[[], bool]) -> bool:
+        """ Check if a call can be sent to the device, attempting a reconnection if it is time to"""
+        if self.state != self.OPEN:
+            return True
+        if perf_counter() < self.retry_time:
+            return False
+        if reconnect():
+            self.state = self.HALF_OPEN
+            return True
+        self.backoff = min(2 * self.backoff, self.backoff_max)
+        self.retry_time = perf_counter() + self.backoff
+        logger.info(f'Reconnection failed, next attempt in {self.backoff:.1f} s')
+        return False
+
+    @property
+    def time_before_retry(self) -> float:
+        return max(0., self.retry_time - perf_counter()) if self.state == self.OPEN else 0.
+
+
 def error_handling(default_arg=None):
-    """decorator around TLPM functions to handle return if errors"""
+    """decorator around TLPM functions to handle return if errors
+
+    Exceptions are counted in the ErrorAccounting of the instance (errors attribute) and reported to its
+    CircuitBreaker (breaker attribute) if any. While the breaker is open, the device is not called and the
+    default value is returned.
+    """
     def error_management(func):
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        def wrapper(self, *args, **kwargs):
+            breaker: CircuitBreaker = getattr(self, 'breaker', None)
+            if breaker is not None and not breaker.allow_call(self.reconnect):
+                return default_arg
             try:
-                ret = func(*args, **kwargs)
-                return ret
+                return func(self, *args, **kwargs)
             except Exception as e:
-                logger.debug(f'The function {func.__name__} returned the error: {e}')
+                self.errors.record(func.__name__, str(e))
+                if breaker is not None:
+                    breaker.failure()
                 return default_arg
         return wrapper
     return error_management
@@ -94,12 +209,14 @@ class DeviceInfo:
                f' {"" if self.is_available else "not"} available'
 
 
+@instrument
 class GetInfos:
     def __init__(self, tlpm=None):
         if tlpm is None:
             tlpm = TLPM.TLPM()
         self._tlpm = tlpm
         self._Ndevices = 0
+        self.errors = ErrorAccounting()
 
     @error_handling(0)
     def get_connected_ressources_number(self):
@@ -136,12 +253,18 @@ Ndevices = infos.get_connected_ressources_number()
 DEVICE_NAMES = infos.get_devices_name()
 
 
+@instrument
 class CustomTLPM:
     def __init__(self, index=None):
         super().__init__()
         self._index = index
         self._tlpm = TLPM.TLPM()
+        self._resource_name = ''
+        self._dll_functions: Dict[str, Callable] = {}
+        self._last_exception = ''
         self.infos = GetInfos(self._tlpm)
+        self.errors = ErrorAccounting()
+        self.breaker = CircuitBreaker()
 
     def __enter__(self):
         device_name = self.infos.get_devices_name()[self._index]
@@ -155,31 +278,115 @@ class CustomTLPM:
         if index is not None:
             self._index = index
         device_name = self.infos.get_devices_name()[self._index]
-        self.open(device_name)
+        return self.open(device_name)
 
-    @error_handling(False)
-    def open(self, resource_name: str, id_query=True, reset=True):
+    def _open(self, resource_name: str, id_query=True, reset=True):
         resource = ctypes.create_string_buffer(1024)
         resource.value = resource_name.encode()
         id_query = ctypes.c_bool(id_query)
         reset = ctypes.c_bool(reset)
         self._tlpm.open(resource, id_query, reset)
+        self._resource_name = resource_name
+
+    @error_handling(False)
+    def open(self, resource_name: str, id_query=True, reset=True):
+        self._open(resource_name, id_query, reset)
         return True
 
-    @error_handling()
+    def reconnect(self) -> bool:
+        """ Close and reopen the last opened resource, used by the circuit breaker"""
+        try:
+            self._tlpm.close()
+        except Exception:
+            pass
+        try:
+            self._open(self._resource_name, reset=False)
+            return True
+        except Exception as e:
+            self.errors.record('reconnect', str(e))
+            return False
+
     def close(self):
-        self._tlpm.close()
+        """ Close the session, whatever the state of the circuit breaker"""
+        try:
+            self._tlpm.close()
+        except Exception as e:
+            self.errors.record('close', str(e))
+
+    def _call(self, function: str, *args) -> bool:
+        """ Call the TLPM_function of the dll and account for its returned status
+
+        The dll is called directly (when exposed by the TLPM.py wrapper) so that an error status is not
+        converted into an exception. Negative status are recorded in the error accounting and reported to
+        the circuit breaker.
+
+        Returns
+        -------
+        bool: True if the call succeeded
+        """
+        dll_function = self._dll_functions.get(function)
+        if dll_function is None:
+            dll_function = self._dll_functions[function] = self._get_dll_function(function)
+        status = dll_function(*args)
+        if status < 0:
+            self.errors.record(function, self._error_message(status))
+            self.breaker.failure()
+            return False
+        self.breaker.success()
+        return True
+
+    def _get_dll_function(self, function: str) -> Callable[..., int]:
+        dll = getattr(self._tlpm, 'dll', None)
+        if dll is not None and hasattr(dll, f'TLPM_{function}'):
+            dll_function = getattr(dll, f'TLPM_{function}')
+            return lambda *args: dll_function(self._tlpm.devSession, *args)
+
+        method = getattr(self._tlpm, function)
+
+        def status_from_exception(*args) -> int:
+            try:
+                method(*args)
+                return 0
+            except Exception as e:
+                self._last_exception = str(e)
+                return -1
+        return status_from_exception
+
+    def _error_message(self, status: int) -> str:
+        dll = getattr(self._tlpm, 'dll', None)
+        if dll is None:
+            return self._last_exception
+        message = ctypes.create_string_buffer(1024)
+        dll.TLPM_errorMessage(self._tlpm.devSession, ctypes.c_int(status), message)
+        return f'{message.value.decode()} (status {status})'
+
+    @property
+    def is_failing(self) -> bool:
+        """ True if the circuit breaker considers the device as failing"""
+        return self.breaker.state == CircuitBreaker.OPEN
+
+    @property
+    def status_message(self) -> str:
+        if not self.is_failing:
+            return f'Powermeter OK ({self.errors.total} errors since opening)'
+        function = max(self.errors.last_errors, key=lambda name: self.errors.counts[name], default='')
+        return (f'Powermeter failing: {self.breaker.consecutive_failures} consecutive errors, last one from '
+                f'{function}: {self.errors.last_errors.get(function, "")}. Reconnection in '
+                f'{self.breaker.time_before_retry:.1f} s')
 
     @error_handling('')
     def get_calibration(self):
         message = ctypes.create_string_buffer(1024)
-        self._tlpm.getCalibrationMsg(message)
+        if not self._call('getCalibrationMsg', message):
+            return ''
         return message.value.decode()
 
-    @error_handling(0.)
-    def get_power(self):
+    @error_handling(float('nan'))
+    def get_power(self) -> float:
+        """ Get the measured power in W, NaN if the measurement failed"""
         power = ctypes.c_double()
-        self._tlpm.measPower(ctypes.byref(power))
+        if not self._call('measPower', ctypes.byref(power)):
+            return float('nan')
         return power.value
 
     @property
@@ -188,23 +395,27 @@ class CustomTLPM:
         wavelength_min = ctypes.c_double()
         wavelength_max = ctypes.c_double()
 
-        self._tlpm.getWavelength(TLPM.TLPM_ATTR_MIN_VAL, ctypes.byref(wavelength_min))
-        self._tlpm.getWavelength(TLPM.TLPM_ATTR_MAX_VAL, ctypes.byref(wavelength_max))
+        if not (self._call('getWavelength', ctypes.c_int16(TLPM.TLPM_ATTR_MIN_VAL),
+                           ctypes.byref(wavelength_min)) and
+                self._call('getWavelength', ctypes.c_int16(TLPM.TLPM_ATTR_MAX_VAL),
+                           ctypes.byref(wavelength_max))):
+            return 500, 800
         return wavelength_min.value, wavelength_max.value
 
     @property
     @error_handling(-1)
     def wavelength(self):
         wavelength = ctypes.c_double()
-        self._tlpm.getWavelength(TLPM.TLPM_ATTR_SET_VAL, ctypes.byref(wavelength))
+        if not self._call('getWavelength', ctypes.c_int16(TLPM.TLPM_ATTR_SET_VAL),
+                          ctypes.byref(wavelength)):
+            return -1
         return wavelength.value
 
     @wavelength.setter
     @error_handling()
     def wavelength(self, wavelength: float):
         wavelength = ctypes.c_double(wavelength)
-        self._tlpm.setWavelength(wavelength)
-
+        self._call('setWavelength', wavelength)
 
 if __name__ == '__main__':
     from time import sleep
@@ -0,0 +1,203 @@
+"""
+Dark spectra library and correction of the CCSXXX spectra.
+
+Dark references are recorded for given integration times (averaging a few spectra) into a DarkLibrary, stored per
+spectrometer serial number as a compressed npz file in the ``ccs_darks`` folder of the plugin configuration
+directory. When no reference has been recorded for the current integration time, the dark is linearly interpolated
+(or extrapolated) from the two closest references in integration time: the dark signal being an offset plus a
+dark current proportional to the integration time.
+
+The SpectralCorrector then applies, vectorized and in place on the spectrum buffer:
+
+* the dark subtraction
+* the nonlinearity correction: counts divided by the polynomial c0 + c1 counts + c2 counts² + ...
+* the relative irradiance response: division by the (normalized) response of the spectrometer at each pixel
+
+Darks and nonlinearity are defined on raw counts: intensities (normalized, amplitude corrected spectra) are
+converted with the scale of each pixel (amplitude correction / ADC full scale). Raw uint16 spectra are converted
+once to float32 before being corrected.
+"""
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from pymodaq_utils.logger import set_logger, get_module_name
+
+from pymodaq_plugins_thorlabs.utils import Config
+
+logger = set_logger(get_module_name(__file__))
+config = Config()
+
+
+correction_params = [
+    {'title': 'Corrections', 'name': 'correction', 'type': 'group', 'children': [
+        {'title': 'Dark', 'name': 'dark', 'type': 'group', 'children': [
+            {'title': 'Subtract dark:', 'name': 'use', 'type': 'bool', 'value': False},
+            {'title': 'Spectra to average:', 'name': 'n_average', 'type': 'int', 'value': 10, 'min': 1},
+            {'title': 'Record dark:', 'name': 'record', 'type': 'bool_push', 'value': False, 'label': 'Record',
+             'tip': 'Record a dark reference for the current integration time, the light being blocked'},
+            {'title': 'References (ms):', 'name': 'references', 'type': 'str', 'value': '', 'readonly': True},
+            {'title': 'Clear library:', 'name': 'clear', 'type': 'bool_push', 'value': False, 'label': 'Clear'},
+        ]},
+        {'title': 'Nonlinearity', 'name': 'nonlinearity', 'type': 'group', 'children': [
+            {'title': 'Correct:', 'name': 'use', 'type': 'bool', 'value': False},
+            {'title': 'Coefficients:', 'name': 'coefficients', 'type': 'str', 'value': '1.0',
+             'tip': 'c0, c1, c2... counts are divided by c0 + c1 counts + c2 counts² + ...'},
+        ]},
+        {'title': 'Irradiance response', 'name': 'response', 'type': 'group', 'children': [
+            {'title': 'Correct:', 'name': 'use', 'type': 'bool', 'value': False},
+            {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+             'tip': 'npy or text file with two columns: wavelength (nm) and relative response'},
+        ]},
+    ]}]
+
+
+def dark_library_path(serial_number: str) -> Path:
+    name = ''.join(char if char.isalnum() else '_' for char in serial_number)
+    return config.config_path.parent.joinpath('ccs_darks', f'{name}.npz')
+
+
+class DarkLibrary:
+    """ Dark spectra (in counts) keyed by integration time, saved as a compressed npz file"""
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        self.path = Path(path) if path is not None else None
+        self.darks: Dict[float, np.ndarray] = {}
+        if self.path is not None and self.path.is_file():
+            self.load()
+
+    @property
+    def integration_times(self) -> np.ndarray:
+        return np.array(sorted(self.darks))
+
+    def load(self):
+        try:
+            with np.load(self.path) as library:
+                self.darks = {float(time): dark for time, dark in zip(library['integration_times'],
+                                                                       library['darks'])}
+        except Exception as e:
+            logger.warning(f'Could not load the dark library {self.path}: {e}')
+
+    def save(self):
+        if self.path is None:
+            return
+        times = self.integration_times
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(self.path, integration_times=times,
+                                darks=np.array([self.darks[time] for time in times], dtype=np.float32))
+        except OSError as e:
+            logger.warning(f'Could not save the dark library {self.path}: {e}')
+
+    def add(self, integration_time: float, dark: np.ndarray):
+        for time in list(self.darks):  # replace a reference recorded for the same integration time
+            if np.isclose(time, integration_time):
+                del self.darks[time]
+        self.darks[float(integration_time)] = np.asarray(dark, dtype=np.float32)
+        self.save()
+
+    def clear(self):
+        self.darks = {}
+        self.save()
+
+    def get(self, integration_time: float) -> Optional[np.ndarray]:
+        """ Dark for the integration time: the recorded one, or interpolated from the two closest ones"""
+        times = self.integration_times
+        if times.size == 0:
+            return None
+        exact = np.flatnonzero(np.isclose(times, integration_time))
+        if exact.size > 0:
+            return self.darks[times[exact[0]]]
+        if times.size == 1:
+            return self.darks[times[0]]
+        index = int(np.clip(np.searchsorted(times, integration_time), 1, times.size - 1))
+        t0, t1 = times[index - 1], times[index]
+        weight = (integration_time - t0) / (t1 - t0)
+        return (1 - weight) * self.darks[t0] + weight * self.darks[t1]
+
+
+def parse_coefficients(text: str) -> np.ndarray:
+    return np.array([float(value) for value in text.replace(';', ',').split(',') if value.strip()])
+
+
+def load_response(path: Union[str, Path], wavelengths: np.ndarray) -> np.ndarray:
+    """ Relative irradiance response of a two columns file interpolated on the wavelengths, normalized to 1"""
+    path = Path(path)
+    if path.suffix == '.npy':
+        data = np.load(path)
+    else:
+        data = np.loadtxt(path, delimiter=',' if path.suffix == '.csv' else None)
+    data = np.asarray(data, dtype=np.float64)
+    if data.shape[0] == 2 and data.shape[1] != 2:
+        data = data.T
+    order = np.argsort(data[:, 0])
+    response = np.interp(wavelengths, data[order, 0], data[order, 1])
+    response /= np.max(response)
+    response[response <= 0] = np.nan  # no response: corrected values are meaningless
+    return response
+
+
+class SpectralCorrector:
+    """ Apply dark, nonlinearity and irradiance response corrections in place (see module docstring)
+
+    Parameters
+    ----------
+    library: DarkLibrary
+    """
+
+    def __init__(self, library: DarkLibrary):
+        self.library = library
+        self.use_dark = False
+        self.use_nonlinearity = False
+        self.use_response = False
+        self.coefficients = np.array([1.])
+        self.response: Optional[np.ndarray] = None
+        self._recording: Optional[np.ndarray] = None
+        self._recorded = 0
+        self._to_record = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.use_dark or self.use_nonlinearity or (self.use_response and self.response is not None)
+
+    @property
+    def recording(self) -> bool:
+        return self._to_record > 0
+
+    def record(self, n_average: int):
+        """ Record the next n_average spectra as a dark reference (see add_dark_spectrum)"""
+        self._recording = None
+        self._recorded = 0
+        self._to_record = n_average
+
+    def add_dark_spectrum(self, counts: np.ndarray, integration_time: float) -> bool:
+        """ Accumulate a dark spectrum being recorded, return True once the reference is added to the library"""
+        if self._recording is None:
+            self._recording = np.zeros(counts.shape, dtype=np.float64)
+        self._recording += counts
+        self._recorded += 1
+        if self._recorded < self._to_record:
+            return False
+        self.library.add(integration_time, self._recording / self._recorded)
+        self._to_record = 0
+        self._recording = None
+        return True
+
+    def apply(self, spectrum: np.ndarray, integration_time: float,
+              scale: Union[float, np.ndarray] = 1.) -> np.ndarray:
+        """ Correct a spectrum, in place if it is a float array, scale converting counts into its unit"""
+        if not np.issubdtype(spectrum.dtype, np.floating):
+            spectrum = spectrum.astype(np.float32)
+        if self.use_dark or self.use_nonlinearity:
+            spectrum /= scale  # counts
+            if self.use_dark:
+                dark = self.library.get(integration_time)
+                if dark is not None:
+                    spectrum -= dark
+            if self.use_nonlinearity:
+                spectrum /= np.polyval(self.coefficients[::-1], spectrum)
+            spectrum *= scale
+        if self.use_response and self.response is not None:
+            spectrum /= self.response
+        return spectrum
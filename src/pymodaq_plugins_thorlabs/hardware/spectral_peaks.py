@@ -0,0 +1,151 @@
+"""
+Real-time peak analysis of the CCSXXX spectra.
+
+Peaks are the local maxima of the spectrum higher than the baseline (median of the spectrum) plus a threshold
+fraction of the spectrum dynamic, the highest ones being kept, at least a minimal distance apart. Their position
+is then refined to a sub-pixel precision, for all the peaks at once, either by:
+
+* parabolic: the vertex of the parabola through the maximum and its two neighbours, the FWHM being obtained from
+  the linear interpolation of the half maximum crossings
+* gaussian: a least square fit of a parabola on the logarithm of a window of pixels around the maximum (the fit
+  matrix is precomputed, a single product fits all the peaks), giving the center, FWHM and amplitude of a gaussian
+
+Positions and widths are converted to nm with the (calibrated) wavelength axis, using the local dispersion for the
+widths. Results are sorted by wavelength and padded with NaN up to the number of peaks, so that the emitted Data0D
+keep the same channels from one spectrum to the next.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+peak_params = [
+    {'title': 'Peaks', 'name': 'peaks', 'type': 'group', 'children': [
+        {'title': 'Track peaks:', 'name': 'enabled', 'type': 'bool', 'value': False,
+         'tip': 'Emit the wavelength, FWHM and amplitude of the peaks as Data0D for each spectrum'},
+        {'title': 'Number of peaks:', 'name': 'n_peaks', 'type': 'int', 'value': 1, 'min': 1},
+        {'title': 'Threshold:', 'name': 'threshold', 'type': 'float', 'value': 0.2, 'min': 0., 'max': 1.,
+         'tip': 'Minimal height above the baseline, in fraction of the spectrum dynamic'},
+        {'title': 'Min distance (pxls):', 'name': 'min_distance', 'type': 'int', 'value': 10, 'min': 1},
+        {'title': 'Refinement:', 'name': 'fit', 'type': 'list', 'value': 'gaussian',
+         'limits': ['parabolic', 'gaussian']},
+        {'title': 'Fit half window (pxls):', 'name': 'window', 'type': 'int', 'value': 3, 'min': 1,
+         'tip': 'The gaussian is fitted on 2 x half window + 1 pixels'},
+        {'title': 'Spectrum rate (Hz):', 'name': 'spectrum_rate', 'type': 'float', 'value': 1., 'min': 0.,
+         'tip': 'Rate at which the spectra are emitted along with the peaks, 0 to never emit them'},
+    ]}]
+
+FWHM_FACTOR = 2 * np.sqrt(2 * np.log(2))
+
+
+class PeakFinder:
+    """ Find and refine the peaks of spectra (see module docstring)
+
+    Parameters
+    ----------
+    wavelengths: ndarray
+        wavelength (nm) of each pixel
+    """
+
+    def __init__(self, wavelengths: np.ndarray):
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self._dispersion = np.abs(np.gradient(self.wavelengths))
+        self._pixels = np.arange(len(self.wavelengths), dtype=np.float64)
+        self.n_peaks = 1
+        self.threshold = 0.2
+        self.min_distance = 10
+        self.fit = 'gaussian'
+        self.window = 3
+
+    @property
+    def window(self) -> int:
+        return self._window
+
+    @window.setter
+    def window(self, window: int):
+        self._window = max(int(window), 1)
+        offsets = np.arange(-self._window, self._window + 1, dtype=np.float64)
+        self._offsets = offsets.astype(int)
+        # (3, n) least square matrix giving the coefficients (a, b, c) of a x² + b x + c
+        self._fit_matrix = np.linalg.pinv(np.vander(offsets, 3))
+
+    def find(self, spectrum: np.ndarray) -> np.ndarray:
+        """ Pixel indexes of the highest local maxima above the threshold, at least min_distance apart"""
+        baseline = np.median(spectrum)
+        level = baseline + self.threshold * (spectrum.max() - baseline)
+        center = spectrum[1:-1]
+        candidates = np.flatnonzero((center > spectrum[:-2]) & (center >= spectrum[2:]) & (center > level)) + 1
+        if candidates.size == 0:
+            return candidates
+        candidates = candidates[np.argsort(spectrum[candidates])[::-1]]
+        peaks = []
+        for candidate in candidates:
+            if all(abs(candidate - peak) >= self.min_distance for peak in peaks):
+                peaks.append(candidate)
+                if len(peaks) == self.n_peaks:
+                    break
+        return np.array(peaks, dtype=int)
+
+    def analyze(self, spectrum: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Wavelengths (nm), FWHM (nm) and amplitudes (above the baseline) of the n_peaks peaks
+
+        Sorted by wavelength and padded with NaN if less peaks are found.
+        """
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        wavelengths = np.full((self.n_peaks,), np.nan)
+        fwhms = np.full((self.n_peaks,), np.nan)
+        amplitudes = np.full((self.n_peaks,), np.nan)
+        peaks = self.find(spectrum)
+        if peaks.size > 0:
+            baseline = np.median(spectrum)
+            if self.fit == 'gaussian':
+                positions, widths, heights = self._gaussian(spectrum - baseline, peaks)
+            else:
+                positions, widths, heights = self._parabolic(spectrum - baseline, peaks)
+            order = np.argsort(positions)
+            positions, widths, heights = positions[order], widths[order], heights[order]
+            n = len(positions)
+            wavelengths[:n] = np.interp(positions, self._pixels, self.wavelengths)
+            fwhms[:n] = widths * np.interp(positions, self._pixels, self._dispersion)
+            amplitudes[:n] = heights
+        return wavelengths, fwhms, amplitudes
+
+    def _parabolic(self, spectrum: np.ndarray, peaks: np.ndarray):
+        left = spectrum[np.maximum(peaks - 1, 0)]
+        top = spectrum[peaks]
+        right = spectrum[np.minimum(peaks + 1, len(spectrum) - 1)]
+        curvature = left - 2 * top + right
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0.)
+        heights = top - 0.25 * (left - right) * delta
+        widths = np.array([self._half_max_width(spectrum, peak, height / 2)
+                           for peak, height in zip(peaks, heights)])
+        return peaks + delta, widths, heights
+
+    @staticmethod
+    def _half_max_width(spectrum: np.ndarray, peak: int, half: float) -> float:
+        """ Distance (pxls) between the half maximum crossings on both sides of a peak"""
+        below = np.flatnonzero(spectrum[:peak] < half)
+        above = np.flatnonzero(spectrum[peak:] < half)
+        if below.size == 0 or above.size == 0:
+            return np.nan
+        left, right = below[-1], peak + above[0]
+        left_cross = left + (half - spectrum[left]) / (spectrum[left + 1] - spectrum[left])
+        right_cross = right - 1 + (spectrum[right - 1] - half) / (spectrum[right - 1] - spectrum[right])
+        return right_cross - left_cross
+
+    def _gaussian(self, spectrum: np.ndarray, peaks: np.ndarray):
+        indexes = np.clip(peaks[:, np.newaxis] + self._offsets, 0, len(spectrum) - 1)
+        values = spectrum[indexes]
+        values = np.log(np.maximum(values, values.max(axis=1, keepdims=True) * 1e-6))
+        a, b, c = self._fit_matrix @ values.T  # one fit per peak
+        with np.errstate(divide='ignore', invalid='ignore'):
+            valid = a < 0
+            delta = np.where(valid, -b / (2 * a), np.nan)
+            sigma = np.where(valid, np.sqrt(-1 / (2 * a)), np.nan)
+            heights = np.where(valid, np.exp(c - b ** 2 / (4 * a)), np.nan)
+        inside = np.abs(delta) <= self.window  # fits off the window are unreliable, fall back on the maximum
+        delta = np.where(inside, delta, 0.)
+        sigma = np.where(inside, sigma, np.nan)
+        heights = np.where(inside, heights, spectrum[peaks])
+        return peaks + delta, FWHM_FACTOR * sigma, heights
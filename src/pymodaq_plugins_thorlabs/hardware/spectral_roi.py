@@ -0,0 +1,113 @@
+"""
+Spectral regions of interest and pixel binning of the CCSXXX spectra.
+
+ROIs are given in nm as a comma separated list of ranges (for instance ``"500-550, 700-720"``) and mapped once,
+when set, to pixel slices of the wavelength axis. Each frame then only costs slicing, an optional binning (sum of
+adjacent pixels, reshaped without copy) and, for the band signals, one dot product per ROI with the precomputed pixel
+widths: the integral of the spectrum over the band.
+
+Binned axes are the mean wavelengths of the binned pixels. Integer (raw) spectra are binned into uint32 so that the
+sums cannot overflow.
+"""
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+
+spectral_roi_params = [
+    {'title': 'Spectral ROIs', 'name': 'spectral', 'type': 'group', 'children': [
+        {'title': 'ROIs (nm):', 'name': 'rois', 'type': 'str', 'value': '',
+         'tip': 'Comma separated ranges, for instance 500-550, 700-720. Empty for the full spectrum'},
+        {'title': 'Binning (pxls):', 'name': 'binning', 'type': 'int', 'value': 1, 'min': 1},
+        {'title': 'Spectra:', 'name': 'spectra', 'type': 'list', 'value': 'full', 'limits': ['full', 'rois', 'none'],
+         'tip': 'Emit the full spectrum, one spectrum per ROI or no spectrum at all'},
+        {'title': 'Band signals:', 'name': 'bands', 'type': 'bool', 'value': False,
+         'tip': 'Emit the integral of the spectrum over each ROI as Data0D'},
+    ]}]
+
+
+def parse_rois(text: str) -> List[Tuple[float, float]]:
+    """ Parse "500-550, 700-720" into [(500., 550.), (700., 720.)]"""
+    rois = []
+    for item in text.replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            start, stop = (float(value) for value in item.rsplit('-', 1))
+        except ValueError:
+            raise ValueError(f'Invalid spectral ROI "{item}", expected a range like 500-550')
+        rois.append((min(start, stop), max(start, stop)))
+    return rois
+
+
+@dataclass
+class SpectralROI:
+    start: float  # nm
+    stop: float
+    pixels: slice
+    axis: np.ndarray  # binned wavelengths
+    widths: np.ndarray  # pixel widths (nm) for the band integral
+
+    @property
+    def label(self) -> str:
+        return f'{self.start:g}-{self.stop:g} nm'
+
+
+class SpectralROIs:
+    """ Map ROIs in nm to pixel slices of a wavelength axis and extract them from spectra (see module docstring)
+
+    Parameters
+    ----------
+    wavelengths: ndarray
+        wavelength (nm) of each pixel, increasing or decreasing
+    """
+
+    def __init__(self, wavelengths: np.ndarray):
+        self.wavelengths = np.asarray(wavelengths, dtype=np.float64)
+        self._widths = np.abs(np.gradient(self.wavelengths))
+        self.binning = 1
+        self.rois: List[SpectralROI] = []
+        self.full_axis = self.wavelengths
+
+    def _pixels(self, start: float, stop: float) -> slice:
+        increasing = self.wavelengths[-1] >= self.wavelengths[0]
+        wavelengths = self.wavelengths if increasing else self.wavelengths[::-1]
+        first = int(np.searchsorted(wavelengths, start, side='left'))
+        last = int(np.searchsorted(wavelengths, stop, side='right'))
+        if not increasing:
+            first, last = len(wavelengths) - last, len(wavelengths) - first
+        return slice(first, last)
+
+    def set_rois(self, rois: List[Tuple[float, float]], binning: int = 1):
+        """ Map the ROIs (in nm) to pixel slices, ROIs outside of the wavelength range being discarded"""
+        self.binning = max(int(binning), 1)
+        self.full_axis = self.bin(self.wavelengths, mean=True)
+        self.rois = []
+        for start, stop in rois:
+            pixels = self._pixels(start, stop)
+            if pixels.stop - pixels.start < 1:
+                continue
+            self.rois.append(SpectralROI(start, stop, pixels,
+                                         axis=self.bin(self.wavelengths[pixels], mean=True),
+                                         widths=self._widths[pixels]))
+
+    def bin(self, spectrum: np.ndarray, mean: bool = False) -> np.ndarray:
+        """ Sum (or average) groups of binning adjacent pixels along the last axis, the remainder being dropped"""
+        if self.binning == 1:
+            return spectrum
+        n_bins = spectrum.shape[-1] // self.binning
+        binned = spectrum[..., :n_bins * self.binning].reshape(spectrum.shape[:-1] + (n_bins, self.binning))
+        if mean:
+            return binned.mean(axis=-1)
+        dtype = np.uint32 if np.issubdtype(spectrum.dtype, np.integer) else None
+        return binned.sum(axis=-1, dtype=dtype)
+
+    def spectra(self, spectrum: np.ndarray) -> List[np.ndarray]:
+        """ Binned spectrum of each ROI"""
+        return [self.bin(spectrum[..., roi.pixels]) for roi in self.rois]
+
+    def bands(self, spectrum: np.ndarray) -> np.ndarray:
+        """ Integral of the spectrum over each ROI, in signal x nm"""
+        return np.array([spectrum[..., roi.pixels] @ roi.widths for roi in self.rois])